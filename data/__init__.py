@@ -1,18 +1,22 @@
 #!/usr/bin/env python
 
+import hashlib
+import os
 import re
-from typing import List
-
-from netCDF4 import Dataset
+from typing import List, Tuple
 
+from data.dataset_pool import dataset_pool
+from data.dimension_cache import (get_model_type, get_variable_dimensions,
+                                  is_sqlite_database)
 from data.fvcom import Fvcom
 from data.mercator import Mercator
 from data.nemo import Nemo
 from data.sqlite_database import SQLiteDatabase
-from data.utils import find_le, roll_time, get_data_vars_from_equation
+from data.utils import roll_time, get_data_vars_from_equation
 
 # We cannot cache by URL anymore since with the sqlite approach it points to a database
 # and the original cache system wasn't aware which individual NC files were opened.
+# Open handles are instead pooled by the exact set of NC files (see data.dataset_pool).
 
 
 def open_dataset(dataset, **kwargs):
@@ -39,6 +43,13 @@ def open_dataset(dataset, **kwargs):
             in the dataset, and will perform a binary search to find the nearest timestamp
             that is less-than-or-equal-to the given starttime (and endtime).
         * meta_only {bool} -- 
+        * request_kind {str} -- Kind of request the dataset is opened for ("tile",
+            "area", "timeseries" or "subset"). Selects the chunking, parallel-open
+            and dask scheduler settings from the dataset's "open_profiles" config.
+
+    Returns:
+        The model object. Unless meta_only is set, it is leased from the
+        process-wide dataset pool and handed back to it on __exit__.
     """
 
     url = None
@@ -51,8 +62,8 @@ def open_dataset(dataset, **kwargs):
 
     if url is not None:
 
-        dimension_list = __get_dimensions(url)
-        if not dimension_list:
+        model_type = get_model_type(url)
+        if model_type is None:
             raise RuntimeError("Dataset not supported: " + url)
 
         args = {}
@@ -62,32 +73,71 @@ def open_dataset(dataset, **kwargs):
             args['dataset_key'] = dataset.key
 
         if not args['meta_only']:
-            if __is_sqlite_database(url):
+            if is_sqlite_database(url):
                 __check_kwargs(**kwargs)
                 # Get required NC files from database and add to args
                 args['nc_files'] = __get_nc_file_list(url, dataset, **kwargs)
                 args['grid_angle_file_url'] = __get_grid_angle_file_url(dataset)
-
-        if __is_mercator(dimension_list):
-            return Mercator(url, **args)
-        elif __is_fvcom(dimension_list):
-            return Fvcom(url, **args)
+            if __is_datasetconfig_object(dataset):
+                args['open_profile'] = dataset.open_profile(
+                    kwargs.get('request_kind'))
+
+        if model_type == "mercator":
+            cls = Mercator
+        elif model_type == "fvcom":
+            cls = Fvcom
         else:
-            return Nemo(url, **args)
+            cls = Nemo
+
+        if args['meta_only']:
+            return cls(url, **args)
+
+        return dataset_pool.lease(cls, url, **args)
 
     raise ValueError("Dataset url is None.")
 
 
-def __is_datasetconfig_object(obj: object) -> bool:
-    return hasattr(obj, "url")
+def get_index_signature(dataset, variable, timestamp: int) -> Tuple[int, str]:
+    """
+    Resolves a requested timestamp (e.g. -1 for the latest one) the way
+    open_dataset does, and identifies the netCDF files it would read for it.
 
+    Params:
+        * dataset -- Either a string URL for the dataset, or a DatasetConfig object
+        * variable {str or list} -- Variable key(s), as for open_dataset.
+        * timestamp {int} -- Raw timestamp, or negative index into the
+            variable's timestamps.
+
+    Returns:
+        Tuple[int, str] -- The resolved timestamp, and a digest of the files
+        the dataset's SQLite index maps to it (paths, sizes and modification
+        times). The digest changes when the index gains or replaces files
+        for that timestamp. Datasets without an index aren't resolved and
+        have no digest (None).
+    """
+
+    url = dataset.url if __is_datasetconfig_object(dataset) else dataset
+    if url is None or not is_sqlite_database(url):
+        return timestamp, None
 
-def __is_aggregated_or_raw_netcdf(url: str) -> bool:
-    return url.startswith("http") or url.endswith(".nc")
+    timestamps, files = __resolve_nc_files(url, dataset, variable=variable,
+                                           timestamp=timestamp)
 
+    digest = hashlib.sha1()
+    for f in sorted(files):
+        try:
+            st = os.stat(f)
+            stat = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            # Remote (e.g. OPeNDAP) files
+            stat = None
+        digest.update(repr((f, stat)).encode())
 
-def __is_sqlite_database(url: str) -> bool:
-    return url.endswith(".sqlite3")
+    return timestamps[0], digest.hexdigest()
+
+
+def __is_datasetconfig_object(obj: object) -> bool:
+    return hasattr(obj, "url")
 
 
 def __meta_only(**kwargs) -> bool:
@@ -104,6 +154,10 @@ def __check_kwargs(**kwargs):
 
 
 def __get_nc_file_list(url: str, datasetconfig, **kwargs) -> List[str]:
+    return __resolve_nc_files(url, datasetconfig, **kwargs)[1]
+
+
+def __resolve_nc_files(url: str, datasetconfig, **kwargs) -> Tuple[List[int], List[str]]:
 
     with SQLiteDatabase(url) as db:
 
@@ -111,12 +165,13 @@ def __get_nc_file_list(url: str, datasetconfig, **kwargs) -> List[str]:
         if not isinstance(variable, list):
             variable = [variable]
 
-        calculated_variables = datasetconfig.calculated_variables
+        calculated_variables = datasetconfig.calculated_variables \
+            if __is_datasetconfig_object(datasetconfig) else {}
         if variable[0] in calculated_variables:
             equation = calculated_variables[variable[0]]['equation']
             
             variable = get_data_vars_from_equation(
-                equation, [v.key for v in db.get_data_variables()])
+                equation, list(get_variable_dimensions(url).keys()))
 
         timestamp = __get_requested_timestamps(
             db, variable[0], kwargs['timestamp'], kwargs.get('endtime'), kwargs.get('nearest_timestamp', False))
@@ -124,7 +179,7 @@ def __get_nc_file_list(url: str, datasetconfig, **kwargs) -> List[str]:
         file_list = db.get_netcdf_files(
             timestamp, variable)
 
-        return file_list
+        return timestamp, file_list
 
 def __get_grid_angle_file_url(datasetconfig) -> str:
     return datasetconfig.grid_angle_file_url
@@ -135,14 +190,14 @@ def __get_requested_timestamps(db: SQLiteDatabase, variable: str, timestamp, end
     # to the same time units as the requested dataset. Otherwise
     # this won't work.
     if nearest_timestamp:
-        all_timestamps = db.get_timestamps(variable)
+        all_timestamps = db.get_timestamp_index(variable)
 
-        start = find_le(all_timestamps, timestamp)
+        start = all_timestamps.find_le(timestamp)
         if not endtime:
             return [start]
 
-        end = find_le(all_timestamps, endtime)
-        return db.get_timestamp_range(start, end, variable)
+        end = all_timestamps.find_le(endtime)
+        return all_timestamps.range(start, end)
 
     if timestamp > 0 and endtime is None:
         # We've received a specific timestamp (e.g. 21100345)
@@ -150,51 +205,22 @@ def __get_requested_timestamps(db: SQLiteDatabase, variable: str, timestamp, end
             return [timestamp]
         return timestamp
 
+    all_timestamps = db.get_timestamp_index(variable)
+
     if timestamp < 0 and endtime is None:
-        all_timestamps = db.get_timestamps(variable)
         return [all_timestamps[timestamp]]
 
     if timestamp > 0 and endtime > 0:
         # We've received a request for a time range
         # with specific timestamps given
-        return db.get_timestamp_range(
-            timestamp, endtime, variable)
+        return all_timestamps.range(timestamp, endtime)
 
     # Otherwise assume negative values are indices into timestamp list
-    all_timestamps = db.get_timestamps(variable)
     len_timestamps = len(all_timestamps)
     if timestamp < 0 and endtime > 0:
         idx = roll_time(timestamp, len_timestamps)
-        return db.get_timestamp_range(all_timestamps[idx], endtime, variable)
+        return all_timestamps.range(all_timestamps[idx], endtime)
 
     if timestamp > 0 and endtime < 0:
         idx = roll_time(endtime, len_timestamps)
-        return db.get_timestamp_range(timestamp, all_timestamps[idx], variable)
-
-
-def __is_mercator(dimension_list: list) -> bool:
-    return 'longitude' in dimension_list or 'latitude' in dimension_list
-
-
-def __is_fvcom(dimension_list: list) -> bool:
-    return 'siglay' in dimension_list
-
-
-def __get_dimensions(url: str) -> List[str]:
-
-    dimension_list = []
-
-    if __is_sqlite_database(url):
-
-        with SQLiteDatabase(url) as db:
-            dimension_list = db.get_all_dimensions()
-
-    elif __is_aggregated_or_raw_netcdf(url):
-        # Open dataset (can't use xarray here since it doesn't like FVCOM files)
-        ds = Dataset(url, 'r')
-
-        dimension_list = [dim for dim in ds.dimensions]
-
-        ds.close()
-
-    return dimension_list
+        return all_timestamps.range(timestamp, all_timestamps[idx])
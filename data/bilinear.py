@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+from typing import Tuple
+
+import numpy as np
+
+from data.grid_index import EARTH_RADIUS, GridIndex, _to_triples, mesh_key
+from data.resample_weights import (ResampleWeightCache, ResampleWeights,
+                                   resample_weight_cache)
+
+# Interpolation method (as in Data.interp) served by bilinear_weights.
+# "bilinear" is inverse-distance weighting of the nearest neighbours.
+EXACT_BILINEAR = "exact_bilinear"
+
+# (row, column) offsets of the corners of a cell from its first one, in the
+# order of the weights returned by _inverse_bilinear.
+CORNERS = ((0, 0), (0, 1), (1, 1), (1, 0))
+
+# Cell coordinates down to -EPSILON (or up to 1 + EPSILON) still count as
+# inside, so targets on a shared edge aren't lost to rounding.
+EPSILON = 1e-9
+
+
+def get_bilinear_weights(index: GridIndex, window: tuple, lat_out, lon_out,
+                         radius: float,
+                         cache: ResampleWeightCache = None) -> ResampleWeights:
+    """Returns bilinear_weights from (or adds them to) resample_weight_cache.
+    """
+
+    if cache is None:
+        cache = resample_weight_cache
+
+    key = (
+        index.key, tuple(int(w) for w in window),
+        mesh_key(np.asarray(lat_out), np.asarray(lon_out), unstructured=True),
+        EXACT_BILINEAR, float(radius),
+    )
+
+    return cache.lookup(key, lambda: bilinear_weights(
+        index, window, lat_out, lon_out, radius))
+
+
+def bilinear_weights(index: GridIndex, window: tuple, lat_out, lon_out,
+                     radius: float) -> ResampleWeights:
+    """Bilinear interpolation weights of targets on a structured grid.
+
+    Each target is placed in the grid cell that contains it: one of the four
+    cells around its nearest grid point, found with the grid's KD-tree (or
+    axes, see GridIndex). Its weights are those of the four corners of the
+    cell, computed in the gnomonic projection about the target so they
+    don't depend on the grid being regular in lat/lon (for grids that are,
+    they're computed in lat/lon).
+
+    Targets that aren't inside any of those cells (e.g. outside of the grid)
+    take the value of their nearest grid point if it is within radius, and
+    are masked otherwise.
+
+    Arguments:
+        * index {GridIndex} -- Index of a curvilinear or regular grid.
+        * window {tuple} -- (miny, maxy, minx, maxx) of the data the weights
+            are applied to, as [miny:maxy, minx:maxx].
+        * lat_out, lon_out -- Target coordinates.
+        * radius {float} -- Cut off distance in metres of the nearest point
+            fallback.
+
+    Returns:
+        ResampleWeights -- Weights over the window, with (y, x) axes.
+    """
+
+    miny, maxy, minx, maxx = window
+    ny, nx = index.shape
+
+    output_shape = np.shape(lat_out)
+    lat = np.ravel(np.asarray(lat_out, dtype=np.float64))
+    lon = np.ravel(np.asarray(lon_out, dtype=np.float64))
+
+    dist, (jn, ix) = index.nearest(lat, lon, 1)
+    if index.kind == GridIndex.REGULAR:
+        project, frame = _project_lonlat, (lat, lon)
+    else:
+        project, frame = _project, _frame(lat, lon)
+
+    rows = np.zeros((lat.size, 4), dtype=np.int64)
+    cols = np.zeros((lat.size, 4), dtype=np.int64)
+    weights = np.zeros((lat.size, 4))
+    found = np.zeros(lat.size, dtype=bool)
+
+    for dj in (-1, 0):
+        for di in (-1, 0):
+            # Targets whose cell at this offset exists, if they haven't been
+            # placed in one at a previous offset
+            todo = np.flatnonzero(~found & (jn + dj >= 0) & (jn + dj <= ny - 2) &
+                                  (ix + di >= 0) & (ix + di <= nx - 2))
+
+            j = (jn[todo] + dj)[:, np.newaxis] + np.array([c[0] for c in CORNERS])
+            i = (ix[todo] + di)[:, np.newaxis] + np.array([c[1] for c in CORNERS])
+            corners = project(tuple(f[todo] for f in frame),
+                              *index.coordinates((j, i)))
+
+            u, v = _inverse_bilinear(*[corners[:, c] for c in range(4)])
+            inside = (u >= -EPSILON) & (u <= 1 + EPSILON) & \
+                (v >= -EPSILON) & (v <= 1 + EPSILON)
+
+            u = np.clip(u[inside], 0, 1)
+            v = np.clip(v[inside], 0, 1)
+            todo = todo[inside]
+            weights[todo] = np.stack(
+                [(1 - u) * (1 - v), u * (1 - v), u * v, (1 - u) * v], axis=-1)
+            rows[todo] = j[inside]
+            cols[todo] = i[inside]
+            found[todo] = True
+
+    nearest = ~found & (dist * EARTH_RADIUS <= radius)
+    rows[nearest] = jn[nearest, np.newaxis]
+    cols[nearest] = ix[nearest, np.newaxis]
+    weights[nearest] = [1, 0, 0, 0]
+
+    valid_output = found | nearest
+    shape = (maxy - miny, maxx - minx)
+    rows = rows[valid_output] - miny
+    cols = cols[valid_output] - minx
+    weights = weights[valid_output]
+
+    # Corners outside of the window count as missing neighbours.
+    outside = (rows < 0) | (rows >= shape[0]) | (cols < 0) | (cols >= shape[1])
+    index_array = np.where(outside, np.prod(shape),
+                           rows * shape[1] + cols).astype(np.int64)
+    weights[outside] = 0
+
+    return ResampleWeights(shape, output_shape, np.ones(np.prod(shape), bool),
+                           valid_output, index_array, weights)
+
+
+def _frame(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, ...]:
+    # Unit vector of each target, and its local east and north directions
+    q = _to_triples(lat, lon)
+    lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+
+    east = np.stack([-np.sin(lon_rad), np.cos(lon_rad),
+                     np.zeros(lon_rad.shape)], axis=-1)
+    north = np.stack([-np.sin(lat_rad) * np.cos(lon_rad),
+                      -np.sin(lat_rad) * np.sin(lon_rad),
+                      np.cos(lat_rad)], axis=-1)
+
+    return q, east, north
+
+
+def _project(frame: tuple, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    # Gnomonic projection of points (targets, corners) about their target
+    q, east, north = frame
+    lat_rad = np.radians(np.asarray(lat, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lon, dtype=np.float64))
+    p = np.stack([np.cos(lat_rad) * np.cos(lon_rad),
+                  np.cos(lat_rad) * np.sin(lon_rad),
+                  np.sin(lat_rad)], axis=-1)
+
+    d = np.einsum('ijk,ik->ij', p, q)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Points 90 degrees or more away project to nowhere
+        d = np.where(d > 0, d, np.nan)
+        return np.stack([np.einsum('ijk,ik->ij', p, east) / d,
+                         np.einsum('ijk,ik->ij', p, north) / d], axis=-1)
+
+
+def _project_lonlat(frame: tuple, lat: np.ndarray,
+                    lon: np.ndarray) -> np.ndarray:
+    # Degrees east and north of their target
+    lat_t, lon_t = frame
+    dlon = np.mod(np.asarray(lon, dtype=np.float64) -
+                  lon_t[:, np.newaxis] + 180, 360) - 180
+
+    return np.stack([dlon, np.asarray(lat, dtype=np.float64) -
+                     lat_t[:, np.newaxis]], axis=-1)
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _inverse_bilinear(a, b, c, d) -> Tuple[np.ndarray, np.ndarray]:
+    """Finds (u, v) such that the origin is at
+    (1 - u)(1 - v) a + u (1 - v) b + u v c + (1 - u) v d.
+    """
+
+    e, f, g, h = b - a, d - a, a - b + c - d, -a
+
+    k2 = _cross(g, f)
+    k1 = _cross(e, f) + _cross(h, g)
+    k0 = _cross(h, e)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Roots of k2 v^2 + k1 v + k0, in the form that stays accurate as
+        # k2 goes to 0 (a parallelogram, where v = -k0 / k1).
+        w = np.sqrt(np.maximum(k1 * k1 - 4 * k0 * k2, 0))
+        q = -0.5 * (k1 + np.where(k1 < 0, -w, w))
+        roots = (k0 / q, q / k2)
+
+        u, v = np.full(a.shape[:-1], np.nan), np.full(a.shape[:-1], np.nan)
+        for r in roots:
+            ex, ey = e[..., 0] + g[..., 0] * r, e[..., 1] + g[..., 1] * r
+            ur = np.where(np.abs(ex) >= np.abs(ey),
+                          (h[..., 0] - f[..., 0] * r) / ex,
+                          (h[..., 1] - f[..., 1] * r) / ey)
+
+            ok = np.isnan(v) & (r >= -EPSILON) & (r <= 1 + EPSILON) & \
+                (ur >= -EPSILON) & (ur <= 1 + EPSILON)
+            u = np.where(ok, ur, u)
+            v = np.where(ok, r, v)
+
+    return u, v
@@ -2,8 +2,8 @@ import numpy as np
 import xarray as xr
 
 import data.calculated_parser.parser
+from data.dimension_cache import get_variable_dimensions
 from data.netcdf_data import NetCDFData
-from data.sqlite_database import SQLiteDatabase
 from data.variable import Variable
 from data.variable_list import VariableList
 
@@ -46,9 +46,14 @@ class CalculatedData(NetCDFData):
                               self).get_dataset_variable(key).attrs
 
             attrs = {**attrs, **self._calculated[key]}
-            return CalculatedArray(self._dataset,
-                                   self._calculated[key]['equation'], attrs, self.url, self._meta_only)
+            array = CalculatedArray(self._dataset,
+                                    self._calculated[key]['equation'], attrs, self.url, self._meta_only)
+            if not self._meta_only:
+                self._attach_grid_angles(array.input_variables)
+            return array
         else:
+            if key not in self._dataset.variables:
+                self._attach_grid_angles([key])
             return self._dataset.variables[key]
 
     @property
@@ -138,6 +143,11 @@ class CalculatedArray():
         
         return xr.DataArray(data)
 
+    @property
+    def input_variables(self) -> list:
+        """Names of the variables used in the expression."""
+        return list(self._parser.lexer.variables)
+
     @property
     def attrs(self):
         class AttrDict(dict):
@@ -171,17 +181,16 @@ class CalculatedArray():
     def __dims_meta_only(self):
         result = ()
 
-        with SQLiteDatabase(self._db_url) as db:
-            variables = db.get_data_variables()
+        variable_dims = get_variable_dimensions(self._db_url)
 
-            for v in self._parser.lexer.variables:
-                if v not in variables:
-                    continue
+        for v in self._parser.lexer.variables:
+            if v not in variable_dims:
+                continue
 
-                d = db.get_variable_dims(v)
+            d = variable_dims[v]
 
-                if len(d) > len(result):
-                    result = d
+            if len(d) > len(result):
+                result = d
 
         return result
 
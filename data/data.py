@@ -30,7 +30,12 @@ class Data(object, metaclass=abc.ABCMeta):
 
     @abc.abstractmethod
     def get_point(self, latitude, longitude, depth, time, variable,
-                  return_depth=False):
+                  return_depth=False, tile=None, dtype=None):
+        """tile is the (projection, z, x, y) of the map tile (or the
+        (projection, z, x, y, n) of the n x n tiles) the points are the pixels
+        of, if they are, and dtype that of the resampled values (see
+        get_area).
+        """
         pass
 
     @abc.abstractmethod
@@ -115,7 +120,16 @@ class Data(object, metaclass=abc.ABCMeta):
 
         return np.array([lat, lon]), distances, result.transpose(), depth
 
-    def get_area(self, area, depth, time, variable, interp, radius, neighbours, return_depth=False):
+    def get_area(self, area, depth, time, variable, interp, radius, neighbours,
+                 return_depth=False, tile=None, dtype=None):
+        """dtype (e.g. np.float32) is that of the returned values and of the
+        target coordinates. By default they're float64, whatever the dtype
+        of the data on disk.
+        """
+
+        if dtype is not None:
+            area = np.asarray(area, dtype=dtype)
+
         latitude = area[0, :].ravel()
         longitude = area[1, :].ravel()
 
@@ -123,16 +137,32 @@ class Data(object, metaclass=abc.ABCMeta):
         self.radius = radius
         self.neighbours = neighbours
 
+        # When area is a map tile, the grid window it reads is looked up
+        # rather than searched for (see data.tile_slice_index).
+        tile = tuple(tile) if tile is not None else None
+        dtype = np.dtype(dtype) if dtype is not None else None
+
         if return_depth:
             a, d = self.get_point(latitude, longitude, depth, time, variable,
-                                  return_depth=return_depth)
+                                  return_depth=return_depth, tile=tile,
+                                  dtype=dtype)
+            a = self.__as_dtype(a, dtype)
             return np.reshape(a, area.shape[1:]), np.reshape(d, area.shape[1:])
         else:
             a = self.get_point(latitude, longitude, depth, time, variable,
-                               return_depth=return_depth)
-                               
+                               return_depth=return_depth, tile=tile,
+                               dtype=dtype)
+            a = self.__as_dtype(a, dtype)
+
             return np.reshape(a, area.shape[1:])
 
+    @staticmethod
+    def __as_dtype(values, dtype):
+        # Datasets that don't resample in dtype are cast afterwards
+        if dtype is None or np.ma.asarray(values).dtype == dtype:
+            return values
+        return np.ma.asarray(values).astype(dtype)
+
     def get_timeseries_point(self, latitude, longitude, depth, starttime,
                              endtime, variable, return_depth=False):
         # Find all time indexes in between
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+from utils.config import get_app_config
+
+# Defaults used when the pool is accessed outside of a Flask app context
+# (e.g. from scripts or unit tests). Both can be overridden in oceannavigator.cfg.
+DEFAULT_MAX_HANDLES = 16
+DEFAULT_MAX_OPEN_FILES = 512
+
+
+class DatasetPool:
+    """
+    Process-wide pool of open model dataset handles (Nemo, Mercator, Fvcom).
+
+    Opening a dataset means running xr.open_mfdataset over the file list
+    resolved from the SQLite index. That is often more expensive than the
+    interpolation we do afterwards, so instead of closing the handle in
+    __exit__, it is returned here and handed out again to the next request
+    asking for the exact same set of files.
+
+    Handles are leased exclusively: a handle is either idle in the pool or
+    owned by exactly one caller. Idle handles are evicted in LRU order when
+    either the handle count or the number of open files goes over budget,
+    and are dropped when the modification time of one of their files changes.
+    """
+
+    def __init__(self, max_handles: int = None, max_open_files: int = None):
+        self._max_handles: int = max_handles
+        self._max_open_files: int = max_open_files
+        self._lock = threading.Lock()
+        # key -> list of idle handles, ordered from least to most recently used
+        self._idle: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    @property
+    def max_handles(self) -> int:
+        if self._max_handles is not None:
+            return self._max_handles
+        return get_app_config('DATASET_POOL_MAX_HANDLES', DEFAULT_MAX_HANDLES)
+
+    @property
+    def max_open_files(self) -> int:
+        if self._max_open_files is not None:
+            return self._max_open_files
+        return get_app_config('DATASET_POOL_MAX_OPEN_FILES', DEFAULT_MAX_OPEN_FILES)
+
+    def lease(self, cls, url: str, **kwargs):
+        """Returns a handle for the given dataset, reusing an idle one if
+        possible.
+
+        Arguments:
+            * cls {type} -- Model class to construct (Nemo, Mercator, Fvcom)
+            * url {str} -- Dataset url passed to the model class
+            * kwargs -- Keyword arguments passed to the model class
+
+        Returns:
+            The model object. The caller must use it as a context manager so
+            that it is returned to the pool on __exit__.
+        """
+
+        files = _get_files(url, kwargs.get('nc_files'))
+        key = (
+            cls.__name__,
+            url,
+            files,
+            kwargs.get('grid_angle_file_url'),
+            kwargs.get('dataset_key'),
+            # Handles opened with different chunking are not interchangeable.
+            json.dumps(kwargs.get('open_profile'), sort_keys=True)
+        )
+
+        with self._lock:
+            handles = self._idle.get(key)
+            while handles:
+                handle = handles.pop()
+                if not handles:
+                    del self._idle[key]
+                if handle._pool_mtimes == _get_mtimes(files):
+                    self.hits += 1
+                    return handle
+                # A file was replaced on disk since this handle was opened.
+                self.evictions += 1
+                handle.close()
+                handles = self._idle.get(key)
+            self.misses += 1
+
+        handle = cls(url, **kwargs)
+        handle._pool = self
+        handle._pool_key = key
+        handle._pool_mtimes = _get_mtimes(files)
+        handle._pool_open_files = len(files)
+
+        return handle
+
+    def release(self, handle) -> None:
+        """Returns a leased handle to the pool, then evicts idle handles
+        until the pool is back within its budgets.
+        """
+
+        with self._lock:
+            self._idle.setdefault(handle._pool_key, []).append(handle)
+            self._idle.move_to_end(handle._pool_key)
+
+            while self._idle and \
+                    (self.__count() > self.max_handles or
+                     self.__open_files() > self.max_open_files):
+                key, handles = next(iter(self._idle.items()))
+                handles.pop(0).close()
+                self.evictions += 1
+                if not handles:
+                    del self._idle[key]
+
+    def clear(self) -> None:
+        """Closes all idle handles."""
+
+        with self._lock:
+            for handles in self._idle.values():
+                for h in handles:
+                    h.close()
+            self._idle.clear()
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'handles': self.__count(),
+                'open_files': self.__open_files(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __count(self) -> int:
+        return sum(len(h) for h in self._idle.values())
+
+    def __open_files(self) -> int:
+        return sum(h._pool_open_files for handles in self._idle.values() for h in handles)
+
+
+def _get_files(url: str, nc_files: List[str]) -> Tuple[str]:
+    if nc_files:
+        return tuple(nc_files)
+    return (url, )
+
+
+def _get_mtimes(files: Tuple[str]) -> Tuple[float]:
+    # Remote (OPeNDAP) urls have no mtime; those handles are only
+    # dropped by LRU eviction.
+    return tuple(
+        os.path.getmtime(f) if os.path.isfile(f) else None for f in files
+    )
+
+
+# The pool shared by all requests handled by this worker process.
+dataset_pool = DatasetPool()
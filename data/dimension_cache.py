@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os
+import threading
+from typing import Dict, List
+
+from cachetools import TTLCache
+from netCDF4 import Dataset
+
+from data.sqlite_database import SQLiteDatabase
+
+# Entries are keyed by (url, mtime) so a re-indexed database or a replaced
+# netCDF file is picked up right away. Remote (OPeNDAP) urls have no mtime,
+# so the TTL is what eventually refreshes them.
+_cache: TTLCache = TTLCache(maxsize=256, ttl=3600)
+_lock = threading.Lock()
+
+
+def is_sqlite_database(url: str) -> bool:
+    return url.endswith(".sqlite3")
+
+
+def is_aggregated_or_raw_netcdf(url: str) -> bool:
+    return url.startswith("http") or url.endswith(".nc")
+
+
+def get_dimensions(url: str) -> List[str]:
+    """Returns the names of all dimensions in a dataset.
+
+    Arguments:
+        * url {str} -- Path to a sqlite3 database, netCDF file or OPeNDAP url.
+
+    Returns:
+        List[str] -- Dimension names (e.g. time_counter, depth, x, latitude, etc.)
+    """
+
+    return __cached(url, 'dimensions', __probe_dimensions)
+
+
+def get_model_type(url: str) -> str:
+    """Classifies a dataset from its dimensions.
+
+    Arguments:
+        * url {str} -- Path to a sqlite3 database, netCDF file or OPeNDAP url.
+
+    Returns:
+        str -- One of "mercator", "fvcom" or "nemo". None if the dataset has no
+        dimensions (i.e. it is not supported).
+    """
+
+    def classify(url: str) -> str:
+        dimension_list = get_dimensions(url)
+        if not dimension_list:
+            return None
+        if 'longitude' in dimension_list or 'latitude' in dimension_list:
+            return "mercator"
+        if 'siglay' in dimension_list:
+            return "fvcom"
+        return "nemo"
+
+    return __cached(url, 'model_type', classify)
+
+
+def get_variable_dimensions(url: str) -> Dict[str, List[str]]:
+    """Returns the dimensions of every data variable in a sqlite3 database.
+
+    Arguments:
+        * url {str} -- Path to a sqlite3 database.
+
+    Returns:
+        Dict[str, List[str]] -- Maps each data variable key (e.g. votemper) to
+        its list of dimension names.
+    """
+
+    def probe(url: str) -> Dict[str, List[str]]:
+        with SQLiteDatabase(url) as db:
+            return {v.key: v.dimensions for v in db.get_data_variables()}
+
+    return __cached(url, 'variable_dimensions', probe)
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def __cached(url: str, kind: str, func):
+    key = (url, kind, __get_mtime(url))
+
+    with _lock:
+        result = _cache.get(key)
+    if result is not None:
+        return result
+
+    result = func(url)
+
+    with _lock:
+        _cache[key] = result
+
+    return result
+
+
+def __get_mtime(url: str) -> float:
+    if os.path.isfile(url):
+        return os.path.getmtime(url)
+    return None
+
+
+def __probe_dimensions(url: str) -> List[str]:
+    dimension_list = []
+
+    if is_sqlite_database(url):
+
+        with SQLiteDatabase(url) as db:
+            dimension_list = db.get_all_dimensions()
+
+    elif is_aggregated_or_raw_netcdf(url):
+        # Open dataset (can't use xarray here since it doesn't like FVCOM files)
+        with Dataset(url, 'r') as ds:
+            dimension_list = [dim for dim in ds.dimensions]
+
+    return dimension_list
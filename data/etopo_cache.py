@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+import hashlib
+import os
+import threading
+from typing import Tuple
+
+import numpy as np
+from cachetools import LRUCache
+from netCDF4 import Dataset
+from scipy.ndimage import gaussian_filter
+
+from data.grid_index import load_array, save_array
+from utils.config import get_app_config
+
+# Used when the cache is accessed outside of a Flask app context (e.g. from
+# scripts or unit tests). Can be overridden in oceannavigator.cfg.
+DEFAULT_CACHE_DIR = "/tmp/oceannavigator/etopo"
+DEFAULT_ETOPO_FILE = "/data/misc/etopo_%s_z%d.nc"
+DEFAULT_MAX_RASTERS = 16
+
+TILE_SIZE = 256
+
+# Variants of a raster: as in the ETOPO file, and smoothed tile by tile as
+# plotting.tile.plot masks land with.
+RAW = 0
+BLURRED = 1
+BLUR_SIGMA = 0.5
+
+
+class EtopoCache:
+    """
+    Memory-mapped copies of the per-zoom ETOPO rasters used to draw and mask
+    map tiles (ETOPO_FILE % (projection, z)).
+
+    Each raster is converted once, the first time it's used, to .npy files
+    in the cache dir that every worker process maps:
+
+        * the raster, so a tile's window is a slice rather than a netCDF read
+        * the raster smoothed tile by tile (BLURRED), the land mask of data
+          tiles
+        * the min and max of every tile of both, from which whether a tile is
+          all land or all ocean at any depth is a lookup
+
+    The files are named after a hash of the source file's path, size and
+    modification time, so replacing an ETOPO file converts it again.
+    """
+
+    def __init__(self, cache_dir: str = None, etopo_file: str = None,
+                 max_rasters: int = DEFAULT_MAX_RASTERS):
+        self._cache_dir: str = cache_dir
+        self._etopo_file: str = etopo_file
+        self._lock = threading.Lock()
+        # (source, size, mtime) -> (raw, blurred, ranges)
+        self._rasters: LRUCache = LRUCache(maxsize=max_rasters)
+        self.conversions: int = 0  # rasters converted from their ETOPO file
+        self.disk_hits: int = 0  # rasters memory-mapped from the cache dir
+        self.hits: int = 0  # rasters found in memory
+
+    @property
+    def cache_dir(self) -> str:
+        if self._cache_dir is not None:
+            return self._cache_dir
+        return get_app_config('ETOPO_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+    @property
+    def etopo_file(self) -> str:
+        if self._etopo_file is not None:
+            return self._etopo_file
+        return get_app_config('ETOPO_FILE', DEFAULT_ETOPO_FILE)
+
+    def raster(self, projection: str, z: int, variant: int = RAW) -> np.ndarray:
+        """Returns the (read-only, memory-mapped) ETOPO raster of a zoom."""
+
+        return self.__get(projection, z)[variant]
+
+    def window(self, projection: str, z: int, x: int, y: int, n: int = 1,
+               variant: int = RAW) -> np.ndarray:
+        """Returns the part of a raster under the n x n tiles from tile (x, y),
+        as a view of the memory-mapped raster ([y, x] pixels).
+        """
+
+        return self.raster(projection, z, variant)[
+            TILE_SIZE * y:TILE_SIZE * (y + n),
+            TILE_SIZE * x:TILE_SIZE * (x + n)
+        ]
+
+    def tile_range(self, projection: str, z: int, x: int, y: int, n: int = 1,
+                   variant: int = RAW) -> Tuple[float, float]:
+        """Returns the min and max elevation under the n x n tiles from
+        tile (x, y).
+        """
+
+        ranges = self.__get(projection, z)[2][variant, :, y:y + n, x:x + n]
+
+        return float(ranges[0].min()), float(ranges[1].max())
+
+    def is_land(self, projection: str, z: int, x: int, y: int, depth: float,
+                n: int = 1, variant: int = BLURRED) -> bool:
+        """True if every pixel of the tiles is above depth (metres, positive
+        down), i.e. masked out of data tiles at that depth.
+        """
+
+        return self.tile_range(projection, z, x, y, n, variant)[0] > -depth
+
+    def is_ocean(self, projection: str, z: int, x: int, y: int, depth: float,
+                 n: int = 1, variant: int = BLURRED) -> bool:
+        """True if no pixel of the tiles is above depth (see is_land)."""
+
+        return self.tile_range(projection, z, x, y, n, variant)[1] <= -depth
+
+    def clear(self) -> None:
+        """Drops the in-process maps (the converted files are kept)."""
+
+        with self._lock:
+            self._rasters.clear()
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rasters': len(self._rasters),
+                'conversions': self.conversions,
+                'disk_hits': self.disk_hits,
+                'hits': self.hits,
+            }
+
+    def __get(self, projection: str, z: int) -> tuple:
+        source = self.etopo_file % (projection, z)
+        st = os.stat(source)
+        key = (source, st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            entry = self._rasters.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+        h = hashlib.blake2b(repr(key).encode(), digest_size=8)
+        prefix = os.path.join(self.cache_dir, "%s_z%d_%s" % (
+            projection.replace(':', '_'), z, h.hexdigest()))
+        paths = [prefix + suffix for suffix in
+                 ("_raw.npy", "_blurred.npy", "_ranges.npy")]
+
+        entry = tuple(load_array(path) for path in paths)
+        if any(a is None for a in entry):
+            entry = _convert(source, paths)
+            converted = True
+        else:
+            converted = False
+
+        with self._lock:
+            if converted:
+                self.conversions += 1
+            else:
+                self.disk_hits += 1
+            self._rasters[key] = entry
+
+        return entry
+
+
+def _convert(source: str, paths: list) -> tuple:
+    # Converts an ETOPO file a row of tiles at a time, so the raster (e.g.
+    # 32768x32768 at z=7) is never held in memory at once.
+    raw_path, blurred_path, ranges_path = paths
+    os.makedirs(os.path.dirname(raw_path), exist_ok=True)
+
+    with Dataset(source, 'r') as dataset:
+        variable = dataset["z"]
+        rows, cols = variable.shape
+        # As read, i.e. after any scale_factor/add_offset
+        dtype = variable[0:1, 0:1].dtype
+        tiles = (-(-rows // TILE_SIZE), -(-cols // TILE_SIZE))
+        ranges = np.empty((2, 2) + tiles)
+
+        tmp_paths = ["%s.%d.tmp" % (path, os.getpid())
+                     for path in (raw_path, blurred_path)]
+        raw, blurred = [
+            np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                      shape=(rows, cols))
+            for path in tmp_paths
+        ]
+
+        try:
+            for j in range(tiles[0]):
+                block = np.s_[TILE_SIZE * j:TILE_SIZE * (j + 1)]
+                raw[block] = np.ma.getdata(variable[block, :])
+
+                for i in range(tiles[1]):
+                    tile = np.s_[TILE_SIZE * j:TILE_SIZE * (j + 1),
+                                 TILE_SIZE * i:TILE_SIZE * (i + 1)]
+                    blurred[tile] = gaussian_filter(raw[tile], BLUR_SIGMA)
+
+                    for variant, array in ((RAW, raw), (BLURRED, blurred)):
+                        ranges[variant, 0, j, i] = array[tile].min()
+                        ranges[variant, 1, j, i] = array[tile].max()
+
+            for array in (raw, blurred):
+                array.flush()
+            del raw, blurred
+
+            # Atomic, so other workers never map a partially written file.
+            for tmp_path, path in zip(tmp_paths, (raw_path, blurred_path)):
+                os.replace(tmp_path, path)
+        finally:
+            for tmp_path in tmp_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    # Written last: its presence means the rasters are complete.
+    save_array(ranges_path, ranges)
+
+    return load_array(raw_path), load_array(blurred_path), ranges
+
+
+# The cache shared by all requests handled by this worker process.
+etopo_cache = EtopoCache()
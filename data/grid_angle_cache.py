@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import os
+import threading
+from typing import Dict, List
+
+import numpy as np
+import xarray as xr
+from cachetools import LRUCache
+
+# Grid angle files hold a couple of 2D fields (e.g. sin_alpha, cos_alpha) per
+# model grid, so a handful of entries covers every dataset we serve. Entries
+# are keyed by mtime so a replaced file is picked up on the next request.
+_cache: LRUCache = LRUCache(maxsize=16)
+_lock = threading.Lock()
+
+
+def get_grid_angles(url: str, drop_variables: List[str] = None) -> Dict[str, xr.Variable]:
+    """Returns the fields of a grid angle file, loaded once per process.
+
+    Arguments:
+        * url {str} -- Path to the grid angle netCDF file.
+        * drop_variables {list} -- Variables not to load (e.g. the lat/lon
+            variables, which the model files already have).
+
+    Returns:
+        Dict[str, xr.Variable] -- Maps each field name to a variable backed by
+        a read-only numpy array shared by every caller.
+    """
+
+    drop_variables = tuple(drop_variables or ())
+    key = (url, drop_variables, __get_mtime(url))
+
+    with _lock:
+        arrays = _cache.get(key)
+
+    if arrays is None:
+        arrays = __load(url, drop_variables)
+        with _lock:
+            _cache[key] = arrays
+
+    return {
+        name: xr.Variable(dims, values, attrs)
+        for name, (dims, values, attrs) in arrays.items()
+    }
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def __load(url: str, drop_variables: tuple) -> dict:
+    arrays = {}
+
+    with xr.open_dataset(url, drop_variables=list(drop_variables),
+                         decode_times=False) as ds:
+        for name, var in ds.data_vars.items():
+            values = np.array(var.values)
+            values.setflags(write=False)  # Make immutable
+            arrays[name] = (var.dims, values, dict(var.attrs))
+
+    return arrays
+
+
+def __get_mtime(url: str) -> float:
+    if os.path.isfile(url):
+        return os.path.getmtime(url)
+    return None
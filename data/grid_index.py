@@ -0,0 +1,611 @@
+#!/usr/bin/env python
+
+import hashlib
+import os
+import threading
+from math import pi
+from typing import List, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+from pykdtree.kdtree import KDTree
+
+from data.tile_slice_index import tile_slice_index
+from utils.compute_resources import compute_resources
+from utils.config import get_app_config
+
+# Used when the cache is accessed outside of a Flask app context (e.g. from
+# scripts or unit tests). Can be overridden in oceannavigator.cfg.
+DEFAULT_CACHE_DIR = "/tmp/oceannavigator/grid_index"
+DEFAULT_MAX_TREES = 8
+
+RAD_FACTOR = pi / 180.0
+EARTH_RADIUS = 6378137.0
+
+# Targets bounding_box searches at a time, so that the n neighbours of every
+# point of a large area (e.g. 500x500 for a map) are never held at once.
+BOUNDING_BOX_BLOCK = 16384
+
+
+class GridIndexCache:
+    """
+    KD-trees over model meshes, keyed by a hash of the lat/lon values.
+
+    Building a tree means computing cos/sin triples for every grid point
+    (millions on GIOPS/RIOPS) and then the tree itself. The triples are
+    written once to <cache dir>/<hash>.npy and memory-mapped by every worker
+    process afterwards, so each process only pays for the tree build, and
+    only the first time it sees a mesh: trees are kept in an in-process LRU.
+    """
+
+    def __init__(self, cache_dir: str = None, max_trees: int = DEFAULT_MAX_TREES):
+        self._cache_dir: str = cache_dir
+        self._lock = threading.Lock()
+        # hash -> (KDTree, grid shape)
+        self._trees: LRUCache = LRUCache(maxsize=max_trees)
+        self.builds: int = 0  # triples computed from scratch
+        self.disk_hits: int = 0  # triples memory-mapped from the cache dir
+        self.hits: int = 0  # tree found in memory
+
+    @property
+    def cache_dir(self) -> str:
+        if self._cache_dir is not None:
+            return self._cache_dir
+        return get_app_config('GRID_INDEX_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+    def get(self, lat: np.ndarray, lon: np.ndarray, unstructured: bool = False,
+            key: str = None) -> Tuple[KDTree, tuple]:
+        """Returns the KD-tree over a lat/lon mesh.
+
+        Arguments:
+            * lat {np.ndarray} -- Latitudes (2D, or 1D for regular grids).
+            * lon {np.ndarray} -- Longitudes (same shape as lat, or 1D).
+            * unstructured {bool} -- lat and lon are 1D node (or element)
+                coordinates rather than the axes of a regular grid.
+            * key {str} -- Hash of the mesh, if the caller already has it
+                (see mesh_key).
+
+        Returns:
+            Tuple[KDTree, tuple] -- The tree, whose point indices are the
+            raveled indices into an array of the returned shape.
+        """
+
+        lat = np.asarray(lat)
+        lon = np.asarray(lon)
+        regular = lat.ndim == 1 and not unstructured
+        shape = (lat.size, lon.size) if regular else lat.shape
+        if key is None:
+            key = mesh_key(lat, lon, unstructured)
+
+        with self._lock:
+            entry = self._trees.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+        triples = self.__load_triples(key)
+        if triples is None:
+            triples = _compute_triples(lat, lon, regular)
+            self.__save_triples(key, triples)
+            built = True
+        else:
+            built = False
+
+        entry = (KDTree(triples), shape)
+
+        with self._lock:
+            if built:
+                self.builds += 1
+            else:
+                self.disk_hits += 1
+            self._trees[key] = entry
+
+        return entry
+
+    def clear(self) -> None:
+        """Drops the in-process trees (the on-disk triples are kept)."""
+
+        with self._lock:
+            self._trees.clear()
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'trees': len(self._trees),
+                'builds': self.builds,
+                'disk_hits': self.disk_hits,
+                'hits': self.hits,
+            }
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def __load_triples(self, key: str) -> np.ndarray:
+        triples = load_array(self.__path(key))
+
+        if triples is None or triples.ndim != 2 or triples.shape[1] != 3:
+            return None
+        return triples
+
+    def __save_triples(self, key: str, triples: np.ndarray) -> None:
+        save_array(self.__path(key), triples)
+
+
+def load_array(path: str) -> np.ndarray:
+    """Memory-maps an array written by save_array, or returns None."""
+
+    try:
+        return np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+def save_array(path: str, array: np.ndarray) -> None:
+    """Writes an array to a .npy file that other processes can map."""
+
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        # Atomic, so other workers never map a partially written file.
+        os.replace(tmp_path, path)
+    except OSError:
+        # The cache is an optimization; carry on without it.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def mesh_key(lat: np.ndarray, lon: np.ndarray, unstructured: bool = False) -> str:
+    """Hashes the coordinates of a grid (as passed to GridIndexCache.get)."""
+
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
+    regular = lat.ndim == 1 and not unstructured
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(b'regular' if regular else b'points')
+    for a in (lat, lon):
+        h.update(str((a.shape, a.dtype.str)).encode())
+        h.update(np.ascontiguousarray(a).data)
+    return h.hexdigest()
+
+
+def _to_triples(lat, lon) -> np.ndarray:
+    lat_rad = lat * RAD_FACTOR
+    lon_rad = lon * RAD_FACTOR
+    clat, clon = np.cos(lat_rad), np.cos(lon_rad)
+    slat, slon = np.sin(lat_rad), np.sin(lon_rad)
+
+    return np.array([clat * clon, clat * slon, slat]).transpose()
+
+
+def _compute_triples(lat: np.ndarray, lon: np.ndarray, regular: bool) -> np.ndarray:
+    latvals = lat * RAD_FACTOR
+    lonvals = lon * RAD_FACTOR
+
+    clat, clon = np.cos(latvals), np.cos(lonvals)
+    slat, slon = np.sin(latvals), np.sin(lonvals)
+    if regular:
+        # Latitude and longitude are separate axes, so every (lat, lon) pair
+        # is a grid point.
+        shape = (slat.size, slon.size)
+        clat = clat[:, np.newaxis]
+        slat = np.broadcast_to(slat[:, np.newaxis], shape)
+
+    return np.ascontiguousarray(np.array([
+        np.ravel(clat * clon), np.ravel(clat * slon), np.ravel(slat)
+    ]).transpose())
+
+
+def _pad_limits(indices: np.ndarray, limit: int, padding: int = None) -> Tuple[int, int]:
+    mx = np.amax(indices)
+    mn = np.amin(indices)
+
+    if padding is None:
+        # Pad by a quarter of the extent, and at least 2 cells.
+        d = mx - mn
+        if d < 2:
+            mn -= 2
+            mx += 2
+
+        mn = int(mn - d / 4.0)
+        mx = int(mx + d / 4.0)
+    else:
+        mn -= padding
+        mx += padding
+
+    return np.clip(mn, 0, limit), np.clip(mx, 0, limit)
+
+
+# The cache shared by all requests handled by this worker process.
+grid_index_cache = GridIndexCache()
+
+
+class _RegularAxes:
+    """
+    Exact nearest-point search on a regular grid, by bisecting its 1D axes
+    instead of building a KD-tree over every (lat, lon) pair.
+
+    For each target, the distances to a small window of rows and columns
+    around its bisection point are computed (with the same arithmetic as the
+    KD-tree, so results are identical), and the window is widened until no
+    grid point outside it can be closer than the n-th nearest inside it.
+    Columns are searched circularly in [0, 360) so grids crossing the
+    antimeridian or the 0/360 seam need no special casing.
+
+    Targets whose window grows past MAX_WINDOW points (far outside a regional
+    grid, or right by a pole) are handed to the KD-tree, which is only built
+    if that ever happens.
+    """
+
+    # Targets are processed in blocks to bound the size of the distance arrays
+    BLOCK_SIZE = 4096
+    MAX_WINDOW = 1024
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cache: GridIndexCache):
+        self._mesh = (lat, lon)
+        self._cache: GridIndexCache = cache
+
+        latvals = lat * RAD_FACTOR
+        lonvals = lon * RAD_FACTOR
+        self.dtype = np.result_type(latvals, lonvals)
+
+        self.lat_order = np.argsort(lat, kind='mergesort')
+        self.lon_order = np.argsort(np.mod(lon, 360), kind='mergesort')
+
+        # Sorted axes (radians) to bisect, and the same sin/cos values the
+        # KD-tree triples are made of, in sorted order.
+        self._lat = np.radians(lat.astype(np.float64))[self.lat_order]
+        self._lon = np.radians(np.mod(lon.astype(np.float64), 360))[self.lon_order]
+        self._clat = np.cos(latvals)[self.lat_order]
+        self._slat = np.sin(latvals)[self.lat_order]
+        self._clon = np.cos(lonvals)[self.lon_order]
+        self._slon = np.sin(lonvals)[self.lon_order]
+
+    @staticmethod
+    def supports(lat: np.ndarray, lon: np.ndarray) -> bool:
+        """Checks for a strictly monotonic latitude axis and longitudes that
+        are distinct modulo 360.
+        """
+
+        if lat.ndim != 1 or lon.ndim != 1 or lat.size < 2 or lon.size < 2:
+            return False
+
+        dlat = np.diff(lat)
+        if not (np.all(dlat > 0) or np.all(dlat < 0)):
+            return False
+
+        return np.unique(np.mod(lon, 360)).size == lon.size
+
+    def query(self, lat: np.ndarray, lon: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        q = np.float32(_to_triples(lat, lon))
+        lat = np.radians(lat.astype(np.float64))
+        lon = np.radians(np.mod(lon.astype(np.float64), 360))
+
+        dist = np.empty((lat.size, n), dtype=self.dtype)
+        iy = np.empty((lat.size, n), dtype=np.intp)
+        ix = np.empty((lat.size, n), dtype=np.intp)
+        for start in range(0, lat.size, _RegularAxes.BLOCK_SIZE):
+            block = slice(start, start + _RegularAxes.BLOCK_SIZE)
+            dist[block], iy[block], ix[block] = \
+                self.__query_block(q[block], lat[block], lon[block], n)
+
+        return dist, iy, ix
+
+    def __query_block(self, q, lat, lon, n):
+        rows = np.searchsorted(self._lat, lat)
+        cols = np.searchsorted(self._lon, lon)
+        q_grid = q.astype(self.dtype)
+
+        dist = np.empty((lat.size, n), dtype=self.dtype)
+        iy = np.empty((lat.size, n), dtype=np.intp)
+        ix = np.empty((lat.size, n), dtype=np.intp)
+
+        # Start with a small window around the bisection point, then widen it
+        # along whichever axis could still hide a closer point.
+        half = np.full(lat.size, int(np.ceil(np.sqrt(n) / 2)) + 1)
+        half_rows, half_cols = half, half.copy()
+        todo = np.arange(lat.size)
+        while todo.size:
+            # Targets sharing a window size are searched together
+            todo_rows, todo_cols = half_rows[todo], half_cols[todo]
+            for hr, hc in set(zip(todo_rows, todo_cols)):
+                group = todo[(todo_rows == hr) & (todo_cols == hc)]
+                d, y, x, rows_ok, cols_ok = self.__search(
+                    q_grid[group], lat[group], lon[group], rows[group],
+                    cols[group], n, hr, hc)
+
+                found = rows_ok & cols_ok
+                dist[group[found]], iy[group[found]], ix[group[found]] = \
+                    d[found], y[found], x[found]
+                half_rows[group[~rows_ok]] *= 2
+                half_cols[group[~cols_ok]] *= 2
+                half_rows[group[found]] = 0  # done
+
+            todo = todo[half_rows[todo] > 0]
+
+            too_wide = 4 * half_rows[todo] * half_cols[todo] > _RegularAxes.MAX_WINDOW
+            if np.any(too_wide):
+                fallback = todo[too_wide]
+                kdt, shape = self._cache.get(*self._mesh)
+                with compute_resources.openmp_limits():
+                    d, index = kdt.query(q[fallback], k=n)
+                dist[fallback] = d.reshape(-1, n)
+                iy[fallback], ix[fallback] = \
+                    (i.reshape(-1, n) for i in np.unravel_index(index, shape))
+                todo = todo[~too_wide]
+
+        return dist, iy, ix
+
+    def __search(self, q, lat, lon, rows, cols, n, half_rows, half_cols):
+        nlat, nlon = self._lat.size, self._lon.size
+
+        # Rows: [row - half, row + half), clipped to the grid
+        all_rows = half_rows >= nlat
+        r = rows[:, np.newaxis] + np.arange(-half_rows, half_rows)
+        r_valid = (r >= 0) & (r < nlat)
+        r = np.clip(r, 0, nlat - 1)
+
+        # Columns: [col - half, col + half), circular
+        all_cols = 2 * half_cols >= nlon
+        if all_cols:
+            c = np.broadcast_to(np.arange(nlon), (lat.size, nlon))
+        else:
+            c = np.mod(cols[:, np.newaxis] + np.arange(-half_cols, half_cols), nlon)
+
+        clat, slat = self._clat[r], self._slat[r]
+        clon, slon = self._clon[c], self._slon[c]
+
+        # Same arithmetic (and dtype) as the KD-tree triples and distances
+        d = (clat[:, :, np.newaxis] * clon[:, np.newaxis, :] - q[:, np.newaxis, np.newaxis, 0]) ** 2 + \
+            (clat[:, :, np.newaxis] * slon[:, np.newaxis, :] - q[:, np.newaxis, np.newaxis, 1]) ** 2 + \
+            (slat[:, :, np.newaxis] - q[:, np.newaxis, np.newaxis, 2]) ** 2
+        d[~r_valid] = np.inf
+        d = np.sqrt(d.reshape(lat.size, -1))
+
+        if n < d.shape[1]:
+            # Only the n nearest need sorting; ties keep the window order
+            order = np.sort(np.argpartition(d, n - 1, axis=1)[:, :n], axis=1)
+            order = np.take_along_axis(order, np.argsort(
+                np.take_along_axis(d, order, axis=1), axis=1, kind='mergesort'), axis=1)
+        else:
+            order = np.argsort(d, axis=1, kind='mergesort')
+        dist = np.take_along_axis(d, order, axis=1)
+        y = np.take_along_axis(r, order // c.shape[1], axis=1)
+        x = np.take_along_axis(c, order % c.shape[1], axis=1)
+
+        # The n-th distance, with a little slack for float32 rounding
+        furthest = dist[:, -1] * (1 + 1e-5)
+
+        # Lower bounds on the distance to any point outside the window: the
+        # latitude difference to the first row outside it, and the distance
+        # to the meridian of the first column outside it.
+        row_bound = np.full(lat.size, np.inf)
+        below, above = rows - half_rows - 1, rows + half_rows
+        has = below >= 0
+        row_bound[has] = lat[has] - self._lat[below[has]]
+        has = above < nlat
+        row_bound[has] = np.minimum(row_bound[has], self._lat[above[has]] - lat[has])
+        rows_ok = all_rows | (furthest < _chord(row_bound))
+
+        if all_cols:
+            cols_ok = np.ones(lat.size, dtype=bool)
+        else:
+            dlon = np.minimum(
+                _circular_distance(lon, self._lon[np.mod(cols - half_cols - 1, nlon)]),
+                _circular_distance(lon, self._lon[np.mod(cols + half_cols, nlon)])
+            )
+            col_bound = np.where(
+                dlon < pi / 2,
+                np.arcsin(np.clip(np.cos(lat) * np.sin(dlon), 0, 1)),
+                pi / 2 - np.abs(lat)
+            )
+            cols_ok = furthest < _chord(col_bound)
+
+        return dist, self.lat_order[y], self.lon_order[x], rows_ok, cols_ok
+
+
+def _chord(angle: np.ndarray) -> np.ndarray:
+    return 2 * np.sin(np.minimum(angle, pi) / 2)
+
+
+def _circular_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    d = np.abs(a - b) % (2 * pi)
+    return np.minimum(d, 2 * pi - d)
+
+
+class GridIndex:
+    """
+    Nearest-point, bounding-box and radius queries on a model grid.
+
+    Three kinds of grids are supported:
+        * curvilinear  -- 2D lat/lon (NEMO), indices are (y, x)
+        * regular      -- 1D latitude and longitude axes (Mercator), indices
+                          are (y, x)
+        * unstructured -- 1D node or element coordinates (FVCOM), indices
+                          are (i, )
+
+    The underlying KD-tree comes from grid_index_cache, so constructing an
+    index for a grid that has been seen before is cheap. Regular grids with a
+    monotonic latitude axis don't need a tree at all: their axes are bisected
+    instead (see _RegularAxes).
+    """
+
+    CURVILINEAR = "curvilinear"
+    REGULAR = "regular"
+    UNSTRUCTURED = "unstructured"
+
+    def __init__(self, latvar, lonvar, unstructured: bool = False,
+                 cache: GridIndexCache = None, use_axes: bool = True):
+        """
+        Arguments:
+            * latvar -- Latitude variable (xarray, netCDF4 or numpy). Single
+                dimensional entries are squeezed out, e.g. (1, 1, y, x)
+                mesh variables.
+            * lonvar -- Longitude variable.
+            * unstructured {bool} -- Coordinates are 1D nodes/elements.
+            * cache {GridIndexCache} -- Defaults to grid_index_cache.
+            * use_axes {bool} -- Bisect the axes of regular grids rather than
+                using a KD-tree (when they allow it).
+        """
+
+        lat = np.squeeze(np.asarray(latvar[:]))
+        lon = np.squeeze(np.asarray(lonvar[:]))
+
+        # Identifies the grid, e.g. in the tile_slice_index
+        self.key: str = mesh_key(lat, lon, unstructured)
+
+        if unstructured:
+            self.kind: str = GridIndex.UNSTRUCTURED
+        elif lat.ndim == 1:
+            self.kind: str = GridIndex.REGULAR
+        else:
+            self.kind: str = GridIndex.CURVILINEAR
+
+        self._mesh: tuple = (lat, lon, unstructured)
+        self._cache: GridIndexCache = cache if cache is not None else grid_index_cache
+        self.shape: tuple = (lat.size, lon.size) if self.kind == GridIndex.REGULAR \
+            else lat.shape
+
+        self._axes: _RegularAxes = None
+        self.__kdt: KDTree = None
+        if self.kind == GridIndex.REGULAR and use_axes and \
+                _RegularAxes.supports(lat, lon):
+            self._axes = _RegularAxes(lat, lon, self._cache)
+
+    @property
+    def _kdt(self) -> KDTree:
+        # Only built (or fetched from the cache) when first queried, so a
+        # bounding box served from the tile_slice_index never needs it.
+        if self.__kdt is None:
+            lat, lon, unstructured = self._mesh
+            self.__kdt, _ = self._cache.get(lat, lon, unstructured, self.key)
+        return self.__kdt
+
+    def coordinates(self, indices: tuple) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the latitude and longitude of grid points, given one index
+        array per grid axis (as returned by nearest).
+        """
+
+        lat, lon, _ = self._mesh
+        if self.kind == GridIndex.REGULAR:
+            iy, ix = indices
+            return lat[iy], lon[ix]
+
+        return lat[indices], lon[indices]
+
+    def nearest(self, lat, lon, n: int = 1) -> Tuple[np.ndarray, tuple]:
+        """Finds the n grid points closest to each lat/lon pair.
+
+        Arguments:
+            * lat -- Target latitude(s).
+            * lon -- Target longitude(s).
+            * n {int} -- Number of neighbours per target.
+
+        Returns:
+            Tuple[np.ndarray, tuple] -- Chord distances on the unit sphere,
+            and a tuple with one index array per grid axis. Arrays are of
+            shape (targets, ) if n == 1, (targets, n) otherwise.
+        """
+
+        lat = np.atleast_1d(np.asarray(lat))
+        lon = np.atleast_1d(np.asarray(lon))
+
+        if self._axes is not None:
+            dist, iy, ix = self._axes.query(lat, lon, n)
+            if n == 1:
+                return dist[:, 0], (iy[:, 0], ix[:, 0])
+            return dist, (iy, ix)
+
+        with compute_resources.openmp_limits():
+            dist, index = self._kdt.query(np.float32(_to_triples(lat, lon)),
+                                          k=n)
+
+        return dist, np.unravel_index(index, self.shape)
+
+    def bounding_box(self, lat, lon, n: int = 10, padding: int = None,
+                     tile: tuple = None) -> Tuple[List[Tuple[int, int]], float]:
+        """Finds the index window around a set of lat/lon points.
+
+        Arguments:
+            * lat -- Target latitude(s).
+            * lon -- Target longitude(s).
+            * n {int} -- Number of neighbours per target the window must hold.
+            * padding {int} -- Cells added on each side of the neighbours.
+                By default a quarter of the window extent (at least 2).
+            * tile {tuple} -- (projection, z, x, y) of the map tile whose
+                pixels lat and lon are, or (projection, z, x, y, n) of the
+                n x n tiles from (x, y). Its window is then looked up in (or
+                recorded to) the tile_slice_index instead of searched for.
+
+        Returns:
+            Tuple[list, float] -- A (min, max) pair per grid axis, clipped to
+            the grid, and the largest chord distance to a neighbour.
+        """
+
+        entry = None
+        if tile is not None:
+            entry = tile_slice_index.get(self.key, n, tile)
+
+        if entry is not None:
+            extents, dist = entry
+        else:
+            lat, lon = np.ravel(lat), np.ravel(lon)
+            extents, dist = None, 0
+            for start in range(0, lat.size, BOUNDING_BOX_BLOCK):
+                block = slice(start, start + BOUNDING_BOX_BLOCK)
+                d, indices = self.nearest(lat[block], lon[block], n)
+
+                block_extents = [(np.amin(i), np.amax(i)) for i in indices]
+                if extents is not None:
+                    block_extents = [
+                        (min(e[0], b[0]), max(e[1], b[1]))
+                        for e, b in zip(extents, block_extents)
+                    ]
+                extents = block_extents
+                dist = max(dist, np.amax(d))
+
+            if tile is not None:
+                tile_slice_index.put(self.key, n, tile, extents, dist)
+
+        limits = [
+            _pad_limits(np.array(e), limit, padding)
+            for e, limit in zip(extents, self.shape)
+        ]
+
+        return limits, dist
+
+    def within(self, lat, lon, radius: float, n: int = 64) -> tuple:
+        """Finds the grid points within a radius of any of the lat/lon points.
+
+        Arguments:
+            * lat -- Target latitude(s).
+            * lon -- Target longitude(s).
+            * radius {float} -- Great circle distance in metres.
+            * n {int} -- Maximum number of points per target.
+
+        Returns:
+            tuple -- One (sorted, unique) index array per grid axis.
+        """
+
+        chord = 2 * np.sin(radius / (2 * EARTH_RADIUS))
+
+        if self._axes is not None:
+            dist, indices = self.nearest(lat, lon, n)
+            within = dist <= chord
+            index = np.unique(np.ravel_multi_index(
+                (indices[0][within], indices[1][within]), self.shape))
+            return np.unravel_index(index, self.shape)
+
+        q = _to_triples(np.atleast_1d(np.asarray(lat)),
+                        np.atleast_1d(np.asarray(lon)))
+        with compute_resources.openmp_limits():
+            _, index = self._kdt.query(np.float32(q), k=n,
+                                       distance_upper_bound=chord)
+
+        index = np.unique(index)
+        index = index[index < np.prod(self.shape)]
+
+        return np.unravel_index(index, self.shape)
@@ -10,8 +10,9 @@ from cachetools import TTLCache
 from netCDF4 import Dataset
 from pint import UnitRegistry
 
+from data.bilinear import EXACT_BILINEAR
 from data.calculated import CalculatedData
-from data.nearest_grid_point import find_nearest_grid_point
+from data.grid_index import GridIndex
 from data.variable import Variable
 from data.variable_list import VariableList
 
@@ -22,8 +23,7 @@ class Mercator(CalculatedData):
     def __init__(self, url, **kwargs):
         self.latvar = None
         self.lonvar = None
-        self.__latsort = None
-        self.__lonsort = None
+        self.__grid_index = None
 
         super(Mercator, self).__init__(url, **kwargs)
 
@@ -33,8 +33,9 @@ class Mercator(CalculatedData):
         if not self._meta_only:
             if self.latvar is None:
                 self.latvar, self.lonvar = self.latlon_variables
-                self.__latsort = np.argsort(self.latvar[:])
-                self.__lonsort = np.argsort(np.mod(self.lonvar[:] + 360, 360))
+                # latitude/longitude are 1D axes, so lookups bisect them
+                # rather than going through a KD-tree.
+                self.__grid_index = GridIndex(self.latvar, self.lonvar)
 
         return self
 
@@ -72,28 +73,15 @@ class Mercator(CalculatedData):
 
         return None
 
-    def __bounding_box(self, lat, lon, n=10):
-
-        y, x, _ = find_nearest_grid_point(lat, lon, self._dataset, self.latvar, self.lonvar, n)
-
-        def fix_limits(data, limit):
-            mx = np.amax(data)
-            mn = np.amin(data)
-
-            mn -= np.int64(n / 2)
-            mx += np.int64(n / 2)
-
-            mn = np.clip(mn, 0, limit)
-            mx = np.clip(mx, 0, limit)
-
-            return mn, mx
-
-        miny, maxy = fix_limits(y, self.latvar.shape[0])
-        minx, maxx = fix_limits(x, self.lonvar.shape[0])
+    def __bounding_box(self, lat, lon, n=10, tile=None):
+        limits, _ = self.__grid_index.bounding_box(
+            lat, lon, n, padding=np.int64(n / 2), tile=tile)
+        (miny, maxy), (minx, maxx) = limits
 
         return np.int64(miny), np.int64(maxy), np.int64(minx), np.int64(maxx), np.amax(50000)
 
-    def __resample(self, lat_in, lon_in, lat_out, lon_out, var, radius=50000):
+    def __resample(self, lat_in, lon_in, lat_out, lon_out, var, radius=50000,
+                   grid=None, dtype=None):
         if len(var.shape) == 3:
             var = np.rollaxis(var, 0, 3)
 
@@ -103,46 +91,24 @@ class Mercator(CalculatedData):
 
         lon_in, lat_in = pyresample.utils.check_and_wrap(lon_in, lat_in)
 
-        masked_lon_in = np.ma.array(lon_in)
-        masked_lat_in = np.ma.array(lat_in)
-
-        output_def = pyresample.geometry.SwathDefinition(
-            lons=np.ma.array(lon_out),
-            lats=np.ma.array(lat_out)
-        )
+        if self.interp == EXACT_BILINEAR and grid is not None:
+            # Weights over the (lat, lon) window of the grid itself
+            weights = self._resample_weights(lat_in, lon_in, lat_out, lon_out,
+                                             grid=grid)
+        else:
+            grid_lat, grid_lon = np.meshgrid(lat_in, lon_in)
+            weights = self._resample_weights(grid_lat, grid_lon, lat_out,
+                                             lon_out)
+            # The meshgrid is (lon, lat)
+            data = np.swapaxes(data, 0, 1)
 
         if len(data.shape) == 3:
-            output = []
-            # multiple depths
-            for d in range(0, data.shape[2]):
-                grid_lat, grid_lon = np.meshgrid(
-                    masked_lat_in,
-                    masked_lon_in
-                )
-                grid_lat.mask = grid_lon.mask = \
-                    data[:, :, d].view(np.ma.MaskedArray).mask.transpose()
-                input_def = pyresample.geometry.SwathDefinition(
-                    lons=grid_lon,
-                    lats=grid_lat
-                )
-
-                output.append(super(Mercator, self)._interpolate(input_def, output_def, data[:, :, d].transpose()))
-
-            output = np.ma.array(output).transpose()
+            # multiple depths (and/or times), all resampled together. Levels
+            # end up last, and the target axes reversed.
+            output = np.moveaxis(
+                weights.apply(data, dtype), -1, 0).transpose()
         else:
-            grid_lat, grid_lon = np.meshgrid(
-                masked_lat_in,
-                masked_lon_in
-            )
-            grid_lat.mask = grid_lon.mask = \
-                data.view(np.ma.MaskedArray).mask.transpose()
-
-            input_def = pyresample.geometry.SwathDefinition(
-                lons=grid_lon,
-                lats=grid_lat
-            )
-
-            output = super(Mercator, self)._interpolate(input_def, output_def, data.transpose())
+            output = weights.apply(data, dtype)
 
         if len(origshape) == 4:
             output = output.reshape(origshape[2:])
@@ -204,10 +170,11 @@ class Mercator(CalculatedData):
         )
 
     def get_point(self, latitude, longitude, depth, timestamp, variable,
-                  return_depth=False):
+                  return_depth=False, tile=None, dtype=None):
 
         miny, maxy, minx, maxx, radius = self.__bounding_box(
-            latitude, longitude, 10)
+            latitude, longitude, 10, tile=tile)
+        grid = (self.__grid_index, (miny, maxy, minx, maxx))
 
         if not hasattr(latitude, "__len__"):
             latitude = np.array([latitude])
@@ -223,7 +190,8 @@ class Mercator(CalculatedData):
             else:
                 d = var[time, :, miny:maxy, minx:maxx]
 
-            reshaped = np.ma.masked_invalid(d.values.reshape([d.shape[0], -1]))
+            d = self._load(d)
+            reshaped = np.ma.masked_invalid(d.reshape([d.shape[0], -1]))
 
             edges = np.array(np.ma.notmasked_edges(reshaped, axis=0))
             depths = edges[1, 0, :]
@@ -254,7 +222,9 @@ class Mercator(CalculatedData):
                 np.mod(self.lonvar[minx:maxx] + 360, 360),
                 [latitude], [longitude],
                 data,
-                radius
+                radius,
+                grid=grid,
+                dtype=dtype,
             )
 
             if return_depth:
@@ -272,7 +242,9 @@ class Mercator(CalculatedData):
                     self.lonvar[minx:maxx],
                     latitude, longitude,
                     np.reshape(d, data.shape),
-                    radius
+                    radius,
+                    grid=grid,
+                    dtype=dtype,
                 )
 
         else:
@@ -285,8 +257,10 @@ class Mercator(CalculatedData):
                 self.latvar[miny:maxy],
                 self.lonvar[minx:maxx],
                 latitude, longitude,
-                data.values,
-                radius
+                self._load(data),
+                radius,
+                grid=grid,
+                dtype=dtype,
             )
 
             if return_depth:
@@ -303,6 +277,7 @@ class Mercator(CalculatedData):
     def get_profile(self, latitude, longitude, timestamp, variable):
         miny, maxy, minx, maxx, radius = self.__bounding_box(
             latitude, longitude, 10)
+        grid = (self.__grid_index, (miny, maxy, minx, maxx))
 
         if not hasattr(latitude, "__len__"):
             latitude = np.array([latitude])
@@ -315,8 +290,9 @@ class Mercator(CalculatedData):
             self.latvar[miny:maxy],
             self.lonvar[minx:maxx],
             [latitude], [longitude],
-            var[time, :, miny:maxy, minx:maxx].values,
-            radius
+            self._load(var[time, :, miny:maxy, minx:maxx]),
+            radius,
+            grid=grid,
         )
 
         return res, np.squeeze([self.depths] * len(latitude))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import os
+import threading
+from typing import List
+
+import numpy as np
+from cachetools import LRUCache
+
+from data import open_dataset
+from data.dimension_cache import is_sqlite_database
+from data.sqlite_database import SQLiteDatabase
+from data.utils import get_data_vars_from_equation
+from data.variable import Variable
+from data.variable_list import VariableList
+
+# Bump when the layout below changes; older snapshots are then ignored.
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".meta.json"
+
+_cache: LRUCache = LRUCache(maxsize=64)
+_lock = threading.Lock()
+
+
+class MetadataSnapshot:
+    """
+    Read-only view of a dataset's metadata snapshot: its variables (including
+    calculated ones), their depths in metres and their raw time axes.
+
+    Snapshots are JSON sidecars written next to the dataset's sqlite index
+    (<index>.meta.json) by scripts/build_metadata_snapshot.py. Depth and time
+    axes are stored once and referenced by index from each variable, since
+    most variables of a dataset share them.
+    """
+
+    def __init__(self, content: dict):
+        self._content: dict = content
+        self._variables: VariableList = VariableList([
+            Variable(v['key'], v['name'], v['unit'], tuple(v['dimensions']),
+                     v['valid_min'], v['valid_max'])
+            for v in content['variables']
+        ])
+        self._axes: dict = {v['key']: v for v in content['variables']}
+
+    @property
+    def variables(self) -> VariableList:
+        return self._variables
+
+    def depths(self, variable: str) -> np.ndarray:
+        """Returns the depths (in metres) of a variable. [0] for variables
+        without depth, like Nemo.depths.
+        """
+
+        axis = self._axes[variable].get('depth_axis')
+        depths = np.array(
+            self._content['depth_axes'][axis] if axis is not None else [0])
+        depths.setflags(write=False)  # Make immutable
+
+        return depths
+
+    def timestamps(self, variable: str) -> List:
+        """Returns the raw timestamps of a variable, sorted in ascending order.
+        """
+
+        axis = self._axes[variable].get('time_axis')
+        if axis is None:
+            return []
+
+        return list(self._content['time_axes'][axis])
+
+    def is_fresh(self, config) -> bool:
+        """Checks the snapshot against the dataset's sqlite index and the
+        calculated variables in the dataset config.
+        """
+
+        index = _get_index_signature(config.url)
+
+        return index is not None and \
+            self._content.get('version') == SNAPSHOT_VERSION and \
+            self._content.get('index') == index and \
+            self._content.get('calculated') == _get_calculated_hash(config)
+
+
+def get_snapshot_path(url: str) -> str:
+    return url + SNAPSHOT_SUFFIX
+
+
+def get_snapshot(config) -> MetadataSnapshot:
+    """Returns the metadata snapshot of a dataset.
+
+    Arguments:
+        * config {DatasetConfig} -- Dataset of interest.
+
+    Returns:
+        MetadataSnapshot -- The snapshot, or None if the dataset has none or
+        it is out of date. Callers then fall back to opening the dataset.
+    """
+
+    if not config.url or not is_sqlite_database(config.url):
+        return None
+
+    path = get_snapshot_path(config.url)
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        return None
+
+    with _lock:
+        snapshot = _cache.get(key)
+
+    if snapshot is None:
+        try:
+            with open(path, 'r') as f:
+                snapshot = MetadataSnapshot(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+        with _lock:
+            _cache[key] = snapshot
+
+    return snapshot if snapshot.is_fresh(config) else None
+
+
+def build_snapshot(config) -> dict:
+    """Builds the snapshot content of a dataset by opening it (meta-only for
+    the variable list, and once per distinct depth axis).
+
+    Arguments:
+        * config {DatasetConfig} -- Dataset of interest. Its url must point to
+            a sqlite index.
+
+    Returns:
+        dict -- JSON-serializable snapshot content.
+    """
+
+    # Captured first so a re-index while we run makes the snapshot stale.
+    index = _get_index_signature(config.url)
+
+    with open_dataset(config, meta_only=True) as ds:
+        variables = list(ds.variables)
+
+    with SQLiteDatabase(config.url) as db:
+        data_variables = [v.key for v in db.get_data_variables()]
+
+        depth_axes, time_axes, entries = [], [], []
+        for v in variables:
+            if v.key in config.calculated_variables:
+                data_vars = get_data_vars_from_equation(
+                    config.calculated_variables[v.key]['equation'], data_variables)
+            else:
+                data_vars = [v.key]
+
+            timestamps = db.get_timestamps(data_vars[0]) if data_vars else []
+
+            depths = None
+            if v.has_depth() and timestamps:
+                with open_dataset(config, variable=v.key, timestamp=timestamps[-1]) as ds:
+                    depths = [float(d) for d in ds.depths]
+
+            entries.append({
+                'key': v.key,
+                'name': v.name,
+                'unit': v.unit,
+                'dimensions': list(v.dimensions),
+                'valid_min': _to_json_number(v.valid_min),
+                'valid_max': _to_json_number(v.valid_max),
+                'depth_axis': _add_axis(depth_axes, depths),
+                'time_axis': _add_axis(time_axes, timestamps or None),
+            })
+
+    return {
+        'version': SNAPSHOT_VERSION,
+        'dataset': config.key,
+        'index': index,
+        'calculated': _get_calculated_hash(config),
+        'time_dim_units': config.time_dim_units,
+        'variables': entries,
+        'depth_axes': depth_axes,
+        'time_axes': time_axes,
+    }
+
+
+def write_snapshot(config) -> str:
+    """Builds and writes the snapshot of a dataset next to its sqlite index.
+
+    Returns:
+        str -- Path of the written snapshot.
+    """
+
+    content = build_snapshot(config)
+
+    path = get_snapshot_path(config.url)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(content, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def _add_axis(axes: list, values: list) -> int:
+    if values is None:
+        return None
+
+    values = [v.item() if hasattr(v, 'item') else v for v in values]
+    try:
+        return axes.index(values)
+    except ValueError:
+        axes.append(values)
+        return len(axes) - 1
+
+
+def _to_json_number(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+def _get_index_signature(url: str) -> dict:
+    # None if the index is gone (e.g. moved, leaving the snapshot behind)
+    try:
+        st = os.stat(url)
+    except OSError:
+        return None
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def _get_calculated_hash(config) -> str:
+    return hashlib.sha1(json.dumps(
+        config.calculated_variables, sort_keys=True).encode()).hexdigest()
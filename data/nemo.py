@@ -3,10 +3,9 @@
 import numpy as np
 import pyresample
 from pint import UnitRegistry
-from pykdtree.kdtree import KDTree
 
 from data.calculated import CalculatedData
-from data.nearest_grid_point import find_nearest_grid_point
+from data.grid_index import GridIndex
 
 
 class Nemo(CalculatedData):
@@ -53,36 +52,18 @@ class Nemo(CalculatedData):
     """
         Computes and returns points bounding lat, lon.
     """
-    def __bounding_box(self, lat, lon, latvar, lonvar, n=10):
+    def __bounding_box(self, lat, lon, index: GridIndex, n=10, tile=None):
+        limits, d = index.bounding_box(
+            lat, lon, n, tile=tile)
+        (miny, maxy), (minx, maxx) = limits
 
-        y, x, d = find_nearest_grid_point(lat, lon, self._dataset, latvar, lonvar, n)
+        return miny, maxy, minx, maxx, np.clip(d, 5000, 50000)
 
-        def fix_limits(data, limit):
-            mx = np.amax(data)
-            mn = np.amin(data)
-            d = mx - mn
-
-            if d < 2:
-                mn -= 2
-                mx += 2
-
-            mn = int(mn - d / 4.0)
-            mx = int(mx + d / 4.0)
-
-            mn = np.clip(mn, 0, limit)
-            mx = np.clip(mx, 0, limit)
-
-            return mn, mx
-
-        miny, maxy = fix_limits(y, latvar.shape[0])
-        minx, maxx = fix_limits(x, latvar.shape[1])
-
-        return miny, maxy, minx, maxx, np.clip(np.amax(d), 5000, 50000)
-    
     """
         Resamples data given lat/lon inputs and outputs
     """
-    def __resample(self, lat_in, lon_in, lat_out, lon_out, var):
+    def __resample(self, lat_in, lon_in, lat_out, lon_out, var, grid=None,
+                   dtype=None):
         if len(var.shape) == 3:
             var = np.rollaxis(var, 0, 3)
         elif len(var.shape) == 4:
@@ -96,43 +77,16 @@ class Nemo(CalculatedData):
 
         lon_in, lat_in = pyresample.utils.check_and_wrap(lon_in, lat_in)
 
-        masked_lon_in = np.ma.array(lon_in)
-        masked_lat_in = np.ma.array(lat_in)
-
-        output_def = pyresample.geometry.SwathDefinition(
-            lons=np.ma.array(lon_out),
-            lats=np.ma.array(lat_out)
-        )
+        weights = self._resample_weights(lat_in, lon_in, lat_out, lon_out,
+                                         grid=grid)
 
         if len(data.shape) == 3:
-            output = []
-            # multiple depths
-            for d in range(0, data.shape[2]):
-                
-                masked_lon_in.mask = masked_lat_in.mask = \
-                    data[:, :, d].view(np.ma.MaskedArray).mask
-
-                input_def = pyresample.geometry.SwathDefinition(
-                    lons=masked_lon_in,
-                    lats=masked_lat_in,
-                    nprocs=8
-                )
-
-                output.append(super(Nemo, self)._interpolate(input_def, output_def, data[:, :, d]))
-
-            output = np.ma.array(output).transpose()
-            
+            # multiple depths (and/or times), all resampled together. Levels
+            # end up last, and the target axes reversed.
+            output = np.moveaxis(
+                weights.apply(data, dtype), -1, 0).transpose()
         else:
-            masked_lon_in.mask = masked_lat_in.mask = \
-                var[:].view(np.ma.MaskedArray).mask
-            
-            input_def = pyresample.geometry.SwathDefinition(
-                lons=masked_lon_in,
-                lats=masked_lat_in
-            )
-
-            output = super(Nemo, self)._interpolate(input_def, output_def, data)
-           
+            output = weights.apply(data, dtype)
 
         if len(origshape) == 4:
             output = output.reshape(origshape[2:])
@@ -143,6 +97,17 @@ class Nemo(CalculatedData):
         Returns the xarray.DataArray for latitude and longitude variables in the dataset.
     """
     def __latlon_vars(self, variable):
+        lat_key, lon_key = self.__latlon_keys(variable)
+
+        return (
+            self.get_dataset_variable(lat_key),
+            self.get_dataset_variable(lon_key)
+        )
+
+    """
+        Returns the names of the latitude and longitude variables of a variable.
+    """
+    def __latlon_keys(self, variable):
         # Get DataArray
         var = self.get_dataset_variable(variable)
 
@@ -162,24 +127,19 @@ class Nemo(CalculatedData):
             coordinates = var.attrs['coordinates'].split()
             for p in pairs:
                 if p[0] in coordinates:
-                    return (
-                        self.get_dataset_variable(p[0]),
-                        self.get_dataset_variable(p[1]) # Check this
-                    )
+                    return p[0], p[1]
         else:
             for p in pairs:
                 if p[0] in self._dataset.variables:
-                    return (
-                        self.get_dataset_variable(p[0]),
-                        self.get_dataset_variable(p[1])
-                    )
+                    return p[0], p[1]
 
         raise LookupError("Cannot find latitude & longitude variables")
 
     def get_raw_point(self, latitude, longitude, depth, timestamp, variable):
         latvar, lonvar = self.__latlon_vars(variable)
+        index = self._get_grid_index(*self.__latlon_keys(variable))
         miny, maxy, minx, maxx, radius = self.__bounding_box(
-            latitude, longitude, latvar, lonvar, 10)
+            latitude, longitude, index, 10)
 
         if not hasattr(latitude, "__len__"):
             latitude = np.array([latitude])
@@ -229,12 +189,14 @@ class Nemo(CalculatedData):
         )
 
     def get_point(self, latitude, longitude, depth, timestamp, variable,
-                  return_depth=False):
+                  return_depth=False, tile=None, dtype=None):
                 
         latvar, lonvar = self.__latlon_vars(variable)
 
+        index = self._get_grid_index(*self.__latlon_keys(variable))
         miny, maxy, minx, maxx, radius = self.__bounding_box(
-            latitude, longitude, latvar, lonvar, 10)
+            latitude, longitude, index, 10, tile=tile)
+        grid = (index, (miny, maxy, minx, maxx))
 
         if not hasattr(latitude, "__len__"):
             latitude = np.array([latitude])
@@ -250,7 +212,8 @@ class Nemo(CalculatedData):
                 d = var[time[0], :, miny:maxy, minx:maxx]
             else:
                 d = var[time, :, miny:maxy, minx:maxx]
-            reshaped = np.ma.masked_invalid(d.values.reshape([d.shape[0], -1]))
+            d = self._load(d)
+            reshaped = np.ma.masked_invalid(d.reshape([d.shape[0], -1]))
 
             edges = np.array(np.ma.notmasked_edges(reshaped, axis=0))
             depths = edges[1, 0, :]
@@ -258,7 +221,7 @@ class Nemo(CalculatedData):
 
             if hasattr(time, "__len__"):
                 data_in = var[time, :, miny:maxy, minx:maxx]
-                data_in = data_in.values.reshape(
+                data_in = self._load(data_in).reshape(
                     [data_in.shape[0], data_in.shape[1], -1])
                 data = []
                 for i, t in enumerate(time):
@@ -270,9 +233,9 @@ class Nemo(CalculatedData):
                 data = np.ma.array(data).reshape([len(time), d.shape[-2],
                                                   d.shape[-1]])
             else:
-                data = np.ma.MaskedArray(np.zeros(d.values.shape[1:]),
+                data = np.ma.MaskedArray(np.zeros(d.shape[1:]),
                                          mask=True,
-                                         dtype=d.values.dtype)
+                                         dtype=d.dtype)
 
                 data[np.unravel_index(indices, data.shape)] = \
                     reshaped[depths, indices]
@@ -282,6 +245,8 @@ class Nemo(CalculatedData):
                 lonvar[miny:maxy, minx:maxx],
                 latitude, longitude,
                 data,
+                grid=grid,
+                dtype=dtype,
             )
             if return_depth:
                 d = self.depths[depths]
@@ -293,6 +258,8 @@ class Nemo(CalculatedData):
                     lonvar[miny:maxy, minx:maxx],
                     latitude, longitude,
                     np.reshape(d, data.shape),
+                    grid=grid,
+                    dtype=dtype,
                 )
 
         else:
@@ -304,7 +271,9 @@ class Nemo(CalculatedData):
                 latvar[miny:maxy, minx:maxx],
                 lonvar[miny:maxy, minx:maxx],
                 latitude, longitude,
-                data.values,
+                self._load(data),
+                grid=grid,
+                dtype=dtype,
             )
             if return_depth:
                 dep = self.depths[depth]
@@ -320,8 +289,10 @@ class Nemo(CalculatedData):
     def get_profile(self, latitude, longitude, timestamp, variable):
         latvar, lonvar = self.__latlon_vars(variable)
         
+        index = self._get_grid_index(*self.__latlon_keys(variable))
         miny, maxy, minx, maxx, radius = self.__bounding_box(
-            latitude, longitude, latvar, lonvar, 10)
+            latitude, longitude, index, 10)
+        grid = (index, (miny, maxy, minx, maxx))
 
         if not hasattr(latitude, "__len__"):
             latitude = np.array([latitude])
@@ -335,7 +306,8 @@ class Nemo(CalculatedData):
             latvar[miny:maxy, minx:maxx],
             lonvar[miny:maxy, minx:maxx],
             [latitude], [longitude],
-            var[time_index, :, miny:maxy, minx:maxx].values,
+            self._load(var[time_index, :, miny:maxy, minx:maxx]),
+            grid=grid,
         )
 
         return res, np.squeeze([self.depths] * len(latitude))
\ No newline at end of file
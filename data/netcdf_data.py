@@ -4,12 +4,12 @@ import datetime
 import os
 import re
 import uuid
-import warnings
 import zipfile
 from data.utils import (DateTimeEncoder, datetime_to_timestamp,
                         get_data_vars_from_equation, string_to_datetime,
                         timestamp_to_datetime)
 import cftime
+import dask
 import dateutil.parser
 import geopy
 import netCDF4
@@ -22,15 +22,24 @@ from cachetools import TTLCache
 from flask_babel import format_date
 
 import data.calculated
+from data.bilinear import EXACT_BILINEAR, get_bilinear_weights
 from data.data import Data
+from data.grid_angle_cache import get_grid_angles
+from data.grid_index import GridIndex
 from data.nearest_grid_point import find_nearest_grid_point
+from data.resample_weights import ResampleWeights, resample_weight_cache
 from data.sqlite_database import SQLiteDatabase
+from data.timestamp_index import TimeCoordinateIndex
 from data.utils import timestamp_to_datetime
 from data.variable import Variable
 from data.variable_list import VariableList
 from oceannavigator.dataset_config import DatasetConfig
+from utils.compute_resources import compute_resources
 from utils.errors import ServerError
 
+# dask's names of the schedulers of DatasetConfig.open_profile
+_DASK_SCHEDULERS = {'sync': 'synchronous', 'threads': 'threads'}
+
 
 class NetCDFData(Data):
     """Handles reading of netcdf files.
@@ -44,40 +53,131 @@ class NetCDFData(Data):
         self._nc_files: list = kwargs.get('nc_files')
         self._grid_angle_file_url: str = kwargs.get('grid_angle_file_url')
         self._time_variable: xr.IndexVariable = None
+        # (latitude, longitude variable names) -> GridIndex, see _get_grid_index
+        self._grid_indexes: dict = {}
+        self._time_index: TimeCoordinateIndex = None
         self._meta_only: bool = kwargs.get('meta_only', False)
         self._dataset_open: bool = False
         self._dataset_key: str = kwargs.get('dataset_key')
+        # Chunking/parallel/scheduler settings from DatasetConfig.open_profile
+        self._open_profile: dict = kwargs.get('open_profile') or {}
+        # Passed to dask when reading the variables (see _load), rather than
+        # set in its process-wide config, which other threads share.
+        self._scheduler: str = _DASK_SCHEDULERS.get(
+            self._open_profile.get('scheduler'))
         self._dataset_config: DatasetConfig = DatasetConfig(
             self._dataset_key) if self._dataset_key else None
+        # Set by data.dataset_pool when this object is leased from the pool
+        self._pool = None
+        self._pool_key: tuple = None
+        self._pool_mtimes: tuple = None
+        self._pool_open_files: int = 0
 
         super(NetCDFData, self).__init__(url)
 
     def __enter__(self):
-        if not self._meta_only:
+        # Pooled handles are still open from a previous lease.
+        if not self._meta_only and not self._dataset_open:
             # Don't decode times since we do it anyways.
             decode_times = False
+            chunks = self._open_profile.get('chunks')
 
             if self._nc_files:
-                self._dataset = xr.open_mfdataset(
-                    self._nc_files, decode_times=decode_times)
+                # With parallel, the files are opened by dask's configured
+                # scheduler.
+                with dask.config.set({'scheduler': self._scheduler}
+                                     if self._scheduler else {}):
+                    self._dataset = xr.open_mfdataset(
+                        self._nc_files, decode_times=decode_times,
+                        chunks=chunks,
+                        parallel=self._open_profile.get('parallel', False))
             else:
                 self._dataset = xr.open_dataset(
-                    self.url, decode_times=decode_times)
+                    self.url, decode_times=decode_times, chunks=chunks)
 
-            if self._grid_angle_file_url:
-                angle_file = xr.open_mfdataset(
-                    self._grid_angle_file_url, drop_variables=[self._dataset_config.lat_var_key, self._dataset_config.lon_var_key])
-                self._dataset = self._dataset.merge(angle_file)
-                angle_file.close()
+            # Grid angle fields are attached on demand, see _attach_grid_angles.
 
             self._dataset_open = True
 
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        if self._pool is not None and self._dataset_open and exc_type is None:
+            # Reset per-request interpolation settings before handing the
+            # object back so the next lease starts from the defaults.
+            super(NetCDFData, self).__init__(self.url)
+            self._pool.release(self)
+        else:
+            self.close()
+
+    def close(self):
+        """Closes the underlying dataset (even if the object is pooled).
+        """
         if self._dataset_open:
             self._dataset.close()
             self._dataset_open = False
+            self._time_variable = None
+            self._time_index = None
+            self._grid_indexes = {}
+
+    def _attach_grid_angles(self, variables: list) -> None:
+        """Adds grid angle fields (e.g. sin_alpha, cos_alpha, used to rotate
+        vectors onto east/north) to the open dataset, if any of the given
+        variables is one of them. The angle file itself is only read once per
+        process (see data.grid_angle_cache).
+
+        Arguments:
+            variables {list} -- Names of the variables about to be accessed.
+        """
+
+        if not self._grid_angle_file_url or \
+                not isinstance(self._dataset, xr.Dataset):
+            return
+
+        drop = [self._dataset_config.lat_var_key,
+                self._dataset_config.lon_var_key] if self._dataset_config else []
+        angles = get_grid_angles(self._grid_angle_file_url, drop)
+
+        for name in variables:
+            if name in angles and name not in self._dataset.variables:
+                self._dataset[name] = angles[name]
+
+    def _get_grid_index(self, lat_var: str, lon_var: str) -> GridIndex:
+        """Returns the index of a mesh of the dataset, which is only built
+        the first time it's used while the dataset is open.
+
+        Arguments:
+            * lat_var {str} -- Name of the latitude variable of the mesh.
+            * lon_var {str} -- Name of the longitude variable of the mesh.
+        """
+
+        key = (lat_var, lon_var)
+        index = self._grid_indexes.get(key)
+        if index is None:
+            index = self._grid_indexes[key] = GridIndex(
+                self.get_dataset_variable(lat_var),
+                self.get_dataset_variable(lon_var))
+
+        return index
+
+    def _load(self, data) -> np.ndarray:
+        """Reads a slice of a variable, computing it (if the dataset was
+        opened with chunks) with the scheduler of the open profile.
+
+        Arguments:
+            * data {xr.DataArray} -- The slice.
+        """
+
+        if self._scheduler is not None:
+            data = data.compute(scheduler=self._scheduler)
+        return data.values
+
+    def __to_netcdf(self, dataset: xr.Dataset, path: str, **kwargs) -> None:
+        if self._scheduler is None:
+            dataset.to_netcdf(path, **kwargs)
+        else:
+            dataset.to_netcdf(path, compute=False, **kwargs).compute(
+                scheduler=self._scheduler)
 
     def __resample(self, lat_in, lon_in, lat_out, lon_out, var):
         pass
@@ -106,9 +206,7 @@ class NetCDFData(Data):
             [int or list] -- Time index(es).
         """
 
-        time_var = self.time_variable
-
-        result = np.nonzero(np.isin(time_var, timestamp))[0]
+        result = self.time_index.exact(timestamp)
 
         return result if result.shape[0] > 1 else result[0]
 
@@ -134,7 +232,7 @@ class NetCDFData(Data):
         time_range[0] = time_range[0].replace(tzinfo=None)
         time_range = [netCDF4.date2num(
             x, time_var.attrs['units']) for x in time_range]
-        time_range = [np.where(time_var.values == x)[0] for x in time_range]
+        time_range = [self.time_index.exact(x) for x in time_range]
 
         if len(time_range) == 1:  # Single Date
             return int(str(time_range[0][0]))
@@ -224,14 +322,16 @@ class NetCDFData(Data):
         # calculated variables.
         if not entire_globe:
             # Find closest indices in dataset corresponding to each calculated point
+            latvar = self.get_dataset_variable(lat_var)
+            lonvar = self.get_dataset_variable(lon_var)
+            index = self._get_grid_index(lat_var, lon_var)
             ymin_index, xmin_index, _ = find_nearest_grid_point(
-                bottom_left[0], bottom_left[1], self._dataset,
-                self.get_dataset_variable(
-                    lat_var), self.get_dataset_variable(lon_var)
+                bottom_left[0], bottom_left[1], self._dataset, latvar, lonvar,
+                index=index
             )
             ymax_index, xmax_index, _ = find_nearest_grid_point(
-                top_right[0], top_right[1], self._dataset, self.get_dataset_variable(
-                    lat_var), self.get_dataset_variable(lon_var)
+                top_right[0], top_right[1], self._dataset, latvar, lonvar,
+                index=index
             )
 
             # Compute min/max for each slice in case the values are flipped
@@ -329,8 +429,10 @@ class NetCDFData(Data):
                 data = data.reshape([data.shape[0], data.shape[1], -1])
 
                 # Perform regridding using nearest neighbour weighting
-                regridded = pyresample.kd_tree.resample_nearest(
-                    input_def, data, output_def, 50000, fill_value=None, nprocs=8)
+                with compute_resources.openmp_limits():
+                    regridded = pyresample.kd_tree.resample_nearest(
+                        input_def, data, output_def, 50000, fill_value=None,
+                        nprocs=compute_resources.threads)
                 # Move merged axis back to front
                 regridded = np.moveaxis(regridded, -1, 0)
                 # Match target output grid (netcdf4 used to do this automatically but now it doesn't >.>)
@@ -338,7 +440,7 @@ class NetCDFData(Data):
 
             # Check lat/lon wrapping
             lon_vals, lat_vals = pyresample.utils.check_and_wrap(
-                lons=subset[lon_var].values, lats=subset[lat_var].values)
+                lons=self._load(subset[lon_var]), lats=self._load(subset[lat_var]))
 
             # Generate our lat/lon grid of 50x50 resolution
             min_lon, max_lon = np.amin(lon_vals), np.amax(lon_vals)
@@ -408,7 +510,7 @@ class NetCDFData(Data):
                 temp = ds.createVariable(
                     'water_temp', 'd', ('time', 'depth', 'lat', 'lon'), fill_value=-30000.0)
                 temp_data = regrid(
-                    subset[temp_var].values, input_def, output_def)
+                    self._load(subset[temp_var]), input_def, output_def)
 
                 # Convert from Kelvin to Celsius
                 ureg = pint.UnitRegistry()
@@ -437,7 +539,7 @@ class NetCDFData(Data):
                 salinity = ds.createVariable(
                     'salinity', 'd', ('time', 'depth', 'lat', 'lon'), fill_value=-30000.0)
                 salinity[:] = regrid(
-                    subset[saline_var].values, input_def, output_def)[:]
+                    self._load(subset[saline_var]), input_def, output_def)[:]
                 salinity.long_name = "Salinity"
                 salinity.units = "psu"
                 salinity.valid_min = 0.0
@@ -446,7 +548,7 @@ class NetCDFData(Data):
             if x_vel_var is not None:
                 x_velo = ds.createVariable(
                     'water_u', 'd', ('time', 'depth', 'lat', 'lon'), fill_value=-30000.0)
-                x_velo[:] = regrid(subset[x_vel_var].values,
+                x_velo[:] = regrid(self._load(subset[x_vel_var]),
                                    input_def, output_def)[:]
                 x_velo.long_name = "Eastward Water Velocity"
                 x_velo.units = "meter/sec"
@@ -454,14 +556,14 @@ class NetCDFData(Data):
             if y_vel_var is not None:
                 y_velo = ds.createVariable(
                     'water_v', 'd', ('time', 'depth', 'lat', 'lon'), fill_value=-30000.0)
-                y_velo[:] = regrid(subset[y_vel_var].values,
+                y_velo[:] = regrid(self._load(subset[y_vel_var]),
                                    input_def, output_def)[:]
                 y_velo.long_name = "Northward Water Velocity"
                 y_velo.units = "meter/sec"
                 y_velo.NAVO_code = 18
 
             temp_file_name = working_dir + str(uuid.uuid4()) + ".nc"
-            subset.to_netcdf(temp_file_name)
+            self.__to_netcdf(subset, temp_file_name)
             subset.close()
 
             # Reopen using netCDF4 to get non-encoded time values
@@ -480,8 +582,8 @@ class NetCDFData(Data):
             subset.close()
         else:
             # Save subset normally
-            subset.to_netcdf(working_dir + filename +
-                             ".nc", format=output_format)
+            self.__to_netcdf(subset, working_dir + filename + ".nc",
+                             format=output_format)
 
         if int(query.get('should_zip')) == 1:
             myzip = zipfile.ZipFile('%s%s.zip' % (
@@ -495,58 +597,27 @@ class NetCDFData(Data):
         return working_dir, filename+".nc"
 
     """
-        Interpolates data given input and output definitions
-        and the selected interpolation algorithm.
+        Returns the neighbours and weights that resample the input
+        coordinates to the output ones with the selected interpolation
+        algorithm. They are cached, so each window and set of targets is
+        only searched once whatever the variable, depth or timestep.
+
+        grid is the (GridIndex, (miny, maxy, minx, maxx)) the input
+        coordinates were sliced with. exact_bilinear needs it to locate the
+        grid cells; the weights are then over (y, x) of the grid. Without
+        it, exact_bilinear falls back to bilinear.
     """
 
-    def _interpolate(self, input_def, output_def, data):
-
-        # Ignore pyresample warnings
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", RuntimeWarning)
-            warnings.simplefilter("ignore", UserWarning)
-
-            # Interpolation with gaussian weighting
-            if self.interp == "gaussian":
-                return pyresample.kd_tree.resample_gauss(input_def, data,
-                                                         output_def, radius_of_influence=float(self.radius), sigmas=self.radius / 2, fill_value=None,
-                                                         nprocs=8)
-
-            # Bilinear weighting
-            elif self.interp == "bilinear":
-                """
-                    Weight function used to determine the effect of surrounding points
-                    on a given point
-                """
-                def weight(r):
-                    r = np.clip(r, np.finfo(r.dtype).eps,
-                                np.finfo(r.dtype).max)
-                    return 1. / r
-
-                return pyresample.kd_tree.resample_custom(input_def, data,
-                                                          output_def, radius_of_influence=float(self.radius), neighbours=self.neighbours, fill_value=None,
-                                                          weight_funcs=weight, nprocs=8)
-
-            # Inverse-square weighting
-            elif self.interp == "inverse":
-                """
-                    Weight function used to determine the effect of surrounding points
-                    on a given point
-                """
-                def weight(r):
-                    r = np.clip(r, np.finfo(r.dtype).eps,
-                                np.finfo(r.dtype).max)
-                    return 1. / r ** 2
-
-                return pyresample.kd_tree.resample_custom(input_def, data,
-                                                          output_def, radius_of_influence=float(self.radius), neighbours=self.neighbours, fill_value=None,
-                                                          weight_funcs=weight, nprocs=8)
-
-            # Nearest-neighbour interpolation (junk)
-            elif self.interp == "nearest":
-
-                return pyresample.kd_tree.resample_nearest(input_def, data,
-                                                           output_def, radius_of_influence=float(self.radius), nprocs=8)
+    def _resample_weights(self, lat_in, lon_in, lat_out, lon_out,
+                          grid: tuple = None) -> ResampleWeights:
+        if self.interp == EXACT_BILINEAR and grid is not None:
+            index, window = grid
+            return get_bilinear_weights(index, window, lat_out, lon_out,
+                                        self.radius)
+
+        return resample_weight_cache.get(lat_in, lon_in, lat_out, lon_out,
+                                         self.interp, self.radius,
+                                         self.neighbours)
 
     @property
     def time_variable(self):
@@ -561,6 +632,16 @@ class NetCDFData(Data):
             ['time', 'time_counter', 'Times'])
         return self._time_variable
 
+    @property
+    def time_index(self) -> TimeCoordinateIndex:
+        """Sorted index of the time coordinate, built on first use and kept
+        for as long as the dataset stays open (including across pool leases).
+        """
+
+        if self._time_index is None:
+            self._time_index = TimeCoordinateIndex(self.time_variable[:])
+        return self._time_index
+
     @property
     def latlon_variables(self):
         """Finds the lat and lon variable arrays in the dataset.
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+import threading
+import warnings
+from typing import Callable, Tuple
+
+import numpy as np
+import pyresample
+from cachetools import LRUCache
+
+from data.grid_index import mesh_key
+from utils.compute_resources import compute_resources
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Larger weights aren't cached. Those of a 256x256 tile are about 10 MB, of a
+# 1024x1024 metatile (see plotting.tile.plot_metatile) 160 MB: one would
+# evict most of the cache, and is only reused for the same metatile.
+DEFAULT_MAX_ENTRY_BYTES = 32 * 1024 * 1024
+
+# resample_gauss searches for its default number of neighbours, whatever the
+# requested count.
+GAUSSIAN_NEIGHBOURS = 8
+
+
+class ResampleWeights:
+    """
+    The neighbours and weights of one resampling: a source window (e.g. the
+    bounding box of a get_point call) onto a set of target points.
+
+    They depend only on the coordinates and the interpolation settings, so
+    they can be applied to every depth level, timestep and variable on the
+    same window. Source points whose value is masked (e.g. land, which
+    changes with depth) are dropped and the weights of the remaining
+    neighbours renormalized, rather than searching for other neighbours.
+    """
+
+    def __init__(self, input_shape: tuple, output_shape: tuple,
+                 valid_input: np.ndarray, valid_output: np.ndarray,
+                 index: np.ndarray, weights: np.ndarray):
+        """
+        Arguments:
+            * input_shape {tuple} -- Shape of the source window.
+            * output_shape {tuple} -- Shape of the targets.
+            * valid_input {np.ndarray} -- Source points near the targets,
+                as returned by pyresample.kd_tree.get_neighbour_info.
+            * valid_output {np.ndarray} -- Targets with any neighbours.
+            * index {np.ndarray} -- Neighbours of each valid target, (valid
+                targets, k), indexing the valid source points. Missing
+                neighbours have index valid_input.sum().
+            * weights {np.ndarray} -- Weight of each neighbour (0 if missing).
+        """
+
+        self.input_shape: tuple = input_shape
+        self.output_shape: tuple = output_shape
+        self._valid_input: np.ndarray = valid_input
+        self._valid_output: np.ndarray = valid_output
+        self._index: np.ndarray = index
+        self._weights: np.ndarray = weights
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self._valid_input, self._valid_output,
+                                      self._index, self._weights))
+
+    def apply(self, data: np.ndarray,
+              dtype: np.dtype = None) -> np.ma.MaskedArray:
+        """Resamples a field, or a stack of fields, to the targets.
+
+        Arguments:
+            * data {np.ndarray} -- Values on the source window: its leading
+                axes are the window's, any trailing axes (e.g. depth) are
+                resampled together. NaNs are treated as masked.
+            * dtype {np.dtype} -- Of the weighting and the result, e.g.
+                float32 to halve the memory of the (targets, neighbours,
+                levels) intermediates. By default the result is float64.
+
+        Returns:
+            np.ma.MaskedArray -- Of shape output_shape + the trailing axes,
+            masked where a target has no valid neighbours.
+        """
+
+        data = np.ma.masked_invalid(np.ma.asarray(data))
+        levels = data.shape[len(self.input_shape):]
+
+        values = data.reshape((-1, int(np.prod(levels))))[self._valid_input]
+        # A masked row for the missing neighbours to point to.
+        values = np.ma.concatenate(
+            [values, np.ma.masked_all((1, values.shape[1]), values.dtype)])
+
+        values = values[self._index]  # (targets, k, levels)
+        weights = self._weights
+        if dtype is not None:
+            values = values.astype(dtype, copy=False)
+            weights = weights.astype(dtype, copy=False)
+        weights = np.where(np.ma.getmaskarray(values), 0,
+                           weights[:, :, np.newaxis])
+        norm = weights.sum(axis=1)
+
+        result = np.ma.masked_all(
+            (self._valid_output.size, values.shape[2]),
+            dtype=dtype if dtype is not None else np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[self._valid_output] = np.ma.masked_where(
+                norm == 0,
+                (values.filled(0) * weights).sum(axis=1) / norm)
+
+        return result.reshape(self.output_shape + levels)
+
+
+def compute_weights(lat_in: np.ndarray, lon_in: np.ndarray,
+                    lat_out: np.ndarray, lon_out: np.ndarray,
+                    method: str, radius: float, neighbours: int,
+                    nprocs: int = None) -> ResampleWeights:
+    """Finds the neighbours of each target and weights them the way the
+    pyresample resample_gauss/custom/nearest functions do.
+
+    Arguments:
+        * lat_in, lon_in {np.ndarray} -- Source coordinates.
+        * lat_out, lon_out {np.ndarray} -- Target coordinates.
+        * method {str} -- gaussian, bilinear, inverse or nearest.
+        * radius {float} -- Radius of influence in metres.
+        * neighbours {int} -- Neighbours per target.
+        * nprocs {int} -- Search threads. Defaults to the request's share
+            of the CPUs (see utils.compute_resources).
+
+    Returns:
+        ResampleWeights -- The weights.
+    """
+
+    if nprocs is None:
+        nprocs = compute_resources.threads
+
+    # SwathDefinition wants lats and lons of the same dtype
+    lat_in, lon_in = _same_dtype(lat_in, lon_in)
+    lat_out, lon_out = _same_dtype(lat_out, lon_out)
+
+    if method == "nearest":
+        neighbours = 1
+    elif method == "gaussian":
+        neighbours = GAUSSIAN_NEIGHBOURS
+
+    input_def = pyresample.geometry.SwathDefinition(
+        lons=lon_in, lats=lat_in)
+    output_def = pyresample.geometry.SwathDefinition(
+        lons=lon_out, lats=lat_out)
+
+    with warnings.catch_warnings(), compute_resources.openmp_limits():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        warnings.simplefilter("ignore", UserWarning)
+
+        valid_input, valid_output, index, distance = \
+            pyresample.kd_tree.get_neighbour_info(
+                input_def, output_def, float(radius),
+                neighbours=neighbours, nprocs=nprocs)
+
+    index = index.reshape((index.shape[0], -1))
+    distance = distance.reshape(index.shape)
+    missing = index == valid_input.sum()
+
+    weights = _weigh(np.where(missing, 1, distance), method, radius)
+    weights[missing] = 0
+
+    return ResampleWeights(lat_in.shape, lat_out.shape, valid_input,
+                           valid_output, index, weights)
+
+
+def _same_dtype(lat, lon) -> Tuple[np.ndarray, np.ndarray]:
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
+    dtype = np.result_type(lat, lon, np.float32)
+
+    return lat.astype(dtype, copy=False), lon.astype(dtype, copy=False)
+
+
+def _weigh(distance: np.ndarray, method: str, radius: float) -> np.ndarray:
+    if method == "gaussian":
+        return np.exp(-distance ** 2 / float(radius / 2) ** 2)
+
+    if method == "nearest":
+        return np.ones(distance.shape)
+
+    r = np.clip(distance, np.finfo(distance.dtype).eps,
+                np.finfo(distance.dtype).max)
+    if method == "inverse":
+        return 1. / r ** 2
+
+    # bilinear
+    return 1. / r
+
+
+class ResampleWeightCache:
+    """
+    ResampleWeights by (source window, targets, method, radius, neighbours),
+    so a map or profile that reads several variables, levels or datasets on
+    the same window only searches for neighbours once. Windows and targets
+    are keyed by a hash of their coordinates.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_entry_bytes: int = DEFAULT_MAX_ENTRY_BYTES):
+        self._lock = threading.Lock()
+        self._weights: LRUCache = LRUCache(
+            maxsize=max_bytes, getsizeof=lambda w: w.nbytes)
+        self._max_entry_bytes: int = max_entry_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.skipped: int = 0  # computed weights too large to cache
+
+    def get(self, lat_in, lon_in, lat_out, lon_out, method: str,
+            radius: float, neighbours: int) -> ResampleWeights:
+        """Returns the weights of a resampling (see compute_weights)."""
+
+        key = self.key(lat_in, lon_in, lat_out, lon_out, method, radius,
+                       neighbours)
+
+        return self.lookup(key, lambda: compute_weights(
+            lat_in, lon_in, lat_out, lon_out, method, radius, neighbours))
+
+    def lookup(self, key: Tuple,
+               compute: Callable[[], ResampleWeights]) -> ResampleWeights:
+        """Returns the weights cached under key, computing them if needed."""
+
+        with self._lock:
+            weights = self._weights.get(key)
+            if weights is not None:
+                self.hits += 1
+                return weights
+
+        weights = compute()
+
+        with self._lock:
+            self.misses += 1
+            if weights.nbytes > self._max_entry_bytes:
+                self.skipped += 1
+                return weights
+            try:
+                self._weights[key] = weights
+            except ValueError:
+                # Larger than the whole cache
+                pass
+
+        return weights
+
+    @staticmethod
+    def key(lat_in, lon_in, lat_out, lon_out, method: str, radius: float,
+            neighbours: int) -> Tuple:
+        return (
+            mesh_key(np.asarray(lat_in), np.asarray(lon_in), unstructured=True),
+            mesh_key(np.asarray(lat_out), np.asarray(lon_out), unstructured=True),
+            method, float(radius), int(neighbours),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._weights.clear()
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._weights),
+                'bytes': self._weights.currsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'skipped': self.skipped,
+            }
+
+
+# The cache shared by all requests handled by this worker process.
+resample_weight_cache = ResampleWeightCache()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+
+# Per-connection tuning. The dataset indexes are read-only from our side and
+# small enough to be memory-mapped in full.
+MMAP_SIZE = 256 * 1024 * 1024  # bytes
+CACHE_SIZE = -16 * 1024  # negative values are in KiB
+CACHED_STATEMENTS = 256
+MAX_IDLE_PER_DATABASE = 4
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection that remembers which database file it was opened on.
+    """
+
+    identity: tuple = None
+
+
+class SQLiteConnectionPool:
+    """
+    Per-process pool of read-only sqlite3 connections, one list per database.
+
+    A single tile request used to open and close the same database several
+    times (dimension probing, file lookup, calculated variable dims). Pooled
+    connections keep SQLite's page cache, memory map and compiled statement
+    cache warm between those calls.
+
+    Connections are tied to the identity (device, inode) of the database
+    file. When the indexer replaces the file, the next acquire notices the
+    new inode and drops every connection to the old one.
+    """
+
+    def __init__(self, max_idle: int = MAX_IDLE_PER_DATABASE):
+        self._max_idle: int = max_idle
+        self._lock = threading.Lock()
+        # url -> list of idle connections
+        self._idle: defaultdict = defaultdict(list)
+
+    def acquire(self, url: str) -> PooledConnection:
+        """Returns an open read-only connection to the given database.
+
+        Arguments:
+            * url {str} -- Path to the sqlite database.
+
+        Returns:
+            PooledConnection -- Connection leased exclusively to the caller.
+                Hand it back with release().
+        """
+
+        identity = _get_identity(url)
+
+        with self._lock:
+            idle = self._idle[url]
+            while idle:
+                conn = idle.pop()
+                if conn.identity == identity:
+                    return conn
+                # Database file was replaced since this connection was opened.
+                conn.close()
+
+        conn = sqlite3.connect('file:{}?mode=ro'.format(url), uri=True,
+                               cached_statements=CACHED_STATEMENTS,
+                               check_same_thread=False,
+                               factory=PooledConnection)
+        try:
+            conn.execute("PRAGMA mmap_size = {};".format(MMAP_SIZE))
+            conn.execute("PRAGMA cache_size = {};".format(CACHE_SIZE))
+        except sqlite3.DatabaseError:
+            # Not a (readable) database. Like a plain sqlite3.connect, leave
+            # the error to the first query made on the connection.
+            pass
+        conn.identity = identity
+
+        return conn
+
+    def release(self, url: str, conn: PooledConnection) -> None:
+        """Returns a connection to the pool.
+        """
+
+        # Writes to TEMP tables open an implicit transaction, which would keep
+        # a shared lock on the database (and block the indexer) if left open.
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self._lock:
+            idle = self._idle[url]
+            if len(idle) < self._max_idle:
+                idle.append(conn)
+                return
+
+        conn.close()
+
+    def clear(self) -> None:
+        """Closes all idle connections."""
+
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+
+def _get_identity(url: str) -> tuple:
+    try:
+        st = os.stat(url)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+connection_pool = SQLiteConnectionPool()
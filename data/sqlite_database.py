@@ -2,9 +2,10 @@
 
 import itertools
 import re
-import sqlite3
 from typing import List
 
+from data.sqlite_connection_pool import connection_pool
+from data.timestamp_index import TimestampIndex, timestamp_index_cache
 from data.variable import Variable
 from data.variable_list import VariableList
 
@@ -17,23 +18,30 @@ class SQLiteDatabase:
     Note: databases are opened in READ-ONLY mode to prevent
     accidental writes. If you *really* need writes, this is not the
     class you're looking for. The URL parameter is treated as a URI.
+
+    Connections are leased from a per-process pool (see
+    data.sqlite_connection_pool) rather than opened on every __enter__.
     """
 
+    # SQLite's default limit on bound parameters is 999 on older builds.
+    MAX_INLINE_PARAMS = 500
+
     def __init__(self, url: str):
         self.url = url  # URL to sqlite database
-        # URI for opening in read-only mode
-        self.uri = 'file:{}?mode=ro'.format(url)
         self.conn = None  # sqlite connection handle
         self.c = None
 
     def __enter__(self):
-        self.conn = sqlite3.connect(self.uri, uri=True)
+        self.conn = connection_pool.acquire(self.url)
         self.c = self.conn.cursor()
 
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.conn.close()
+        self.c.close()
+        connection_pool.release(self.url, self.conn)
+        self.conn = None
+        self.c = None
 
     def __flatten_list(self, some_list: list) -> list:
         return list(itertools.chain(*some_list))
@@ -41,36 +49,71 @@ class SQLiteDatabase:
     def get_netcdf_files(self, timestamp: list, variable: list) -> List[str]:
         """Retrieves the netCDF files that are mapped to the given timestamp(s) and variable.
 
+        All (timestamp, variable) pairs are resolved with a single query. Short
+        lists are bound inline with IN (...), longer ones (e.g. multi-year
+        timeseries) are loaded into temp tables to stay under SQLite's bound
+        parameter limit.
+
         Arguments:
             * timestamp {list} -- List of raw netCDF time indices (e.g. 2195510400)
             * variable {list} -- List of the variables of interest (e.g. votemper)
 
         Returns:
-            * [list] -- List of netCDF file paths corresponding to given timestamp(s) and variable.
+            * [list] -- Distinct netCDF file paths corresponding to given timestamp(s)
+                and variable, ordered by their earliest matching timestamp.
         """
 
-        file_list = []
-
-        query = """
-        SELECT
-            filepath
-        FROM
-            TimestampVariableFilepath tvf
-            JOIN Filepaths fp ON tvf.filepath_id = fp.id
-            JOIN Variables v ON tvf.variable_id = v.id
-            JOIN Timestamps t ON tvf.timestamp_id = t.id
-        WHERE
-            variable = ?
-            AND timestamp = ?;
-        """
+        if not isinstance(timestamp, list):
+            timestamp = [timestamp]
+        if not isinstance(variable, list):
+            variable = [variable]
+
+        if not timestamp or not variable:
+            return []
+
+        if len(timestamp) + len(variable) <= self.MAX_INLINE_PARAMS:
+            timestamp_filter = "({})".format(",".join("?" * len(timestamp)))
+            variable_filter = "({})".format(",".join("?" * len(variable)))
+            params = (*variable, *timestamp)
+        else:
+            self.__load_temp_table("RequestedTimestamps", timestamp)
+            self.__load_temp_table("RequestedVariables", variable)
+            timestamp_filter = "(SELECT value FROM temp.RequestedTimestamps)"
+            variable_filter = "(SELECT value FROM temp.RequestedVariables)"
+            params = ()
 
-        for ts in timestamp:
-            for v in variable:
-                self.c.execute(query, (v, ts))
-                file_list.append(self.__flatten_list(self.c.fetchall()))
+        self.c.execute(
+            """
+            SELECT
+                filepath
+            FROM
+                TimestampVariableFilepath tvf
+                JOIN Filepaths fp ON tvf.filepath_id = fp.id
+                JOIN Variables v ON tvf.variable_id = v.id
+                JOIN Timestamps t ON tvf.timestamp_id = t.id
+            WHERE
+                variable IN {}
+                AND timestamp IN {}
+            GROUP BY
+                filepath
+            ORDER BY
+                MIN(timestamp) ASC,
+                filepath ASC;
+            """.format(variable_filter, timestamp_filter), params
+        )
+
+        return self.__flatten_list(self.c.fetchall())
 
-        # funky way to remove duplicates from the list: https://stackoverflow.com/a/7961390/2231969
-        return list(set(self.__flatten_list(file_list)))
+    def __load_temp_table(self, name: str, values: list) -> None:
+        # TEMP tables live in the connection's temp schema, so this
+        # works on read-only connections too.
+        self.c.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS {} (value PRIMARY KEY);".format(name))
+        self.c.execute("DELETE FROM temp.{};".format(name))
+        self.c.executemany(
+            "INSERT OR IGNORE INTO temp.{} VALUES (?);".format(name),
+            [(v, ) for v in values]
+        )
 
     def get_all_dimensions(self) -> List[str]:
         """Returns a list of all the dimensions in the Dimensions table.
@@ -151,23 +194,29 @@ class SQLiteDatabase:
 
         return result[0] if result else ""
 
-    def get_timestamps(self, variable: str) -> List[str]:
-        """Retrieves all timestamps for a given variable from the open database sorted in ascending order.
+    def get_timestamp_index(self, variable: str) -> TimestampIndex:
+        """Returns the sorted in-memory timestamp index for a given variable.
+
+        The index is cached per process and only re-read from the database
+        when the database changes (see data.timestamp_index).
 
         Arguments:
             * variable: Key of the variable of interest (e.g. votemper)
 
         Returns:
-            * [list] -- List of all raw netCDF timestamps for this database. Your problem to convert them to Datetime objects.
-            * None if variable string is empty
+            * TimestampIndex -- Index of all raw netCDF timestamps for this variable.
         """
 
-        if not variable:
-            return None
+        if isinstance(variable, list):
+            variable = variable[0]
 
+        return timestamp_index_cache.get(
+            self.url, variable, self.conn, lambda: self.__query_timestamps(variable))
+
+    def __query_timestamps(self, variable: str) -> list:
         self.c.execute(
             """
-            SELECT
+            SELECT DISTINCT
                 timestamp
             FROM
                 TimestampVariableFilepath tvf
@@ -183,6 +232,22 @@ class SQLiteDatabase:
 
         return self.__flatten_list(self.c.fetchall())
 
+    def get_timestamps(self, variable: str) -> List[str]:
+        """Retrieves all timestamps for a given variable from the open database sorted in ascending order.
+
+        Arguments:
+            * variable: Key of the variable of interest (e.g. votemper)
+
+        Returns:
+            * [list] -- List of all raw netCDF timestamps for this database. Your problem to convert them to Datetime objects.
+            * None if variable string is empty
+        """
+
+        if not variable:
+            return None
+
+        return self.get_timestamp_index(variable).tolist()
+
     def get_latest_timestamp(self, variable: str) -> int:
         """Returns the latest raw timestamp value for a given variable.
 
@@ -196,20 +261,7 @@ class SQLiteDatabase:
         if not variable:
             return None
 
-        self.c.execute(
-            """
-            SELECT
-                MAX(timestamp)
-            FROM
-                TimestampVariableFilepath tvf
-                JOIN Variables v ON tvf.variable_id = v.id
-                JOIN Timestamps t ON tvf.timestamp_id = t.id
-            WHERE
-                variable = ?;
-            """, (variable, )
-        )
-
-        return self.__flatten_list(self.c.fetchall())[0]
+        return self.get_timestamp_index(variable).latest()
 
     def get_earliest_timestamp(self, variable: str) -> int:
         """Returns the earliest raw timestamp value for a given variable.
@@ -224,20 +276,7 @@ class SQLiteDatabase:
         if not variable:
             return None
 
-        self.c.execute(
-            """
-            SELECT
-                MIN(timestamp)
-            FROM
-                TimestampVariableFilepath tvf
-                JOIN Variables v ON tvf.variable_id = v.id
-                JOIN Timestamps t ON tvf.timestamp_id = t.id
-            WHERE
-                variable = ?;
-            """, (variable, )
-        )
-
-        return self.__flatten_list(self.c.fetchall())[0]
+        return self.get_timestamp_index(variable).earliest()
 
     def get_timestamp_range(self, starttime: int, endtime: int, variable: str) -> List[int]:
         """Retrieves all raw timestamps in the interval [starttime, endtime] for a variable.
@@ -248,26 +287,10 @@ class SQLiteDatabase:
             variable {str} -- Variable of intereste (e.g. votemper)
 
         Returns:
-            [list] -- List of all timestamps in the given interval.
+            [list] -- List of all timestamps in the given interval, sorted in ascending order.
         """
 
-        self.c.execute(
-            """
-            SELECT DISTINCT
-                timestamp
-            FROM
-                TimestampVariableFilepath tvf
-                JOIN Variables v ON tvf.variable_id = v.id
-                JOIN Timestamps t ON tvf.timestamp_id = t.id
-            WHERE
-                variable = ?
-                AND timestamp BETWEEN ?
-                and ?;
-
-            """, (variable[0] if isinstance(variable, list) else variable, starttime, endtime, )
-        )
-
-        return self.__flatten_list(self.c.fetchall())
+        return self.get_timestamp_index(variable).range(starttime, endtime)
 
     def get_all_variables(self) -> VariableList:
         """Retrieves all variables from the open database (including depth, time, etc.)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Tuple
+
+from cachetools import LRUCache
+
+from utils.config import get_app_config
+
+# Used when the index is accessed outside of a Flask app context (e.g. from
+# scripts or unit tests). Can be overridden in oceannavigator.cfg.
+DEFAULT_PATH = "/tmp/oceannavigator/tile_slices.sqlite3"
+DEFAULT_MAX_ENTRIES = 4096
+
+
+class TileSliceIndex:
+    """
+    Persisted map from a map tile to the part of a model grid it reads.
+
+    A tile always covers the same lat/lon points, so the neighbour search
+    behind its bounding box (a k-nearest query for each of its 65536 pixels)
+    gives the same answer every time. Each entry records, for a grid (see
+    GridIndex.key), a neighbour count and a tile (projection, z, x, y, n),
+    the extent of the neighbour indices along each grid axis and the largest
+    neighbour distance. Callers pad the extent and derive the interpolation
+    radius from those. n is the size of the block of n x n tiles from tile
+    (x, y) (see plotting.tile.plot_metatile); it's 1 for single tiles, and
+    can be left out.
+
+    Entries are written when a tile is first rendered, or ahead of time by
+    scripts/seed_tile_slices.py, to a sqlite database shared by every worker
+    process, with an in-process LRU in front of it.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self._path: str = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._entries: LRUCache = LRUCache(maxsize=max_entries)
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @property
+    def path(self) -> str:
+        if self._path is not None:
+            return self._path
+        return get_app_config('TILE_SLICE_INDEX', DEFAULT_PATH)
+
+    def get(self, grid: str, neighbours: int, tile: tuple) -> Tuple[List[Tuple[int, int]], float]:
+        """Looks up the grid window of a tile.
+
+        Arguments:
+            * grid {str} -- GridIndex.key of the grid.
+            * neighbours {int} -- Neighbours per pixel of the search.
+            * tile {tuple} -- (projection, z, x, y) or (projection, z, x, y, n)
+
+        Returns:
+            Tuple[list, float] -- A (min, max) neighbour index pair per grid
+            axis and the largest neighbour distance, or None if the tile
+            hasn't been recorded.
+        """
+
+        key = _key(grid, neighbours, tile)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None:
+            try:
+                row = self.__connection().execute(
+                    "SELECT extents, distance FROM slices WHERE "
+                    "grid = ? AND neighbours = ? AND projection = ? AND "
+                    "z = ? AND x = ? AND y = ? AND n = ?;", key).fetchone()
+            except (sqlite3.Error, OSError):
+                row = None
+
+            if row is not None:
+                entry = ([tuple(e) for e in json.loads(row[0])], row[1])
+                with self._lock:
+                    self._entries[key] = entry
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return entry
+
+    def put(self, grid: str, neighbours: int, tile: tuple,
+            extents: List[Tuple[int, int]], distance: float) -> None:
+        """Records the grid window of a tile (see get)."""
+
+        key = _key(grid, neighbours, tile)
+        entry = ([(int(mn), int(mx)) for mn, mx in extents], float(distance))
+
+        with self._lock:
+            self._entries[key] = entry
+
+        try:
+            conn = self.__connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO slices VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                    key + (json.dumps(entry[0]), entry[1]))
+        except (sqlite3.Error, OSError):
+            # Read-only or locked for too long; the entry stays in memory.
+            pass
+
+    def clear(self) -> None:
+        """Drops the in-process entries (the database is kept)."""
+
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def __connection(self) -> sqlite3.Connection:
+        path = self.path
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.path == path:
+            return conn
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS slices ("
+            "grid TEXT, neighbours INTEGER, projection TEXT, "
+            "z INTEGER, x INTEGER, y INTEGER, n INTEGER, "
+            "extents TEXT, distance REAL, "
+            "PRIMARY KEY (grid, neighbours, projection, z, x, y, n)"
+            ") WITHOUT ROWID;")
+
+        self._local.conn = conn
+        self._local.path = path
+
+        return conn
+
+
+def _key(grid: str, neighbours: int, tile: tuple) -> tuple:
+    tile = tuple(tile)
+    if len(tile) == 4:
+        tile += (1, )
+
+    return (grid, neighbours) + tile
+
+
+# The index shared by all requests handled by this worker process.
+tile_slice_index = TileSliceIndex()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+import os
+import threading
+import weakref
+from typing import List
+
+import numpy as np
+from cachetools import LRUCache
+
+
+class TimestampIndex:
+    """
+    Sorted, de-duplicated array of the raw timestamps of one variable in one
+    dataset index. Lookups are binary searches over the array instead of
+    queries against TimestampVariableFilepath.
+    """
+
+    def __init__(self, timestamps: np.ndarray):
+        self.timestamps: np.ndarray = np.unique(timestamps)
+        self.timestamps.setflags(write=False)
+
+    def __len__(self) -> int:
+        return self.timestamps.size
+
+    def __getitem__(self, key):
+        return self.timestamps[key].tolist()
+
+    def tolist(self) -> list:
+        return self.timestamps.tolist()
+
+    def earliest(self):
+        return self.timestamps[0].item() if self.timestamps.size else None
+
+    def latest(self):
+        return self.timestamps[-1].item() if self.timestamps.size else None
+
+    def find_le(self, x):
+        """Right-most timestamp <= x. If x is before every timestamp,
+        the earliest one is returned (same contract as data.utils.find_le).
+        """
+
+        i = np.searchsorted(self.timestamps, x, side='right')
+        return self.timestamps[i - 1 if i else 0].item()
+
+    def range(self, starttime, endtime) -> List:
+        """All timestamps in the closed interval [starttime, endtime]."""
+
+        lo = np.searchsorted(self.timestamps, starttime, side='left')
+        hi = np.searchsorted(self.timestamps, endtime, side='right')
+        return self.timestamps[lo:hi].tolist()
+
+
+class TimeCoordinateIndex:
+    """
+    Sorted view of the time coordinate of an open dataset, for mapping raw
+    timestamps back to positions along the time dimension.
+
+    exact() and range() return positions in ascending order, i.e. in the
+    order np.nonzero over the time coordinate would give them.
+    """
+
+    def __init__(self, values: np.ndarray):
+        values = np.asarray(values).ravel()
+        self._order: np.ndarray = np.argsort(values, kind='mergesort')
+        self._sorted: np.ndarray = values[self._order]
+
+    def __len__(self) -> int:
+        return self._sorted.size
+
+    def exact(self, timestamp, rtol: float = 0, atol: float = 0) -> np.ndarray:
+        """Positions of all time values matching any of the given timestamps.
+
+        Arguments:
+            * timestamp {int, float or list} -- Raw timestamp(s).
+            * rtol, atol {float} -- Tolerances with the meaning of np.isclose,
+                for floating-point time coordinates. Exact match by default.
+
+        Returns:
+            np.ndarray -- Sorted positions (may be empty).
+        """
+
+        timestamp = np.atleast_1d(timestamp)
+        tol = atol + rtol * np.abs(timestamp)
+
+        lo = np.searchsorted(self._sorted, timestamp - tol, side='left')
+        hi = np.searchsorted(self._sorted, timestamp + tol, side='right')
+
+        return self.__gather(lo, hi)
+
+    def nearest(self, timestamp) -> np.ndarray:
+        """Positions of the time values closest to each of the given timestamps.
+
+        Returns:
+            np.ndarray -- One position per requested timestamp, in request order.
+        """
+
+        timestamp = np.atleast_1d(timestamp)
+        right = np.clip(np.searchsorted(self._sorted, timestamp), 1,
+                        self._sorted.size - 1) if self._sorted.size > 1 \
+            else np.zeros(timestamp.shape, dtype=np.intp)
+        left = np.maximum(right - 1, 0)
+
+        closer_left = np.abs(timestamp - self._sorted[left]) <= \
+            np.abs(self._sorted[right] - timestamp)
+
+        return self._order[np.where(closer_left, left, right)]
+
+    def range(self, starttime, endtime) -> np.ndarray:
+        """Positions of all time values in the closed interval [starttime, endtime].
+
+        Returns:
+            np.ndarray -- Sorted positions (may be empty).
+        """
+
+        lo = np.searchsorted(self._sorted, starttime, side='left')
+        hi = np.searchsorted(self._sorted, endtime, side='right')
+
+        return np.sort(self._order[lo:hi])
+
+    def __gather(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        counts = hi - lo
+        if np.all(counts <= 1):
+            # Common case: time values are unique.
+            return np.unique(self._order[lo[counts == 1]])
+
+        return np.unique(np.concatenate(
+            [self._order[l:h] for l, h in zip(lo, hi)]))
+
+
+class TimestampIndexCache:
+    """
+    Per-process cache of TimestampIndex objects keyed by (database, variable).
+
+    An entry is rebuilt when either
+        * the database file (or its -wal file) changed size, mtime or inode, or
+        * PRAGMA data_version reported a commit by another connection since
+          the same connection last saw the entry.
+
+    data_version is only comparable between reads on one connection, which is
+    why the values seen are remembered per (pooled) connection.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self._lock = threading.Lock()
+        self._cache: LRUCache = LRUCache(maxsize=maxsize)
+
+    def get(self, url: str, variable: str, conn, loader) -> TimestampIndex:
+        """Returns the cached index for `variable`, calling `loader()` to
+        fetch the raw timestamps when the entry is missing or stale.
+        """
+
+        key = (url, variable)
+        signature = _get_signature(url)
+        data_version = _get_data_version(conn)
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry.signature == signature:
+                seen = entry.data_versions.get(conn)
+                if seen is None or seen == data_version:
+                    entry.data_versions[conn] = data_version
+                    return entry.index
+
+        entry = _Entry(signature, TimestampIndex(np.asarray(loader())))
+        entry.data_versions[conn] = data_version
+
+        with self._lock:
+            self._cache[key] = entry
+
+        return entry.index
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+class _Entry:
+
+    def __init__(self, signature: tuple, index: TimestampIndex):
+        self.signature: tuple = signature
+        self.index: TimestampIndex = index
+        self.data_versions = weakref.WeakKeyDictionary()
+
+
+def _get_signature(url: str) -> tuple:
+    signature = []
+    for path in (url, url + "-wal"):
+        try:
+            st = os.stat(path)
+        except OSError:
+            signature.append(None)
+            continue
+        signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+
+def _get_data_version(conn) -> int:
+    return conn.execute("PRAGMA data_version;").fetchone()[0]
+
+
+timestamp_index_cache = TimestampIndexCache()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+import os
+import threading
+from typing import Callable, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+
+from data.grid_index import (GridIndex, GridIndexCache, _to_triples,
+                             grid_index_cache, load_array, mesh_key,
+                             save_array)
+
+DEFAULT_MAX_MESHES = 4
+
+# Centroids tried per target before widening the search (see locate).
+CANDIDATES = 8
+MAX_CANDIDATES = 128
+
+# Barycentric weights down to -EPSILON still count as inside, so points on a
+# shared edge or node aren't lost to rounding.
+EPSILON = 1e-9
+
+
+class TriangleIndex:
+    """
+    Point location on a triangular (FVCOM) mesh.
+
+    Each target is placed in the triangle that contains it, along with its
+    barycentric weights, so a value at the target is the weighted sum of the
+    values at the triangle's three nodes -- no neighbour search over the
+    surrounding nodes, and no reads beyond those nodes.
+
+    Triangles are found by testing the ones whose centroids are nearest to
+    the target (a KD-tree over the centroids, see GridIndex). Weights are
+    computed on the unit sphere, i.e. in the gnomonic projection about the
+    target, so they are exact for the great circle edges of the triangle.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, triangles: np.ndarray,
+                 cache: GridIndexCache = None):
+        """
+        Arguments:
+            * lat {np.ndarray} -- Node latitudes.
+            * lon {np.ndarray} -- Node longitudes.
+            * triangles {np.ndarray} -- Zero-based node indices of each
+                element, of shape (elements, 3).
+            * cache {GridIndexCache} -- Defaults to grid_index_cache.
+        """
+
+        self.triangles: np.ndarray = triangles
+        self._nodes: np.ndarray = _to_triples(
+            np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+
+        centroids = self._nodes[triangles].sum(axis=1)
+        centroids /= np.linalg.norm(centroids, axis=1)[:, np.newaxis]
+        clat = np.degrees(np.arcsin(np.clip(centroids[:, 2], -1, 1)))
+        clon = np.degrees(np.arctan2(centroids[:, 1], centroids[:, 0]))
+
+        self._centroids: GridIndex = GridIndex(
+            clat, clon, unstructured=True, cache=cache)
+
+    def locate(self, lat, lon) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the triangle containing each lat/lon pair.
+
+        Arguments:
+            * lat -- Target latitude(s).
+            * lon -- Target longitude(s).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray] -- The element index of each target
+            (-1 if it is outside of the mesh), and its weights for the three
+            nodes of that element, of shape (targets, 3).
+        """
+
+        lat = np.ravel(np.asarray(lat, dtype=np.float64))
+        lon = np.ravel(np.asarray(lon, dtype=np.float64))
+        q = _to_triples(lat, lon)
+
+        elements = np.full(lat.shape, -1, dtype=np.int64)
+        weights = np.zeros(lat.shape + (3, ))
+
+        todo = np.arange(lat.size)
+        k = CANDIDATES
+        while todo.size and k <= MAX_CANDIDATES:
+            k = min(k, self.triangles.shape[0])
+            _, (candidates, ) = self._centroids.nearest(lat[todo], lon[todo], k)
+            candidates = candidates.reshape(todo.size, k)
+
+            found, w = self.__test(q[todo], candidates)
+            hit = found >= 0
+
+            elements[todo[hit]] = candidates[hit, found[hit]]
+            weights[todo[hit]] = w[hit]
+
+            if k == self.triangles.shape[0]:
+                break
+            todo = todo[~hit]
+            k *= 4
+
+        return elements, weights
+
+    def __test(self, q: np.ndarray, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Nodes of each candidate, (targets, k, 3 nodes, xyz)
+        v = self._nodes[self.triangles[candidates]]
+        a, b, c = v[:, :, 0], v[:, :, 1], v[:, :, 2]
+        q = q[:, np.newaxis, :]
+
+        # Solves q = la * a + lb * b + lc * c by Cramer's rule.
+        det = np.einsum('ijk,ijk->ij', a, np.cross(b, c))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lam = np.stack([
+                np.einsum('ijk,ijk->ij', q, np.cross(b, c)),
+                np.einsum('ijk,ijk->ij', a, np.cross(q, c)),
+                np.einsum('ijk,ijk->ij', a, np.cross(b, q)),
+            ], axis=-1) / det[..., np.newaxis]
+
+            total = lam.sum(axis=-1)
+            lam /= total[..., np.newaxis]
+
+        # A positive total rules out the antipode of the triangle.
+        inside = np.all(lam >= -EPSILON, axis=-1) & (total > 0)
+
+        # Candidates are ordered by centroid distance; take the first hit.
+        found = np.where(inside.any(axis=1), np.argmax(inside, axis=1), -1)
+        w = lam[np.arange(q.shape[0]), np.maximum(found, 0)]
+
+        return found, np.clip(w, 0, 1)
+
+    def interpolate(self, read: Callable[[np.ndarray], np.ndarray],
+                    elements: np.ndarray, weights: np.ndarray,
+                    nodes: bool = True) -> np.ma.MaskedArray:
+        """Interpolates a variable to located targets (see locate).
+
+        Arguments:
+            * read {Callable} -- Takes a sorted array of node (or element)
+                indices and returns the variable at those indices, along its
+                last axis.
+            * elements {np.ndarray} -- Element of each target.
+            * weights {np.ndarray} -- Node weights of each target.
+            * nodes {bool} -- The variable is defined on nodes. Otherwise it
+                is defined on elements and the containing element's value is
+                used.
+
+        Returns:
+            np.ma.MaskedArray -- The variable at the targets, with the target
+            axis last. Targets outside the mesh are masked, and so are nodes
+            with missing data (the remaining weights are renormalized).
+        """
+
+        inside = elements >= 0
+        if nodes:
+            columns = self.triangles[elements[inside]]
+            w = weights[inside]
+        else:
+            columns = elements[inside][:, np.newaxis]
+            w = np.ones(columns.shape)
+
+        unique, inverse = np.unique(columns, return_inverse=True)
+        # Something has to be read to learn the shape of the other axes.
+        values = np.ma.masked_invalid(np.ma.asarray(
+            read(unique if unique.size else np.array([0]))))
+        values = values[..., inverse.reshape(columns.shape)]
+
+        w = np.ma.array(np.broadcast_to(w, values.shape),
+                        mask=np.ma.getmaskarray(values))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (values * w).sum(axis=-1) / w.sum(axis=-1)
+
+        output = np.ma.masked_all(values.shape[:-2] + inside.shape,
+                                  dtype=np.float64)
+        output[..., inside] = result
+
+        return output
+
+
+class TriangleIndexCache:
+    """
+    TriangleIndex instances by mesh, so each worker process builds the index
+    of a mesh once. The connectivity of each mesh (converted to zero-based
+    node indices) is written to <grid index cache dir>/<hash>.tri.npy and
+    memory-mapped afterwards, and the centroid KD-tree is cached by
+    grid_index_cache.
+    """
+
+    def __init__(self, cache: GridIndexCache = None,
+                 max_meshes: int = DEFAULT_MAX_MESHES):
+        self._cache: GridIndexCache = cache if cache is not None else grid_index_cache
+        self._lock = threading.Lock()
+        self._indices: LRUCache = LRUCache(maxsize=max_meshes)
+
+    def get(self, latvar, lonvar, nv: Callable[[], np.ndarray]) -> TriangleIndex:
+        """Returns the TriangleIndex of a mesh.
+
+        Arguments:
+            * latvar -- Node latitude variable.
+            * lonvar -- Node longitude variable.
+            * nv {Callable} -- Returns the one-based connectivity of the mesh,
+                of shape (3, elements). Only called if it isn't cached.
+
+        Returns:
+            TriangleIndex -- The index.
+        """
+
+        lat = np.squeeze(np.asarray(latvar[:]))
+        lon = np.squeeze(np.asarray(lonvar[:]))
+        key = mesh_key(lat, lon, unstructured=True)
+
+        with self._lock:
+            index = self._indices.get(key)
+        if index is not None:
+            return index
+
+        path = os.path.join(self._cache.cache_dir, key + ".tri.npy")
+        triangles = load_array(path)
+        if triangles is None:
+            triangles = np.ascontiguousarray(
+                np.asarray(nv(), dtype=np.int32).transpose() - 1)
+            save_array(path, triangles)
+
+        index = TriangleIndex(lat, lon, triangles, self._cache)
+
+        with self._lock:
+            self._indices[key] = index
+
+        return index
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indices.clear()
+
+
+# The cache shared by all requests handled by this worker process.
+triangle_index_cache = TriangleIndexCache()
@@ -6,6 +6,10 @@ import re
 
 from flask import current_app
 
+# Request kinds that can have their own "open_profiles" entry.
+REQUEST_KINDS = ("tile", "area", "timeseries", "subset")
+DASK_SCHEDULERS = ("sync", "threads")
+
 
 class DatasetConfig():
     """Access class for the dataset configuration"""
@@ -131,6 +135,45 @@ class DatasetConfig():
 
         return cache
 
+    def open_profile(self, request_kind: str = None) -> dict:
+        """
+        Returns the settings used to open the dataset's netCDF files for a
+        kind of request, as defined in the "open_profiles" section of the
+        dataset config file. E.g.:
+
+            "open_profiles": {
+                "default": {"parallel": true},
+                "tile": {"chunks": {"time_counter": 1, "y": 256, "x": 256}, "scheduler": "sync"},
+                "timeseries": {"chunks": {"time_counter": -1, "y": 32, "x": 32}}
+            }
+
+        Entries for the request kind override the "default" entry. Anything
+        not set falls back to the xarray/dask defaults.
+
+        Arguments:
+            request_kind {str} -- One of REQUEST_KINDS, or None for the default profile.
+
+        Returns:
+            dict -- "chunks" (dict or None), "parallel" (bool) and "scheduler"
+            ("sync", "threads" or None).
+        """
+        if request_kind is not None and request_kind not in REQUEST_KINDS:
+            raise ValueError("Unknown request kind: %s" % request_kind)
+
+        profiles = self._get_attribute("open_profiles") or {}
+
+        profile = {"chunks": None, "parallel": False, "scheduler": None}
+        profile.update(profiles.get("default", {}))
+        if request_kind is not None:
+            profile.update(profiles.get(request_kind, {}))
+
+        if profile["scheduler"] is not None and \
+                profile["scheduler"] not in DASK_SCHEDULERS:
+            raise ValueError("Unknown dask scheduler for %s: %s" %
+                             (self._dataset_key, profile["scheduler"]))
+
+        return profile
+
     @property
     def variables(self) -> list:
         """
@@ -55,6 +55,7 @@ export default class Options extends React.Component {
               >
                 <option value="gaussian">{_("Gaussian Weighting (Default)")}</option>
                 <option value="bilinear">{_("Bilinear")}</option>
+                <option value="exact_bilinear">{_("Exact Bilinear")}</option>
                 <option value="inverse">{_("Inverse Square")}</option>
                 <option value="nearest">{_("Nearest Neighbour")}</option>
               </FormControl>
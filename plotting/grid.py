@@ -1,10 +1,10 @@
-from math import pi, radians, degrees
+from math import radians, degrees
 import numpy as np
-from pykdtree.kdtree import KDTree
 import geopy
 from geopy.distance import VincentyDistance
 import scipy.interpolate
 import itertools
+import threading
 from pyresample.geometry import SwathDefinition
 from pyresample.kd_tree import resample_custom, resample_nearest
 from cachetools import LRUCache
@@ -12,8 +12,13 @@ import pytz
 import cftime
 from bisect import bisect_left
 import plotting.utils
+from data.grid_index import GridIndex
+from utils.compute_resources import compute_resources
 
-_data_cache = LRUCache(maxsize=16)
+# GridIndex hashes the whole lat/lon mesh to find its KD-tree, so keep the
+# index of each file around instead of rebuilding it for every Grid.
+_index_cache = LRUCache(maxsize=16)
+_index_lock = threading.Lock()
 
 class Grid(object):
 
@@ -29,20 +34,14 @@ class Grid(object):
 
         self.time_var = utils.get_time_var(ncfile)
 
-        self.kdt = _data_cache.get(ncfile.filepath())
-        if self.kdt is None:
-            rad_factor = pi / 180.0
-            latvals = self.latvar[:] * rad_factor
-            lonvals = self.lonvar[:] * rad_factor
-            clat, clon = np.cos(latvals), np.cos(lonvals)
-            slat, slon = np.sin(latvals), np.sin(lonvals)
-            triples = np.array([np.ravel(clat * clon), np.ravel(clat * slon),
-                                np.ravel(slat)]).transpose()
-
-            self.kdt = KDTree(triples)
-            _data_cache[ncfile.filepath()] = self.kdt
-
-        self._shape = ncfile.variables[latvarname].shape
+        key = (ncfile.filepath(), latvarname, lonvarname)
+        with _index_lock:
+            self.index = _index_cache.get(key)
+        if self.index is None:
+            self.index = GridIndex(self.latvar, self.lonvar)
+            with _index_lock:
+                _index_cache[key] = self.index
+        self._shape = self.index.shape
 
     def find_index(self, lat0, lon0, n=1):
         """Finds the y,x indicies that are closest to a latitude, longitude
@@ -56,50 +55,11 @@ class Grid(object):
         Returns:
             y, x indices
         """
-        if hasattr(lat0, "__len__"):
-            lat0 = np.array(lat0)
-            lon0 = np.array(lon0)
-            multiple = True
-        else:
-            multiple = False
-        rad_factor = pi / 180.0
-        lat0_rad = lat0 * rad_factor
-        lon0_rad = lon0 * rad_factor
-        clat0, clon0 = np.cos(lat0_rad), np.cos(lon0_rad)
-        slat0, slon0 = np.sin(lat0_rad), np.sin(lon0_rad)
-        q = [clat0 * clon0, clat0 * slon0, slat0]
-        if multiple:
-            q = np.array(q).transpose()
-        dist_sq_min, minindex_1d = self.kdt.query(np.float32(q), k=n)
-        iy_min, ix_min = np.unravel_index(minindex_1d, self._shape)
+        _, (iy_min, ix_min) = self.index.nearest(lat0, lon0, n)
         return iy_min, ix_min
 
     def bounding_box(self, lat, lon, n=10):
-        y, x = self.find_index(np.array(lat).ravel(), np.array(lon).ravel(), n)
-        miny, maxy = np.amin(y), np.amax(y)
-        minx, maxx = np.amin(x), np.amax(x)
-
-        def fix_limits(data, limit):
-            max = np.amax(data)
-            min = np.amin(data)
-            delta = max - min
-
-            if delta < 2:
-                min -= 2
-                max += 2
-
-            min = int(min - delta / 4.0)
-            if min < 0:
-                min = 0
-
-            max = int(max + delta / 4.0)
-            if max > limit:
-                max = limit - 1
-
-            return min, max
-
-        miny, maxy = fix_limits(y, self.latvar.shape[0])
-        minx, maxx = fix_limits(x, self.latvar.shape[1])
+        (miny, maxy), (minx, maxx) = self.index.bounding_box(lat, lon, n)[0]
 
         return miny, maxy, minx, maxx
 
@@ -165,8 +125,7 @@ class Grid(object):
                     data[:, :, d],
                     method=method,
                     neighbours=neighbours,
-                    radius_of_influence=radius,
-                    nprocs=4
+                    radius_of_influence=radius
                 )
             )
         resampled = np.ma.vstack(resampled)
@@ -249,8 +208,7 @@ class Grid(object):
                                      data,
                                      method=method,
                                      neighbours=neighbours,
-                                     radius_of_influence=radius,
-                                     nprocs=4))
+                                     radius_of_influence=radius))
         combined = np.ma.array(combined)
 
         if mintime + 1 >= len(ts):
@@ -303,7 +261,10 @@ def _fill_invalid_shift(z):
 
 
 def resample(in_lat, in_lon, out_lat, out_lon, data, method='inv_square',
-             neighbours=8, radius_of_influence=500000, nprocs=4):
+             neighbours=8, radius_of_influence=500000, nprocs=None):
+    if nprocs is None:
+        nprocs = compute_resources.threads
+
     masked_lat = in_lat.view(np.ma.MaskedArray)
     masked_lon = in_lon.view(np.ma.MaskedArray)
     masked_lon.mask = masked_lat.mask = data.view(np.ma.MaskedArray).mask
@@ -311,38 +272,39 @@ def resample(in_lat, in_lon, out_lat, out_lon, data, method='inv_square',
     input_def = SwathDefinition(lons=masked_lon, lats=masked_lat)
     target_def = SwathDefinition(lons=out_lon, lats=out_lat)
 
-    if method == 'inv_square':
-        res = resample_custom(
-            input_def,
-            data,
-            target_def,
-            radius_of_influence=radius_of_influence,
-            neighbours=neighbours,
-            weight_funcs=lambda r: 1 / np.clip(r, 0.0625,
-                                               np.finfo(r.dtype).max) ** 2,
-            fill_value=None,
-            nprocs=nprocs)
-    elif method == 'bilinear':
-        res = resample_custom(
-            input_def,
-            data,
-            target_def,
-            radius_of_influence=radius_of_influence,
-            neighbours=4,
-            weight_funcs=lambda r: 1 / np.clip(r, 0.0625,
-                                               np.finfo(r.dtype).max),
-            fill_value=None,
-            nprocs=nprocs)
-    elif method == 'nn':
-        res = resample_nearest(
-            input_def,
-            data,
-            target_def,
-            radius_of_influence=radius_of_influence,
-            fill_value=None,
-            nprocs=nprocs)
-    else:
-        raise ValueError("Unknown resample method: %s", method)
+    with compute_resources.openmp_limits():
+        if method == 'inv_square':
+            res = resample_custom(
+                input_def,
+                data,
+                target_def,
+                radius_of_influence=radius_of_influence,
+                neighbours=neighbours,
+                weight_funcs=lambda r: 1 / np.clip(r, 0.0625,
+                                                   np.finfo(r.dtype).max) ** 2,
+                fill_value=None,
+                nprocs=nprocs)
+        elif method == 'bilinear':
+            res = resample_custom(
+                input_def,
+                data,
+                target_def,
+                radius_of_influence=radius_of_influence,
+                neighbours=4,
+                weight_funcs=lambda r: 1 / np.clip(r, 0.0625,
+                                                   np.finfo(r.dtype).max),
+                fill_value=None,
+                nprocs=nprocs)
+        elif method == 'nn':
+            res = resample_nearest(
+                input_def,
+                data,
+                target_def,
+                radius_of_influence=radius_of_influence,
+                fill_value=None,
+                nprocs=nprocs)
+        else:
+            raise ValueError("Unknown resample method: %s", method)
 
     if type(res.mask) == bool:
         res.mask = np.tile(res.mask, len(res))
@@ -56,7 +56,7 @@ class HovmollerPlotter(LinePlotter):
             return (depth, depth_value, depth_unit)
 
         # Load left/Main Map
-        with open_dataset(self.dataset_config, timestamp=self.starttime, endtime=self.endtime, variable=self.variables) as dataset:
+        with open_dataset(self.dataset_config, timestamp=self.starttime, endtime=self.endtime, variable=self.variables, request_kind='timeseries') as dataset:
 
             self.depth, self.depth_value, self.depth_unit = find_depth(
                 self.depth, len(dataset.depths) - 1, dataset)
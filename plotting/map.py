@@ -8,6 +8,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import osr
 import pyresample.utils
+from flask import current_app
 from flask_babel import gettext
 from geopy.distance import VincentyDistance
 from matplotlib.bezier import concatenate_paths
@@ -185,7 +186,13 @@ class MapPlotter(Plotter):
 
         self.longitude, self.latitude = self.basemap.makegrid(gridx, gridy)
 
-        with open_dataset(self.dataset_config, variable=self.variables, timestamp=self.time) as dataset:
+        # float32 (AREA_DTYPE) halves the memory of the grids below
+        dtype = current_app.config.get('AREA_DTYPE')
+        if dtype is not None:
+            self.longitude = self.longitude.astype(dtype)
+            self.latitude = self.latitude.astype(dtype)
+
+        with open_dataset(self.dataset_config, variable=self.variables, timestamp=self.time, request_kind='area') as dataset:
 
             if len(self.variables) > 1:
                 self.variable_unit = self.get_vector_variable_unit(
@@ -237,7 +244,8 @@ class MapPlotter(Plotter):
                         self.interp,
                         self.radius,
                         self.neighbours,
-                        return_depth=True
+                        return_depth=True,
+                        dtype=dtype
                     )
                 else:
                     d = dataset.get_area(
@@ -247,7 +255,8 @@ class MapPlotter(Plotter):
                         v,
                         self.interp,
                         self.radius,
-                        self.neighbours
+                        self.neighbours,
+                        dtype=dtype
                     )
 
                 d = np.multiply(d, scale_factor)
@@ -289,6 +298,7 @@ class MapPlotter(Plotter):
                         self.interp,
                         self.radius,
                         self.neighbours,
+                        dtype=dtype,
                     )
                     quiver_data.append(d)
                     # Get the quiver data on the same grid as the main
@@ -301,6 +311,7 @@ class MapPlotter(Plotter):
                         self.interp,
                         self.radius,
                         self.neighbours,
+                        dtype=dtype,
                     )
                     quiver_data_fullgrid.append(d)
 
@@ -328,6 +339,7 @@ class MapPlotter(Plotter):
                     self.interp,
                     self.radius,
                     self.neighbours,
+                    dtype=dtype,
                 )
                 vc = self.dataset_config.variable[self.contour['variable']]
                 contour_unit = vc.unit
@@ -346,7 +358,7 @@ class MapPlotter(Plotter):
             self.variable_name += " Difference"
             self.cmap = cmap = colormap.find_colormap(self.compare.get('colormap_diff'))
             compare_config = DatasetConfig(self.compare['dataset'])
-            with open_dataset(compare_config, variable=self.compare['variables'], timestamp=self.compare['time']) as dataset:
+            with open_dataset(compare_config, variable=self.compare['variables'], timestamp=self.compare['time'], request_kind='area') as dataset:
                 data = []
                 for v in self.compare['variables']:
                     var = dataset.variables[v]
@@ -358,6 +370,7 @@ class MapPlotter(Plotter):
                         self.interp,
                         self.radius,
                         self.neighbours,
+                        dtype=dtype,
                     )
                     data.append(d)
 
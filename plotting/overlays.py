@@ -9,6 +9,8 @@ import threading
 from flask import current_app
 import os
 
+from utils.compute_resources import compute_resources
+
 _bathymetry_cache = LRUCache(maxsize=256 * 1024 * 1024, getsizeof=len)
 
 
@@ -69,12 +71,13 @@ def bathymetry(basemap, target_lat, target_lon, blur=None):
                 lons=target_lon.astype(np.float64),
                 lats=target_lat.astype(np.float64))
 
-            data = pyresample.kd_tree.resample_nearest(
-                orig_def, res,
-                target_def,
-                radius_of_influence=500000,
-                fill_value=None,
-                nprocs=4)
+            with compute_resources.openmp_limits():
+                data = pyresample.kd_tree.resample_nearest(
+                    orig_def, res,
+                    target_def,
+                    radius_of_influence=500000,
+                    fill_value=None,
+                    nprocs=compute_resources.threads)
 
             def do_save(filename, data):
                 np.save(filename, data.filled())
@@ -23,7 +23,7 @@ class StickPlotter(PointPlotter):
 
         self.depth = sorted(self.depth)
 
-        with open_dataset(self.dataset_config, timestamp=self.starttime, endtime=self.endtime, variable=self.variables) as dataset:
+        with open_dataset(self.dataset_config, timestamp=self.starttime, endtime=self.endtime, variable=self.variables, request_kind='timeseries') as dataset:
 
             self.load_misc(dataset, self.variables)
             self.variable_name = self.get_vector_variable_name(dataset,
@@ -1,4 +1,5 @@
 import contextlib
+import functools
 import math
 import os
 import re
@@ -13,20 +14,24 @@ from flask import current_app
 from flask_babel import gettext
 from matplotlib.colorbar import ColorbarBase
 from matplotlib.ticker import ScalarFormatter
-from netCDF4 import Dataset
 from PIL import Image
 from pyproj import Proj
-from scipy.ndimage.filters import gaussian_filter
 from skimage import measure
 from data.utils import datetime_to_timestamp, string_to_datetime
 
 import plotting.colormap as colormap
 import plotting.utils as utils
 from data import open_dataset
+from data.etopo_cache import BLURRED, etopo_cache
 from data.sqlite_database import SQLiteDatabase
 from oceannavigator import DatasetConfig
 
 
+# Land is masked out of data tiles below this zoom; above it, land is drawn
+# by the vector tiles.
+LAND_MASK_ZOOM = 8
+
+
 def deg2num(lat_deg, lon_deg, zoom):
     lat_rad = math.radians(lat_deg)
     n = 2.0 ** zoom
@@ -181,6 +186,56 @@ def scale(args):
     return buf
 
 
+def get_metatile(x, y, z, size):
+    """
+    Returns (x, y, n) of the n x n block of tiles that tile (x, y) is part of
+    when tiles are rendered size x size at a time. Blocks are aligned to
+    multiples of size (rounded down to a power of 2, so they tile the map)
+    and are smaller at zooms with fewer tiles.
+    """
+    n = min(2 ** int(math.log2(max(size, 1))), 2 ** z)
+    return x - x % n, y - y % n, n
+
+
+def get_metatile_latlon_coords(projection, x, y, z, n):
+    """
+    Returns the lat/lon of the pixels of the n x n tiles from (x, y), as two
+    (256n, 256n) arrays indexed like those of a single tile ([x, y] pixels).
+    Each tile's block holds exactly the points of get_latlon_coords, so a
+    tile cut from a metatile is the tile rendered on its own.
+    """
+    lat = np.empty((256 * n, 256 * n))
+    lon = np.empty((256 * n, 256 * n))
+
+    for i in range(n):
+        for j in range(n):
+            tile_lat, tile_lon = get_latlon_coords(projection, x + i, y + j, z)
+            if len(tile_lat.shape) == 1:
+                tile_lat, tile_lon = np.meshgrid(tile_lat, tile_lon)
+
+            block = np.s_[256 * i:256 * (i + 1), 256 * j:256 * (j + 1)]
+            lat[block] = tile_lat
+            lon[block] = tile_lon
+
+    return lat, lon
+
+
+@functools.lru_cache(maxsize=1)
+def _blank_png() -> bytes:
+    buf = BytesIO()
+    Image.fromarray(np.zeros((256, 256, 4), np.uint8)).save(
+        buf, format='PNG', optimize=True)
+    return buf.getvalue()
+
+
+def blank_tile():
+    """
+    Returns a fully transparent tile, as plot renders tiles that are all
+    land. The PNG is encoded once per process.
+    """
+    return BytesIO(_blank_png())
+
+
 def plot(projection, x, y, z, args):
     """
     Returns a tile which displays specified data in colour
@@ -194,9 +249,28 @@ def plot(projection, x, y, z, args):
 
     """
 
-    lat, lon = get_latlon_coords(projection, x, y, z)
-    if len(lat.shape) == 1:
-        lat, lon = np.meshgrid(lat, lon)
+    return plot_metatile(projection, x, y, z, args, 1)[(x, y)]
+
+
+def plot_metatile(projection, x, y, z, args, size):
+    """
+    Renders the tiles of the size x size metatile (see get_metatile) that
+    tile (x, y) is part of, as plot does. The data of all of them is
+    extracted by one get_area call, so the dataset is read and resampled
+    once rather than once per tile.
+
+    Returns a dict of {(x, y): BytesIO} with a PNG per tile.
+    """
+
+    x0, y0, n = get_metatile(x, y, z, size)
+    tiles = [(x0 + i, y0 + j) for i in range(n) for j in range(n)]
+
+    # Land at the surface is land at every depth, so these don't need the
+    # dataset at all
+    if z < LAND_MASK_ZOOM and etopo_cache.is_land(projection, z, x0, y0, 0, n):
+        return {tile: blank_tile() for tile in tiles}
+
+    lat, lon = get_metatile_latlon_coords(projection, x0, y0, z, n)
 
     dataset_name = args.get('dataset')
     config = DatasetConfig(dataset_name)
@@ -211,8 +285,21 @@ def plot(projection, x, y, z, args):
 
     time = args.get('time')
 
+    # float32 halves the memory of the tile's resampling, scaling and
+    # colouring
+    dtype = current_app.config.get('AREA_DTYPE')
+
     data = []
-    with open_dataset(config, variable=variable, timestamp=time) as dataset:
+    with open_dataset(config, variable=variable, timestamp=time, request_kind='tile') as dataset:
+
+        if depth != 'bottom':
+            depthm = dataset.depths[depth]
+        else:
+            depthm = 0
+
+        if z < LAND_MASK_ZOOM and \
+                etopo_cache.is_land(projection, z, x0, y0, depthm, n):
+            return {tile: blank_tile() for tile in tiles}
 
         for v in variable:
             data.append(dataset.get_area(
@@ -222,7 +309,9 @@ def plot(projection, x, y, z, args):
                 v,
                 args.get('interp'),
                 args.get('radius'),
-                args.get('neighbours')
+                args.get('neighbours'),
+                tile=(projection, z, x0, y0, n),
+                dtype=dtype
             ))
 
         vc = config.variable[dataset.variables[variable[0]]]
@@ -237,12 +326,6 @@ def plot(projection, x, y, z, args):
         else:
             cmap = colormap.find_colormap(variable[0])
 
-
-        if depth != 'bottom':
-            depthm = dataset.depths[depth]
-        else:
-            depthm = 0
-
     if scale_factor != 1.0:
         for idx, val in enumerate(data):
             data[idx] = np.multiply(val, scale_factor)
@@ -255,37 +338,37 @@ def plot(projection, x, y, z, args):
         cmap = colormap.colormaps.get('speed')
 
     data = data.transpose()
-    xpx = x * 256
-    ypx = y * 256
 
     # Mask out any topography if we're below the vector-tile threshold
-    if z < 8:
-        with Dataset(current_app.config['ETOPO_FILE'] % (projection, z), 'r') as dataset:
-            bathymetry = dataset["z"][ypx:(ypx + 256), xpx:(xpx + 256)]
-
-        bathymetry = gaussian_filter(bathymetry, 0.5)
+    if z < LAND_MASK_ZOOM:
+        bathymetry = etopo_cache.window(projection, z, x0, y0, n, BLURRED)
 
         data[np.where(bathymetry > -depthm)] = np.ma.masked
 
     sm = matplotlib.cm.ScalarMappable(
         matplotlib.colors.Normalize(vmin=scale[0], vmax=scale[1]), cmap=cmap)
 
-    img = sm.to_rgba(np.ma.masked_invalid(np.squeeze(data)))
-    im = Image.fromarray((img * 255.0).astype(np.uint8))
+    img = sm.to_rgba(np.ma.masked_invalid(np.squeeze(data)), bytes=True)
+    im = Image.fromarray(img)
     
-    x = np.asarray(im.convert('RGBA')).copy()
+    rgba = np.asarray(im.convert('RGBA')).copy()
     
-    mask = (x[:,:,0] <= 3) & (x[:,:,1] <= 5) & (x[:,:,2] <= 18)
-    #mask = x[:,:,0] < 50
+    mask = (rgba[:,:,0] <= 3) & (rgba[:,:,1] <= 5) & (rgba[:,:,2] <= 18)
+    #mask = rgba[:,:,0] < 50
     
-    x[:, :, 3] = (255 * (1 - mask)).astype(np.uint8)#(255 * (x[:, :, :3] != 255).any(axis=2)).astype(np.uint8)
+    rgba[:, :, 3] = (255 * (1 - mask)).astype(np.uint8)#(255 * (rgba[:, :, :3] != 255).any(axis=2)).astype(np.uint8)
     
+    rendered = {}
+    for tile_x, tile_y in tiles:
+        i, j = tile_x - x0, tile_y - y0
+        im = Image.fromarray(rgba[256 * j:256 * (j + 1),
+                                  256 * i:256 * (i + 1)].astype(np.uint8))
 
-    im = Image.fromarray(x.astype(np.uint8))
+        buf = BytesIO()
+        im.save(buf, format='PNG', optimize=True)
+        rendered[(tile_x, tile_y)] = buf
 
-    buf = BytesIO()
-    im.save(buf, format='PNG', optimize=True)
-    return buf
+    return rendered
 
 def contour(projection, x, y, z, args):
     """
@@ -319,7 +402,7 @@ def contour(projection, x, y, z, args):
     #time = __get_time(config, time)
             
 
-    with open_dataset(config, variable=variable, timestamp=time) as dataset:
+    with open_dataset(config, variable=variable, timestamp=time, request_kind='tile') as dataset:
 
         
         #t_len = len(dataset.timestamps)
@@ -341,7 +424,8 @@ def contour(projection, x, y, z, args):
                 v,
                 args.get('interp'),
                 args.get('radius'),
-                args.get('neighbours')
+                args.get('neighbours'),
+                tile=(projection, z, x, y)
             ))
         variables = config.variable[dataset.variables[variable[0]]]
         contour_name = variables.name
@@ -373,24 +457,18 @@ def contour(projection, x, y, z, args):
     difference = (scale[1] - scale[0]) / 5
     levels = [scale[0] + difference, scale[0] + 2*difference, scale[0] + 3*difference, scale[0] + 4* difference, scale[1]]
     
-    xpx = x * 256
-    ypx = y * 256
-
     if depth != 'bottom':
             depthm = dataset.depths[depth]
     else:
         depthm = 0
 
-    with Dataset(current_app.config['ETOPO_FILE'] % (projection, z), 'r') as dataset:
-        #bathymetry = dataset["z"][ypx:(ypx + 256), xpx:(xpx + 256)]
-        #bathymetry = gaussian_filter(bathymetry, 0.5)
-        bathymetry = dataset["z"][ypx:(ypx + 256), xpx:(xpx + 256)] * -1
-        bathymetry = bathymetry[::-1, :]
-        if (args.get('masked') == 1):
-            pass
-        else:
-            contour_data[np.where(bathymetry < depthm)] = np.ma.masked
-            #contour_data[np.where(bathymetry > 0)] = np.ma.masked
+    bathymetry = etopo_cache.window(projection, z, x, y) * -1
+    bathymetry = bathymetry[::-1, :]
+    if (args.get('masked') == 1):
+        pass
+    else:
+        contour_data[np.where(bathymetry < depthm)] = np.ma.masked
+        #contour_data[np.where(bathymetry > 0)] = np.ma.masked
 
     min_indices = contour_data.min()
     contour_data[np.where(contour_data == np.ma.masked)] = -50
@@ -505,7 +583,8 @@ def wind_barbs(projection, x, y, z, args):
                 v,
                 args.get('interp'),
                 args.get('radius'),
-                args.get('neighbours')
+                args.get('neighbours'),
+                tile=(projection, z, x, y)
             )
             print("AFTER GET AREA")
             variables = config.variable[dataset.variables[variable[0]]]
@@ -655,9 +734,6 @@ def topo(projection, x, y, z, shaded_relief):
     if len(lat.shape) == 1:
         lat, lon = np.meshgrid(lat, lon)
 
-    xpx = x * 256
-    ypx = y * 256
-
     scale = [-4000, 1000]
     cmap = 'BrBG_r'
 
@@ -666,9 +742,7 @@ def topo(projection, x, y, z, shaded_relief):
     colors = np.vstack((water_colors, land_colors))
     cmap = matplotlib.colors.LinearSegmentedColormap.from_list('topo', colors)
 
-    data = None
-    with Dataset(current_app.config['ETOPO_FILE'] % (projection, z), 'r') as dataset:
-        data = dataset["z"][ypx:(ypx + 256), xpx:(xpx + 256)]
+    data = etopo_cache.window(projection, z, x, y)
 
     shade = 0
     if shaded_relief:
@@ -707,12 +781,8 @@ def bathymetry(projection, x, y, z, args):
     if len(lat.shape) == 1:
         lat, lon = np.meshgrid(lat, lon)
 
-    xpx = x * 256
-    ypx = y * 256
-
-    with Dataset(current_app.config['ETOPO_FILE'] % (projection, z), 'r') as dataset:
-        data = dataset["z"][ypx:(ypx + 256), xpx:(xpx + 256)] * -1
-        data = data[::-1, :]
+    data = etopo_cache.window(projection, z, x, y) * -1
+    data = data[::-1, :]
 
     LEVELS = [100, 200, 500, 1000, 2000, 3000, 4000, 5000, 6000]
 
@@ -43,7 +43,7 @@ class TimeseriesPlotter(PointPlotter):
         self.depth = depth
 
     def load_data(self):
-        with open_dataset(self.dataset_config, variable=self.variables, timestamp=self.starttime, endtime=self.endtime) as dataset:
+        with open_dataset(self.dataset_config, variable=self.variables, timestamp=self.starttime, endtime=self.endtime, request_kind='timeseries') as dataset:
             self.load_misc(dataset, self.variables)
             #self.fix_startend_times(dataset, self.starttime, self.endtime)
 
@@ -11,6 +11,8 @@ from flask_babel import gettext
 
 import routes.routes_impl
 from data import open_dataset
+from data.dimension_cache import get_variable_dimensions
+from data.metadata_snapshot import get_snapshot
 from data.sqlite_database import SQLiteDatabase
 from data.utils import (DateTimeEncoder, datetime_to_timestamp,
                         get_data_vars_from_equation, string_to_datetime,
@@ -123,16 +125,22 @@ def variables_query_v1_0():
     config = DatasetConfig(dataset)
     data = []
     if 'vectors_only' not in args:
-        with open_dataset(config, meta_only=True) as ds:
-            for v in ds.variables:
-                if ('3d_only' in args) and v.is_surface_only():
-                    continue
-                if not config.variable[v].is_hidden:
-                    data.append({
-                                'id': v.key,
-                                'value': config.variable[v].name,
-                                'scale': config.variable[v].scale
-                                })
+        snapshot = get_snapshot(config)
+        if snapshot is not None:
+            variables = snapshot.variables
+        else:
+            with open_dataset(config, meta_only=True) as ds:
+                variables = ds.variables
+
+        for v in variables:
+            if ('3d_only' in args) and v.is_surface_only():
+                continue
+            if not config.variable[v].is_hidden:
+                data.append({
+                            'id': v.key,
+                            'value': config.variable[v].name,
+                            'scale': config.variable[v].scale
+                            })
     if 'vectors' in args or 'vectors_only' in args:
         for variable in config.vector_variables:
             data.append({
@@ -224,26 +232,35 @@ def depth_query_v1_0():
     config = DatasetConfig(dataset)
 
     data = []
-    with open_dataset(config, variable=variable, timestamp=-1) as ds:
-        if not variable in ds.variables:
+    snapshot = get_snapshot(config)
+    if snapshot is not None:
+        if not variable in snapshot.variables:
             raise APIError("Variable not found in dataset: " + variable)
 
-        v = ds.variables[variable]
+        v = snapshot.variables[variable]
+        depths = snapshot.depths(variable)
+    else:
+        with open_dataset(config, variable=variable, timestamp=-1) as ds:
+            if not variable in ds.variables:
+                raise APIError("Variable not found in dataset: " + variable)
+
+            v = ds.variables[variable]
+            depths = ds.depths if v.has_depth() else []
 
-        if v.has_depth():
-            if str(args.get('all')).lower() in ['true', 'yes', 'on']:
-                data.append(
-                    {'id': 'all', 'value': gettext('All Depths')})
+    if v.has_depth():
+        if str(args.get('all')).lower() in ['true', 'yes', 'on']:
+            data.append(
+                {'id': 'all', 'value': gettext('All Depths')})
 
-            for idx, value in enumerate(np.round(ds.depths)):
-                data.append({
-                    'id': idx,
-                    'value': "%d m" % (value)
-                })
+        for idx, value in enumerate(np.round(depths)):
+            data.append({
+                'id': idx,
+                'value': "%d m" % (value)
+            })
 
-            if len(data) > 0:
-                data.insert(
-                    0, {'id': 'bottom', 'value': gettext('Bottom')})
+        if len(data) > 0:
+            data.insert(
+                0, {'id': 'bottom', 'value': gettext('Bottom')})
 
     data = [
         e for i, e in enumerate(data) if data.index(e) == i
@@ -340,7 +357,7 @@ def subset_query_v1_0():
         string_to_datetime(time_range[1]), config.time_dim_units)
 
     variables = args['variables'].split(',')
-    with open_dataset(config, variable=variables, timestamp=int(time_range[0]), endtime=int(time_range[1])) as dataset:
+    with open_dataset(config, variable=variables, timestamp=int(time_range[0]), endtime=int(time_range[1]), request_kind='subset') as dataset:
         working_dir, subset_filename = dataset.subset(args)
 
     return send_from_directory(working_dir, subset_filename, as_attachment=True)
@@ -384,6 +401,11 @@ def colormaps_v1_0():
     return routes.routes_impl.colormaps_impl()
 
 
+@bp_v1_0.route('/api/v1.0/diagnostics/')
+def diagnostics_v1_0():
+    return routes.routes_impl.diagnostics_impl()
+
+
 @bp_v1_0.route('/api/v1.0/')
 def info_v1_0():
     return routes.routes_impl.info_impl()
@@ -433,13 +455,17 @@ def timestamps():
     variable = args.get("variable")
 
     vals = []
-    with SQLiteDatabase(config.url) as db:
-        if variable in config.calculated_variables:
-            data_vars = get_data_vars_from_equation(config.calculated_variables[variable]['equation'],
-                                                    [v.key for v in db.get_data_variables()])
-            vals = db.get_timestamps(data_vars[0])
-        else:
-            vals = db.get_timestamps(variable)
+    snapshot = get_snapshot(config)
+    if snapshot is not None and variable in snapshot.variables:
+        vals = snapshot.timestamps(variable)
+    else:
+        with SQLiteDatabase(config.url) as db:
+            if variable in config.calculated_variables:
+                data_vars = get_data_vars_from_equation(config.calculated_variables[variable]['equation'],
+                                                        list(get_variable_dimensions(config.url).keys()))
+                vals = db.get_timestamps(data_vars[0])
+            else:
+                vals = db.get_timestamps(variable)
     converted_vals = timestamp_to_datetime(vals, config.time_dim_units)
 
     result = []
@@ -467,9 +493,13 @@ def timestamp_for_date_v1_0(old_dataset: str, date: int, new_dataset: str):
 @bp_v1_0.route('/api/v1.0/tiles/<string:interp>/<int:radius>/<int:neighbours>/<string:projection>/<string:dataset>/<string:variable>/<string:time>/<string:depth>/<string:scale>/<int:masked>/<string:display>/<int:zoom>/<int:x>/<int:y>.png')
 def tile_v1_0(projection: str, interp: str, radius: int, neighbours: int, dataset: str, variable: str, time: str, depth: str, scale: str, masked: int, display: str, zoom: int, x: int, y: int):
 
-    config = DatasetConfig(dataset)
-    timestamp = datetime_to_timestamp(
-        string_to_datetime(time), config.time_dim_units)
+    if time == 'latest':
+        # Resolved (and cached) against the dataset's index
+        timestamp = -1
+    else:
+        config = DatasetConfig(dataset)
+        timestamp = datetime_to_timestamp(
+            string_to_datetime(time), config.time_dim_units)
 
     return routes.routes_impl.tile_impl(projection, interp, radius, neighbours, dataset, variable, timestamp, depth, scale, masked, display, zoom, x, y)
 
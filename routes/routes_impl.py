@@ -8,13 +8,14 @@ This module handles all API Queries
 
 import base64
 import datetime
+import functools
 import gzip
 import io
 import json
 import os
 import re
-import shutil
 import sqlite3
+import threading
 from io import BytesIO
 
 import netCDF4
@@ -30,7 +31,12 @@ import plotting.colormap
 import plotting.scale
 import plotting.tile
 import utils.misc
-from data import open_dataset
+from data import get_index_signature, open_dataset
+from data.dataset_pool import dataset_pool
+from data.etopo_cache import etopo_cache
+from data.grid_index import grid_index_cache
+from data.resample_weights import resample_weight_cache
+from data.tile_slice_index import tile_slice_index
 from oceannavigator import DatasetConfig
 from plotting.class4 import Class4Plotter
 from plotting.drifter import DrifterPlotter
@@ -44,11 +50,18 @@ from plotting.stick import StickPlotter
 from plotting.timeseries import TimeseriesPlotter
 from plotting.transect import TransectPlotter
 from plotting.ts import TemperatureSalinityPlotter
+from utils.compute_resources import compute_resources
 from utils.errors import APIError, ClientError
+from utils.tile_store import data_tile_key, data_tile_max_age, tile_store
 
 MAX_CACHE = 315360000
 FAILURE = ClientError("Bad API usage")
 
+# Locks of the metatiles being rendered (see _render_metatile), picked by the
+# hash of their first tile's key, shared by all requests handled by this
+# worker process.
+_metatile_locks = [threading.Lock() for _ in range(64)]
+
 
 """
     Error handler
@@ -83,6 +96,29 @@ def info_impl():
     return jsonify("This is the Ocean Navigator API - Additional Parameters are required to complete a request, help can be found at ...")
 
 
+def diagnostics_impl():
+    """
+    API Format: /api/v1.0/diagnostics/
+    Returns the CPU budget and the cache counters of the worker process that
+    handled the request.
+    """
+
+    data = {
+        'pid': os.getpid(),
+        'compute': compute_resources.stats,
+        'dataset_pool': dataset_pool.stats,
+        'grid_index': grid_index_cache.stats,
+        'tile_slice_index': tile_slice_index.stats,
+        'resample_weights': resample_weight_cache.stats,
+        'tile_store': tile_store.stats,
+        'etopo': etopo_cache.stats,
+    }
+
+    resp = jsonify(data)
+    resp.cache_control.no_cache = True
+    return resp
+
+
 def query_impl(q: str):
     """
     API Format: /api/<string:q>/
@@ -567,45 +603,88 @@ def scale_impl(dataset: str, variable: str, scale: str, colourmap: str, orientat
     return send_file(bytesIOBuff, mimetype="image/png", cache_timeout=MAX_CACHE)
 
 
-def _cache_and_send_img(bytesIOBuff: BytesIO, f: str):
+def _cache_and_send_img(bytesIOBuff: BytesIO, layer: str, key: str,
+                        cache_timeout: int = MAX_CACHE):
     """
-        Caches a rendered image buffer on disk and sends it to the browser
+        Caches a rendered image buffer in the tile store and sends it to the
+        browser
         bytesIOBuff: BytesIO object containing image data
-        f: filename of image to be cached
+        layer, key: layer and key of the tile in utils.tile_store
+        cache_timeout: max-age the browser may keep the image for
     """
-    p = os.path.dirname(f)
-    if not os.path.isdir(p):
-        os.makedirs(p)
 
     # This seems excessive
     bytesIOBuff.seek(0)
     dataIO = BytesIO(bytesIOBuff.read())
     im = Image.open(dataIO)
-    im.save(f, format='PNG', optimize=True)  # For cache
+    optimized = BytesIO()
+    im.save(optimized, format='PNG', optimize=True)  # For cache
+    tile_store.put(layer, key, optimized.getvalue())
 
     bytesIOBuff.seek(0)
-    return send_file(bytesIOBuff, mimetype="image/png", cache_timeout=MAX_CACHE)
+    return send_file(bytesIOBuff, mimetype="image/png",
+                     cache_timeout=cache_timeout)
+
+
+def _render_metatile(projection: str, x: int, y: int, zoom: int, args: dict,
+                     size: int, key_of, cache_timeout: int):
+    """
+        Renders the metatile of a data tile (see plotting.tile.plot_metatile),
+        puts all of its tiles in the tile store and sends the requested one.
+        key_of(x, y) is the key of a tile of the metatile in the "data"
+        layer.
+    """
+    x0, y0, n = plotting.tile.get_metatile(x, y, zoom, size)
+    key = key_of(x, y)
+
+    # Requests for the other tiles of a metatile being rendered (e.g. the
+    # rest of a map view) wait for it instead of rendering it again.
+    lock = _metatile_locks[hash(key_of(x0, y0)) % len(_metatile_locks)]
+    with lock:
+        f = tile_store.get('data', key)
+        if f is not None:
+            return send_file(f, mimetype='image/png',
+                             cache_timeout=cache_timeout)
+
+        tiles = plotting.tile.plot_metatile(projection, x, y, zoom, args,
+                                            size)
+        for (tile_x, tile_y), buf in tiles.items():
+            tile_store.put('data', key_of(tile_x, tile_y), buf.getvalue())
+
+    img = tiles[(x, y)]
+    img.seek(0)
+    return send_file(img, mimetype="image/png", cache_timeout=cache_timeout)
+
 
 def tile_impl(projection: str, interp: str, radius: int, neighbours: int, dataset: str, variable: str, time: int, depth: str, scale: str, masked: int, display: str, zoom: int, x: int, y: int):
     """
         Produces the map data tiles
     """
 
-    cache_dir = current_app.config['CACHE_DIR']
-    f = os.path.join(cache_dir, request.path[1:])
+    # Forecasts requested as e.g. the latest timestamp (-1) keep their
+    # cached tiles until a new run is indexed; browsers shouldn't.
+    cache_timeout = MAX_CACHE if time >= 0 else 0
+
+    time, signature = get_index_signature(
+        DatasetConfig(dataset), variable.split(','), time)
+    key_of = functools.partial(data_tile_key, projection, interp, radius,
+                               neighbours, dataset, variable, time, signature,
+                               depth, scale, masked, display, zoom)
+    key = key_of(x, y)
 
     # Check if the tile/image is cached and send it
-    #if _is_cache_valid(dataset, f):
-    #    return send_file(f, mimetype='image/png', cache_timeout=MAX_CACHE)
-    # Render a new tile/image, then cache and send it
-    #else:
+    f = tile_store.get('data', key, max_age=data_tile_max_age(
+        DatasetConfig(dataset).cache, time, signature))
+    if f is not None:
+        return send_file(f, mimetype='image/png', cache_timeout=cache_timeout)
 
+    # Render a new tile/image, then cache and send it
     display = display.split(',')
     
     if depth != "bottom" and depth != "all":
         depth = int(depth)
         if display[0] == 'colour':
-            img = plotting.tile.plot(projection, x, y, zoom, {
+            args = {
                 'interp': interp,
                 'radius': radius*1000,
                 'neighbours': neighbours,
@@ -616,7 +695,13 @@ def tile_impl(projection: str, interp: str, radius: int, neighbours: int, datase
                 'scale': scale,
                 'masked': masked,
                 'display': display[1]
-            })
+            }
+            metatile_size = current_app.config.get('TILE_METATILE_SIZE', 1)
+            if metatile_size > 1:
+                return _render_metatile(projection, x, y, zoom, args,
+                                        metatile_size, key_of, cache_timeout)
+
+            img = plotting.tile.plot(projection, x, y, zoom, args)
         elif display[0] == 'contours':
             img = plotting.tile.contour(projection, x, y, zoom, {
                 'interp': interp,
@@ -646,7 +731,7 @@ def tile_impl(projection: str, interp: str, radius: int, neighbours: int, datase
         else:
             raise ValueError
             return
-    return _cache_and_send_img(img, f)
+    return _cache_and_send_img(img, 'data', key, cache_timeout)
 
 
 def topo_impl(projection: str, zoom: int, x: int, y: int, shaded_relief: bool):
@@ -658,15 +743,15 @@ def topo_impl(projection: str, zoom: int, x: int, y: int, shaded_relief: bool):
     if zoom > 7:
         return send_file(shape_file_dir + "/blank.png")
 
-    cache_dir = current_app.config['CACHE_DIR']
-    f = os.path.join(cache_dir, request.path[1:])
+    key = '%s/%d/%d/%d/%d.png' % (projection, int(shaded_relief), zoom, x, y)
+    f = tile_store.get('topo', key)
 
-    if os.path.isfile(f):
+    if f is not None:
         return send_file(f, mimetype='image/png', cache_timeout=MAX_CACHE)
     else:
         bytesIOBuff = plotting.tile.topo(projection, x, y, zoom, shaded_relief)
 
-        return _cache_and_send_img(bytesIOBuff, f)
+        return _cache_and_send_img(bytesIOBuff, 'topo', key)
 
 
 def bathymetry_impl(projection: str, zoom: int, x: int, y: int):
@@ -679,32 +764,31 @@ def bathymetry_impl(projection: str, zoom: int, x: int, y: int):
     if zoom > 7:
         return send_file(shape_file_dir + "/blank.png")
 
-    cache_dir = current_app.config['CACHE_DIR']
-    f = os.path.join(cache_dir, request.path[1:])
+    key = '%s/%d/%d/%d.png' % (projection, zoom, x, y)
+    f = tile_store.get('bath', key)
 
-    if os.path.isfile(f):
+    if f is not None:
         return send_file(f, mimetype='image/png', cache_timeout=MAX_CACHE)
     else:
         img = plotting.tile.bathymetry(projection, x, y, zoom, {})
-        return _cache_and_send_img(img, f)
+        return _cache_and_send_img(img, 'bath', key)
 
 
 def mbt_impl(projection: str, tiletype: str, zoom: int, x: int, y: int):
     """
          Serves mbt files
     """
-    cache_dir = current_app.config['CACHE_DIR']
     shape_file_dir = current_app.config['SHAPE_FILE_DIR']
-    requestf = str(os.path.join(cache_dir, request.path[1:]))
-    basedir = requestf.rsplit("/", 1)[0]
 
     # Send blank tile if conditions aren't met
     if (zoom < 7) or (projection != "EPSG:3857"):
         return send_file(shape_file_dir + "/blank.mbt")
 
-# Send file if cached or select data in SQLite file
-    if os.path.isfile(requestf):
-        return send_file(requestf)
+    # Send file if cached or select data in SQLite file
+    key = '%s/%s/%d/%d/%d' % (projection, tiletype, zoom, x, y)
+    f = tile_store.get('mbt', key)
+    if f is not None:
+        return send_file(f)
     else:
         y = (2**zoom-1) - y
         connection = sqlite3.connect(
@@ -718,14 +802,7 @@ def mbt_impl(projection: str, tiletype: str, zoom: int, x: int, y: int):
             return send_file(shape_file_dir + "/blank.mbt")
 
         # Write tile to cache and send file
-        if not os.path.isdir(basedir):
-            os.makedirs(basedir)
-        with open(requestf + ".pbf", 'wb') as f:
-            f.write(tile[0])
-        with gzip.open(requestf + ".pbf", 'rb') as gzipped:
-            with open(requestf, 'wb') as tileout:
-                shutil.copyfileobj(gzipped, tileout)
-        return send_file(requestf)
+        return send_file(tile_store.put('mbt', key, gzip.decompress(tile[0])))
 
 
 def drifter_query_impl(q: str, drifter_id: str):
@@ -911,29 +988,3 @@ def stats_impl(args, query=None):
 
     data = areastats(dataset, query)
     return Response(data, status=200, mimetype='application/json')
-
-
-def _is_cache_valid(dataset: str, f: str) -> bool:
-    """
-        Returns True if dataset cache is valid
-    """
-
-    config = DatasetConfig(dataset)
-    if os.path.isfile(f):
-        cache_time = config.cache
-        if cache_time is not None:
-            modtime = datetime.datetime.fromtimestamp(
-                os.path.getmtime(f)
-            )
-            age_hours = (
-                datetime.datetime.now() - modtime
-            ).total_seconds() / 3600
-            if age_hours > cache_time:
-                os.remove(f)
-                return False
-            else:
-                return True
-        else:
-            return True
-    else:
-        return False
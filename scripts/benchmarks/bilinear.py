@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks and checks the accuracy of the interpolation methods behind
+Data.get_point (data.resample_weights, data.bilinear) on a synthetic
+curvilinear grid, for the workloads of a tile and a map request:
+
+    * tile -- a 256x256 tile
+    * map  -- a 500x500 area
+
+"cold" computes the weights of the window around the targets (the
+neighbour search, or for exact_bilinear the cell search), "warm" only
+applies weights cached for an earlier request. The error is that of
+interpolating an analytic field sampled on the grid, against its value at
+the targets.
+
+Usage (from the repository root):
+    python scripts/benchmarks/bilinear.py [--resolution 0.1]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from data.bilinear import EXACT_BILINEAR, bilinear_weights  # noqa: E402
+from data.grid_index import GridIndex, GridIndexCache  # noqa: E402
+from data.resample_weights import compute_weights  # noqa: E402
+
+TILE_SIZE = 256
+MAP_SIZE = 500
+
+METHODS = (EXACT_BILINEAR, "bilinear", "inverse", "gaussian", "nearest")
+RADIUS = 25000
+NEIGHBOURS = 10
+
+
+def grid(resolution: float) -> tuple:
+    """A skewed, slightly curved grid over the North Atlantic."""
+
+    ny, nx = int(25 / resolution), int(60 / resolution)
+    j, i = np.mgrid[0:ny, 0:nx]
+    lat = 35 + resolution * (j + 0.1 * i)
+    lon = -75 + resolution * (i - 0.1 * j) + 1e-5 * i * j * resolution
+    return lat.astype(np.float32), lon.astype(np.float32)
+
+
+def field(lat, lon) -> np.ndarray:
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.sin(4 * lat) * np.cos(6 * lon)
+
+
+def targets(size: int) -> tuple:
+    lon, lat = np.meshgrid(np.linspace(-50, -40, size),
+                           np.linspace(45, 50, size))
+    return lat, lon
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resolution', type=float, default=0.1,
+                        help='Grid spacing in degrees')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    lat, lon = grid(opts.resolution)
+    data = np.ma.masked_array(field(lat, lon))
+
+    print("grid %dx%d" % lat.shape)
+    print("%-5s %-15s %10s %10s %12s %12s" % (
+        "load", "method", "cold (ms)", "warm (ms)", "max error", "rms error"))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = GridIndex(lat, lon, cache=GridIndexCache(cache_dir=tmpdir))
+
+        for name, size in (('tile', TILE_SIZE), ('map', MAP_SIZE)):
+            lat_out, lon_out = targets(size)
+            (miny, maxy), (minx, maxx) = index.bounding_box(
+                lat_out, lon_out, NEIGHBOURS)[0]
+            window = (miny, maxy, minx, maxx)
+            lat_in, lon_in = lat[miny:maxy, minx:maxx], lon[miny:maxy, minx:maxx]
+            data_in = data[miny:maxy, minx:maxx]
+            expected = field(lat_out, lon_out)
+
+            for method in METHODS:
+                if method == EXACT_BILINEAR:
+                    def weights():
+                        return bilinear_weights(index, window, lat_out,
+                                                lon_out, RADIUS)
+                else:
+                    def weights():
+                        return compute_weights(lat_in, lon_in, lat_out,
+                                               lon_out, method, RADIUS,
+                                               NEIGHBOURS)
+
+                cold = min(timeit.repeat(lambda: weights().apply(data_in),
+                                         number=1, repeat=opts.repeat))
+                cached = weights()
+                warm = min(timeit.repeat(lambda: cached.apply(data_in),
+                                         number=1, repeat=opts.repeat))
+
+                error = np.abs(cached.apply(data_in) - expected)
+                print("%-5s %-15s %10.1f %10.1f %12.2e %12.2e" % (
+                    name, method, cold * 1000, warm * 1000, error.max(),
+                    np.sqrt(np.mean(error ** 2))))
+
+
+if __name__ == '__main__':
+    main()
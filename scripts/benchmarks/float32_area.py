@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+Measures the peak memory of the data extraction of a map plot
+(plotting.map.MapPlotter.load_data) in float64 and float32 (AREA_DTYPE):
+
+    * a 500x500 area of the variable, scaled
+    * a 50x50 quiver of two components, and both on the 500x500 grid
+    * a 500x500 contour of a second variable, scaled
+
+The dataset is tests/testdata/nemo_test.nc (votemper stands in for every
+variable). Peaks are those traced by tracemalloc, which sees numpy's
+allocations. The float32 results are checked against the float64 ones.
+
+Usage (from the repository root):
+    python scripts/benchmarks/float32_area.py [--interp gaussian]
+"""
+
+import argparse
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from data.nemo import Nemo  # noqa: E402
+
+DATASET = "tests/testdata/nemo_test.nc"
+VARIABLE = "votemper"
+TIMESTAMP = 2031436800
+MAP_SIZE = 500
+QUIVER_SIZE = 50
+
+
+def area(size: int, dtype) -> np.ndarray:
+    lon, lat = np.meshgrid(np.linspace(-160, -145, size),
+                           np.linspace(4, 14, size))
+    return np.array([lat, lon]).astype(dtype)
+
+
+def load_data(dataset, interp: str, dtype) -> list:
+    """The get_area calls and array maths of MapPlotter.load_data."""
+
+    grid, quiver_grid = area(MAP_SIZE, dtype), area(QUIVER_SIZE, dtype)
+
+    def get_area(a):
+        return dataset.get_area(a, 0, TIMESTAMP, VARIABLE, interp, 25000, 10,
+                                dtype=dtype)
+
+    data = np.multiply(get_area(grid), 1.0)
+    quiver = [get_area(quiver_grid) for _ in range(2)]
+    quiver_fullgrid = [get_area(grid) for _ in range(2)]
+    contour = np.multiply(get_area(grid), 1.0)
+
+    return [grid, data, contour] + quiver + quiver_fullgrid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interp', default='gaussian')
+    opts = parser.parse_args()
+
+    with Nemo(DATASET) as dataset:
+        # Opens the file and caches the weights, which both runs share
+        load_data(dataset, opts.interp, None)
+        load_data(dataset, opts.interp, np.float32)
+
+        print("%-8s %12s %12s" % ("dtype", "peak (MB)", "held (MB)"))
+        results = {}
+        for dtype in (np.float64, np.float32):
+            tracemalloc.start()
+            results[dtype] = load_data(dataset, opts.interp, dtype)
+            held, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("%-8s %12.1f %12.1f" % (np.dtype(dtype).name, peak / 2 ** 20,
+                                           held / 2 ** 20))
+
+    error = max(float(np.ma.abs(a - b).max())
+                for a, b in zip(results[np.float64], results[np.float32]))
+    print("max difference %.2e" % error)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks SQLiteDatabase.get_netcdf_files against the previous
+one-query-per-(timestamp, variable) loop on a synthetic dataset index.
+
+Usage (from the repository root):
+    python scripts/benchmarks/get_netcdf_files.py [--rows 100000] [--days 90]
+"""
+
+import argparse
+import itertools
+import os
+import sqlite3
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from data.sqlite_database import SQLiteDatabase  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE Dimensions (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE Variables (id INTEGER PRIMARY KEY,variable TEXT UNIQUE NOT NULL, units TEXT, longName TEXT, validMin REAL, validMax REAL);
+CREATE TABLE VarsDims (variable_id INTEGER, dim_id INTEGER, PRIMARY KEY(variable_id, dim_id));
+CREATE TABLE Filepaths (id INTEGER PRIMARY KEY, filepath TEXT NOT NULL);
+CREATE TABLE Timestamps (id INTEGER PRIMARY KEY,timestamp INTEGER UNIQUE NOT NULL);
+CREATE TABLE TimestampVariableFilepath (filepath_id INTEGER, variable_id INTEGER, timestamp_id INTEGER, PRIMARY KEY(filepath_id, variable_id, timestamp_id));
+CREATE INDEX idx_foreign_key_fp on TimestampVariableFilepath(timestamp_id);
+CREATE INDEX idx_foreign_key_var on TimestampVariableFilepath(variable_id);
+CREATE INDEX idx_timestamp ON Timestamps(timestamp);
+CREATE INDEX idx_filepath ON Filepaths(filepath);
+"""
+
+VARIABLES = ['vozocrtx', 'vomecrty', 'votemper', 'vosaline', 'sossheig',
+             'iiceconc', 'iicevol', 'mldr10_1', 'sowindsp', 'sokaraml']
+START_TIME = 2144966400
+HOUR = 3600
+
+
+def build_index(path: str, rows: int) -> list:
+    """Builds a synthetic index with `rows` rows in TimestampVariableFilepath.
+    Every file holds one hourly timestamp for a pair of variables, as in our
+    split U/V forecast files.
+
+    Returns:
+        list -- All timestamps in the index.
+    """
+
+    n_timestamps = rows // len(VARIABLES)
+    timestamps = [START_TIME + i * HOUR for i in range(n_timestamps)]
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO Variables (id, variable) VALUES (?, ?)",
+                     enumerate(VARIABLES, 1))
+    conn.executemany("INSERT INTO Timestamps (id, timestamp) VALUES (?, ?)",
+                     enumerate(timestamps, 1))
+
+    files = []
+    tvf = []
+    for t_id, t in enumerate(timestamps, 1):
+        for pair in range(len(VARIABLES) // 2):
+            files.append((len(files) + 1, "/data/synthetic/%d_%d.nc" % (t, pair)))
+            tvf.append((len(files), 2 * pair + 1, t_id))
+            tvf.append((len(files), 2 * pair + 2, t_id))
+
+    conn.executemany("INSERT INTO Filepaths (id, filepath) VALUES (?, ?)", files)
+    conn.executemany(
+        "INSERT INTO TimestampVariableFilepath VALUES (?, ?, ?)", tvf)
+    conn.commit()
+    conn.close()
+
+    return timestamps
+
+
+def legacy_get_netcdf_files(db: SQLiteDatabase, timestamp: list, variable: list) -> list:
+    # The implementation get_netcdf_files replaced.
+    file_list = []
+
+    query = """
+    SELECT
+        filepath
+    FROM
+        TimestampVariableFilepath tvf
+        JOIN Filepaths fp ON tvf.filepath_id = fp.id
+        JOIN Variables v ON tvf.variable_id = v.id
+        JOIN Timestamps t ON tvf.timestamp_id = t.id
+    WHERE
+        variable = ?
+        AND timestamp = ?;
+    """
+
+    for ts in timestamp:
+        for v in variable:
+            db.c.execute(query, (v, ts))
+            file_list.append(list(itertools.chain(*db.c.fetchall())))
+
+    return list(set(itertools.chain(*file_list)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='Rows in the synthetic TimestampVariableFilepath table')
+    parser.add_argument('--days', type=int, default=90,
+                        help='Length of the requested timeseries in days (daily steps)')
+    parser.add_argument('--repeat', type=int, default=5)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "synthetic.sqlite3")
+        timestamps = build_index(path, opts.rows)
+
+        requested = timestamps[::24][:opts.days]
+        variables = ['vozocrtx', 'vomecrty']
+
+        with SQLiteDatabase(path) as db:
+            old = sorted(legacy_get_netcdf_files(db, requested, variables))
+            new = db.get_netcdf_files(requested, variables)
+            assert old == sorted(new), "Results differ between implementations"
+
+            legacy = min(timeit.repeat(
+                lambda: legacy_get_netcdf_files(db, requested, variables),
+                number=10, repeat=opts.repeat)) / 10
+            batched = min(timeit.repeat(
+                lambda: db.get_netcdf_files(requested, variables),
+                number=10, repeat=opts.repeat)) / 10
+
+        print("Index rows:          %d" % opts.rows)
+        print("Requested pairs:     %d (%d timestamps x %d variables)" %
+              (len(requested) * len(variables), len(requested), len(variables)))
+        print("Files returned:      %d" % len(new))
+        print("Per-pair loop:       %.2f ms" % (legacy * 1000))
+        print("Single statement:    %.2f ms" % (batched * 1000))
+        print("Speedup:             %.1fx" % (legacy / batched))
+
+
+if __name__ == '__main__':
+    main()
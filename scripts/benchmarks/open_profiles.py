@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks dataset open profiles (see DatasetConfig.open_profile) on the
+two access patterns behind /api/v1.0/tiles and the timeseries/hovmoller
+plots, using a synthetic set of daily NEMO-like files:
+
+    * tile       -- one 256x256 window at a single time step
+    * timeseries -- a single grid point through every time step
+
+Each pattern is timed from a cold open (files opened with the profile's
+chunking and parallel settings) to the values being read, like a request
+that misses the dataset pool.
+
+Usage (from the repository root):
+    python scripts/benchmarks/open_profiles.py [--files 60] [--size 1000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+import netCDF4
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from data.nemo import Nemo  # noqa: E402
+
+START_TIME = 2144966400
+DAY = 86400
+
+PROFILES = {
+    'default': {"chunks": None, "parallel": False, "scheduler": None},
+    'tile': {"chunks": {"time_counter": 1, "y": 256, "x": 256},
+             "parallel": True, "scheduler": "sync"},
+    'timeseries': {"chunks": {"time_counter": -1, "y": 64, "x": 64},
+                   "parallel": True, "scheduler": "threads"},
+}
+
+
+def build_files(directory: str, n_files: int, size: int) -> list:
+    """Writes n_files daily files, each with one (size x size) field."""
+
+    files = []
+    rng = np.random.RandomState(0)
+    for i in range(n_files):
+        path = os.path.join(directory, "synthetic_%03d.nc" % i)
+        with netCDF4.Dataset(path, 'w') as ds:
+            ds.createDimension('time_counter', None)
+            ds.createDimension('y', size)
+            ds.createDimension('x', size)
+
+            time = ds.createVariable('time_counter', 'f8', ('time_counter', ))
+            time.units = "seconds since 1950-01-01 00:00:00"
+            time[:] = [START_TIME + i * DAY]
+
+            var = ds.createVariable('votemper', 'f4', ('time_counter', 'y', 'x'),
+                                    zlib=True, chunksizes=(1, 64, 64))
+            var[0, :, :] = rng.rand(size, size).astype(np.float32)
+        files.append(path)
+
+    return files
+
+
+def read_tile(files: list, profile: dict):
+    with Nemo(files[0], nc_files=files, open_profile=profile) as ds:
+        var = ds.get_dataset_variable('votemper')
+        return np.asarray(var[-1, 256:512, 256:512])
+
+
+def read_timeseries(files: list, profile: dict):
+    with Nemo(files[0], nc_files=files, open_profile=profile) as ds:
+        var = ds.get_dataset_variable('votemper')
+        return np.asarray(var[:, 300, 300])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=60,
+                        help='Number of daily files in the synthetic dataset')
+    parser.add_argument('--size', type=int, default=1000,
+                        help='Size of the (square) horizontal grid')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = build_files(tmpdir, opts.files, opts.size)
+
+        print("%d files of %dx%d" % (opts.files, opts.size, opts.size))
+        print("%-12s %-12s %10s" % ("pattern", "profile", "ms"))
+        for pattern, func in (('tile', read_tile), ('timeseries', read_timeseries)):
+            expected = func(files, PROFILES['default'])
+            for name in ('default', pattern):
+                assert np.array_equal(expected, func(files, PROFILES[name]))
+                best = min(timeit.repeat(lambda: func(files, PROFILES[name]),
+                                         number=1, repeat=opts.repeat))
+                print("%-12s %-12s %10.1f" % (pattern, name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks nearest-point lookups on a regular (Mercator) grid: the KD-tree
+over the full mesh against bisecting the 1D latitude/longitude axes (see
+data.grid_index.GridIndex), for the lookups behind a tile request:
+
+    * bbox  -- bounding box of 10 neighbours around a 256x256 tile
+    * point -- nearest grid point of each of the 256x256 tile points
+
+"cold" includes building the index for a grid seen for the first time
+(the tree build and its on-disk triples for the KD-tree), "warm" reuses it.
+Indices are checked to be identical between both paths.
+
+Usage (from the repository root):
+    python scripts/benchmarks/regular_grid_index.py [--resolution 0.25]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from data.grid_index import GridIndex, GridIndexCache  # noqa: E402
+
+TILE_SIZE = 256
+
+
+def tile_points(rng) -> tuple:
+    """A tile-sized mesh of points somewhere in the North Atlantic."""
+
+    lat0, lon0 = rng.uniform(35, 60), rng.uniform(-70, -20)
+    lon, lat = np.meshgrid(np.linspace(lon0, lon0 + 5, TILE_SIZE),
+                           np.linspace(lat0, lat0 + 3, TILE_SIZE))
+    return lat.ravel(), lon.ravel()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resolution', type=float, default=0.25,
+                        help='Grid spacing in degrees')
+    parser.add_argument('--repeat', type=int, default=5)
+    opts = parser.parse_args()
+
+    lat = np.arange(-80, 90 + opts.resolution, opts.resolution, dtype=np.float32)
+    lon = np.arange(-180, 180, opts.resolution, dtype=np.float32)
+    qlat, qlon = tile_points(np.random.RandomState(0))
+
+    print("grid %dx%d, %d tile points" % (lat.size, lon.size, qlat.size))
+    print("%-8s %-8s %12s %12s" % ("lookup", "index", "kdtree (ms)", "axes (ms)"))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        def cold(use_axes):
+            cache = GridIndexCache(cache_dir=tempfile.mkdtemp(dir=tmpdir))
+            return GridIndex(lat, lon, cache=cache, use_axes=use_axes)
+
+        warm = {
+            use_axes: GridIndex(lat, lon, use_axes=use_axes,
+                                cache=GridIndexCache(cache_dir=tmpdir))
+            for use_axes in (False, True)
+        }
+
+        lookups = (
+            ('bbox', lambda index: index.bounding_box(qlat, qlon, 10)[0]),
+            ('point', lambda index: index.nearest(qlat, qlon)[1]),
+        )
+        for name, lookup in lookups:
+            expected, actual = lookup(warm[False]), lookup(warm[True])
+            assert all(np.array_equal(e, a) for e, a in zip(expected, actual))
+
+            for state in ('cold', 'warm'):
+                times = []
+                for use_axes in (False, True):
+                    if state == 'cold':
+                        func = lambda: lookup(cold(use_axes))  # noqa: E731
+                    else:
+                        func = lambda: lookup(warm[use_axes])  # noqa: E731
+                    times.append(min(timeit.repeat(func, number=1,
+                                                   repeat=opts.repeat)))
+                print("%-8s %-8s %12.1f %12.1f" %
+                      (name, state, times[0] * 1000, times[1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
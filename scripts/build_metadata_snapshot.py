@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""
+Writes the metadata snapshot (see data.metadata_snapshot) of each dataset
+next to its sqlite index, so the variables, depth and timestamps routes can
+answer without opening any netCDF files.
+
+Run it after the indexer has updated a dataset; a snapshot older than its
+index is ignored by the app.
+
+Usage (from the repository root):
+    python scripts/build_metadata_snapshot.py [dataset ...] [--config datasetconfig.json]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..")))
+
+from data.dimension_cache import is_sqlite_database  # noqa: E402
+from data.metadata_snapshot import write_snapshot  # noqa: E402
+from oceannavigator import DatasetConfig, create_app  # noqa: E402
+
+logging.basicConfig(format='%(message)s', level=logging.INFO)
+log = logging.getLogger()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build metadata snapshots for datasets.")
+    parser.add_argument('datasets', nargs='*',
+                        help='Dataset keys (default: all enabled datasets)')
+    parser.add_argument('--config', default="datasetconfig.json",
+                        help='Dataset config file, relative to oceannavigator/')
+    opts = parser.parse_args()
+
+    app = create_app()
+    app.config['datasetConfig'] = opts.config
+
+    failed = 0
+    with app.app_context():
+        for key in opts.datasets or DatasetConfig.get_datasets():
+            config = DatasetConfig(key)
+            if not config.url or not is_sqlite_database(config.url):
+                log.info("%s: skipped (not backed by a sqlite index)", key)
+                continue
+
+            start = time.time()
+            try:
+                path = write_snapshot(config)
+            except Exception:
+                log.exception("%s: failed", key)
+                failed += 1
+                continue
+            log.info("%s: wrote %s in %.1f s", key, path, time.time() - start)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
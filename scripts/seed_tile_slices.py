@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""
+Fills the tile slice index (see data.tile_slice_index) of a dataset ahead of
+time, so the first request for each tile doesn't have to search the model
+grid for the window it reads. Tiles that aren't seeded are recorded the first
+time they are rendered.
+
+Seeds the grid of the dataset's main lat/lon variables (e.g. nav_lat/nav_lon
+or latitude/longitude); variables on other grids (e.g. NEMO U/V points) are
+filled on first use. FVCOM datasets aren't supported.
+
+Colour tiles are rendered a metatile at a time (see
+plotting.tile.plot_metatile), so it's the windows of the metatiles that are
+seeded, TILE_METATILE_SIZE tiles per side unless --metatile is given.
+
+Usage (from the repository root):
+    python scripts/seed_tile_slices.py giops_day --zoom 0-6 \
+        [--projection EPSG:3857] [--bounds 40,-70,60,-40] [--variable votemper] \
+        [--metatile 4]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..")))
+
+from data import open_dataset  # noqa: E402
+from data.grid_index import GridIndex  # noqa: E402
+from data.tile_slice_index import tile_slice_index  # noqa: E402
+from oceannavigator import DatasetConfig, create_app  # noqa: E402
+from plotting.tile import (deg2num, get_metatile,  # noqa: E402
+                           get_metatile_latlon_coords)
+
+logging.basicConfig(format='%(message)s', level=logging.INFO)
+log = logging.getLogger()
+
+# Neighbours per pixel of the tile bounding box search in Nemo/Mercator.
+NEIGHBOURS = 10
+PROJECTIONS = ('EPSG:3857', 'EPSG:32661', 'EPSG:3031')
+
+
+def parse_zoom(value: str) -> range:
+    first, _, last = value.partition('-')
+    return range(int(first), int(last or first) + 1)
+
+
+def get_tiles(projection: str, z: int, bounds: list) -> list:
+    """(x, y) of the tiles at zoom z, limited to bounds for EPSG:3857."""
+
+    n = 2 ** z
+    if bounds is None or projection != 'EPSG:3857':
+        return [(x, y) for x in range(n) for y in range(n)]
+
+    south, west, north, east = bounds
+    x0, y0 = deg2num(north, west, z)
+    x1, y1 = deg2num(south, east, z)
+
+    return [
+        (x, y)
+        for x in range(max(x0, 0), min(x1, n - 1) + 1)
+        for y in range(max(y0, 0), min(y1, n - 1) + 1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Seed the tile slice index of a dataset.")
+    parser.add_argument('dataset', help='Dataset key')
+    parser.add_argument('--variable',
+                        help='Variable used to open the dataset (default: first)')
+    parser.add_argument('--projection', choices=PROJECTIONS, default='EPSG:3857')
+    parser.add_argument('--zoom', type=parse_zoom, default=parse_zoom('0-5'),
+                        help='Zoom level or range, e.g. 4 or 0-6')
+    parser.add_argument('--bounds', type=lambda s: [float(v) for v in s.split(',')],
+                        help='south,west,north,east (EPSG:3857 only)')
+    parser.add_argument('--metatile', type=int,
+                        help='Tiles per side of the metatiles tiles are '
+                             'rendered in (default: TILE_METATILE_SIZE)')
+    parser.add_argument('--config', default="datasetconfig.json",
+                        help='Dataset config file, relative to oceannavigator/')
+    opts = parser.parse_args()
+
+    app = create_app()
+    app.config['datasetConfig'] = opts.config
+    size = opts.metatile or app.config.get('TILE_METATILE_SIZE', 1)
+
+    with app.app_context():
+        config = DatasetConfig(opts.dataset)
+        variable = opts.variable or config.variables[0]
+
+        with open_dataset(config, variable=variable, timestamp=-1) as ds:
+            latvar, lonvar = ds.latlon_variables
+            if latvar is None or lonvar is None:
+                log.error("%s: no lat/lon variables to seed", opts.dataset)
+                sys.exit(1)
+            index = GridIndex(latvar, lonvar)
+
+        log.info("%s: %s grid %s", opts.dataset, index.kind, index.shape)
+
+        for z in opts.zoom:
+            metatiles = sorted({
+                get_metatile(x, y, z, size)
+                for x, y in get_tiles(opts.projection, z, opts.bounds)
+            })
+            start = time.time()
+            seeded = 0
+            for x, y, n in metatiles:
+                tile = (opts.projection, z, x, y, n)
+                if tile_slice_index.get(index.key, NEIGHBOURS, tile) is not None:
+                    continue
+
+                lat, lon = get_metatile_latlon_coords(opts.projection, x, y,
+                                                      z, n)
+                index.bounding_box(lat, lon, NEIGHBOURS, tile=tile)
+                seeded += 1
+
+            log.info("z=%d: %d metatiles (%d seeded) in %.1f s",
+                     z, len(metatiles), seeded, time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
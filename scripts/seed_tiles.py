@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+"""
+Renders the colour data tiles of a dataset ahead of time (e.g. after a
+forecast run is indexed) into the tile store (see utils.tile_store), so
+users' requests for them are cache hits.
+
+Tiles are keyed as those of /api/v1.0/tiles requested by the frontend with
+the same options (interpolation, scale, colourmap, ...), and are rendered a
+metatile at a time (see plotting.tile.plot_metatile) by a pool of worker
+processes. Tiles that are already stored are skipped, so an interrupted run
+is resumed by running the same command again. Tiles whose every pixel is
+land at the requested depth are fully transparent; they aren't rendered.
+
+Usage (from the repository root):
+    python scripts/seed_tiles.py giops_day \
+        --variable votemper,vosaline,vozocrtx+vomecrty --zoom 0-7 \
+        [--depth 0] [--time latest] [--projection EPSG:3857] \
+        [--bounds 40,-70,60,-40] [--processes 4]
+
+Separate the components of a vector variable (e.g. speed) with a "+", e.g.
+--variable vozocrtx+vomecrty.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..")))
+
+import plotting.tile  # noqa: E402
+from data import get_index_signature, open_dataset  # noqa: E402
+from data.etopo_cache import etopo_cache  # noqa: E402
+from data.utils import datetime_to_timestamp, string_to_datetime  # noqa: E402
+from oceannavigator import DatasetConfig, create_app  # noqa: E402
+from seed_tile_slices import PROJECTIONS, get_tiles, parse_zoom  # noqa: E402
+from utils.tile_store import (data_tile_key, data_tile_max_age,  # noqa: E402
+                              tile_store)
+
+logging.basicConfig(format='%(message)s', level=logging.INFO)
+log = logging.getLogger()
+
+# Outcomes of a tile, as counted by the report
+RENDERED, CACHED, LAND, FAILED = 'rendered', 'cached', 'land', 'failed'
+
+# The app of a worker process (see init_worker).
+_app = None
+
+
+def parse_time(value: str, config: DatasetConfig) -> int:
+    """"latest", a raw timestamp (or negative index) or an ISO 8601 date."""
+
+    if value == 'latest':
+        return -1
+    try:
+        return int(value)
+    except ValueError:
+        return datetime_to_timestamp(string_to_datetime(value),
+                                     config.time_dim_units)
+
+
+def get_layer(config: DatasetConfig, dataset, variable: str,
+              timestamp: int, scale: str, colourmap: str) -> dict:
+    """The tile parameters of a variable, as the frontend requests them."""
+
+    timestamp, signature = get_index_signature(config, variable.split(','),
+                                               timestamp)
+
+    if scale is None:
+        if ',' in variable:
+            vc = config.variable[variable]
+        else:
+            vc = config.variable[dataset.variables[variable]]
+        scale = ','.join('%g' % s for s in vc.scale)
+
+    return {
+        'variable': variable,
+        'time': timestamp,
+        'signature': signature,
+        'scale': scale,
+        'display': 'colour,%s' % colourmap,
+        # Of the stored tiles, as served by /api/v1.0/tiles
+        'max_age': data_tile_max_age(config.cache, timestamp, signature),
+    }
+
+
+def init_worker(datasetconfig: str, processes: int) -> None:
+    global _app
+
+    _app = create_app()
+    _app.config['datasetConfig'] = datasetconfig
+    # The CPUs are shared by the pool (see utils.compute_resources)
+    _app.config['COMPUTE_WORKERS'] = processes
+
+
+def land_tiles(projection: str, z: int, x: int, y: int, n: int,
+               depthm: float) -> set:
+    """(x, y) of the tiles of the n x n metatile at (x, y) that are all
+    land at depthm, which plotting.tile.plot draws blank.
+    """
+
+    if z >= plotting.tile.LAND_MASK_ZOOM:
+        return set()
+
+    return {
+        (x + i, y + j)
+        for i in range(n) for j in range(n)
+        if etopo_cache.is_land(projection, z, x + i, y + j, depthm)
+    }
+
+
+def seed_metatile(task: tuple) -> dict:
+    """Renders and stores the tiles of a metatile that aren't stored yet.
+
+    Returns:
+        dict -- Number of tiles per outcome.
+    """
+
+    opts, layer, depth, depthm, projection, z, x, y, n = task
+    tiles = [(x + i, y + j) for i in range(n) for j in range(n)]
+
+    def key_of(tile_x, tile_y):
+        return data_tile_key(
+            projection, opts.interp, opts.radius, opts.neighbours,
+            opts.dataset, layer['variable'], layer['time'],
+            layer['signature'], depth, layer['scale'], 0, layer['display'],
+            z, tile_x, tile_y)
+
+    with _app.app_context():
+        if all(tile_store.get('data', key_of(*t), max_age=layer['max_age'])
+               is not None for t in tiles):
+            return {CACHED: len(tiles)}
+
+        try:
+            land = land_tiles(projection, z, x, y, n, depthm)
+            if len(land) == len(tiles):
+                return {LAND: len(tiles)}
+
+            rendered = plotting.tile.plot_metatile(projection, x, y, z, {
+                'interp': opts.interp,
+                'radius': opts.radius * 1000,
+                'neighbours': opts.neighbours,
+                'dataset': opts.dataset,
+                'variable': layer['variable'],
+                'time': layer['time'],
+                'depth': depth,
+                'scale': layer['scale'],
+                'display': layer['display'].split(',')[1],
+            }, n)
+        except Exception:
+            log.exception("%s z=%d x=%d y=%d: failed", projection, z, x, y)
+            return {FAILED: len(tiles)}
+
+        for t, buf in rendered.items():
+            if t not in land:
+                tile_store.put('data', key_of(*t), buf.getvalue())
+
+    return {RENDERED: len(tiles) - len(land), LAND: len(land)}
+
+
+def get_metatiles(projection: str, z: int, bounds: list, size: int) -> list:
+    """(x, y, n) of the metatiles covering the tiles of get_tiles."""
+
+    return sorted({
+        plotting.tile.get_metatile(x, y, z, size)
+        for x, y in get_tiles(projection, z, bounds)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render the data tiles of a dataset into the tile store.")
+    parser.add_argument('dataset', help='Dataset key')
+    parser.add_argument('--variable', required=True,
+                        type=lambda s: [v.replace('+', ',') for v in s.split(',')],
+                        help='Variable(s), e.g. votemper,vozocrtx+vomecrty')
+    parser.add_argument('--depth', type=lambda s: [int(d) for d in s.split(',')],
+                        default=[0], help='Depth index(es), e.g. 0 or 0,10')
+    parser.add_argument('--time', default='latest',
+                        help='"latest", a timestamp or an ISO 8601 date')
+    parser.add_argument('--zoom', type=parse_zoom, default=parse_zoom('0-7'),
+                        help='Zoom level or range, e.g. 4 or 0-7')
+    parser.add_argument('--projection', choices=PROJECTIONS, action='append',
+                        help='Projection(s) to seed (default: all)')
+    parser.add_argument('--bounds', type=lambda s: [float(v) for v in s.split(',')],
+                        help='south,west,north,east (EPSG:3857 only)')
+    parser.add_argument('--scale',
+                        help='min,max (default: the variable\'s scale)')
+    parser.add_argument('--colourmap', default='default')
+    parser.add_argument('--interp', default='gaussian')
+    parser.add_argument('--radius', type=int, default=25,
+                        help='Interpolation radius in km')
+    parser.add_argument('--neighbours', type=int, default=10)
+    parser.add_argument('--metatile', type=int, default=4,
+                        help='Tiles per side of the metatiles rendered')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--config', default="datasetconfig.json",
+                        help='Dataset config file, relative to oceannavigator/')
+    opts = parser.parse_args()
+
+    app = create_app()
+    app.config['datasetConfig'] = opts.config
+
+    with app.app_context():
+        config = DatasetConfig(opts.dataset)
+        timestamp = parse_time(opts.time, config)
+
+        layers = []
+        depths = {}
+        for variable in opts.variable:
+            with open_dataset(config, variable=variable.split(','),
+                              timestamp=timestamp) as ds:
+                layers.append(get_layer(config, ds, variable, timestamp,
+                                        opts.scale, opts.colourmap))
+                for depth in opts.depth:
+                    depths[depth] = float(ds.depths[depth])
+
+    # The workers are started fresh, rather than forked with the open
+    # connections of this process.
+    context = multiprocessing.get_context('spawn')
+    totals = dict.fromkeys((RENDERED, CACHED, LAND, FAILED), 0)
+    start = time.time()
+
+    with context.Pool(opts.processes, initializer=init_worker,
+                      initargs=(opts.config, opts.processes)) as pool:
+        for layer in layers:
+            for depth in opts.depth:
+                for projection in opts.projection or PROJECTIONS:
+                    for z in opts.zoom:
+                        tasks = [
+                            (opts, layer, depth, depths[depth], projection,
+                             z, x, y, n)
+                            for x, y, n in get_metatiles(
+                                projection, z, opts.bounds, opts.metatile)
+                        ]
+
+                        counts = dict.fromkeys(totals, 0)
+                        level_start = time.time()
+                        for result in pool.imap_unordered(seed_metatile,
+                                                          tasks):
+                            for outcome, count in result.items():
+                                counts[outcome] += count
+
+                        elapsed = time.time() - level_start
+                        log.info(
+                            "%s depth=%d %s z=%d: %d rendered, %d cached, "
+                            "%d land, %d failed in %.1f s (%.1f tiles/s)",
+                            layer['variable'], depth, projection, z,
+                            counts[RENDERED], counts[CACHED], counts[LAND],
+                            counts[FAILED], elapsed,
+                            counts[RENDERED] / max(elapsed, 1e-6))
+
+                        for outcome, count in counts.items():
+                            totals[outcome] += count
+
+    elapsed = time.time() - start
+    log.info("total: %d rendered, %d cached, %d land, %d failed in %.1f s "
+             "(%.1f tiles/s)", totals[RENDERED], totals[CACHED], totals[LAND],
+             totals[FAILED], elapsed, totals[RENDERED] / max(elapsed, 1e-6))
+
+    if totals[FAILED]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
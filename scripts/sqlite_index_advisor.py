@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+"""
+Checks a dataset index database (as built by the indexer) against the
+queries data.sqlite_database.SQLiteDatabase runs on it.
+
+Every query method is run once against the database with statement tracing
+enabled, and the captured SQL is passed through EXPLAIN QUERY PLAN. Full
+table scans are reported, together with any of the composite indexes below
+that are missing. With --apply the missing indexes are created (and ANALYZE
+is run), and the timings of get_netcdf_files, get_timestamps and
+get_timestamp_range are printed before and after.
+
+Usage (from the repository root):
+    python scripts/sqlite_index_advisor.py /data/db/giops_day.sqlite3 [--apply]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..")))
+
+from data.sqlite_database import SQLiteDatabase  # noqa: E402
+from data.timestamp_index import timestamp_index_cache  # noqa: E402
+
+# name -> (table, columns). An existing index whose leading columns match
+# counts as present, whatever it is called.
+EXPECTED_INDEXES = {
+    # variable -> timestamps, and (variable, timestamp) -> filepath without
+    # touching the table itself.
+    'idx_tvf_variable_timestamp_filepath': (
+        'TimestampVariableFilepath', ('variable_id', 'timestamp_id', 'filepath_id')),
+    # timestamp -> (variable, filepath) when the planner starts from
+    # Timestamps (e.g. short timestamp lists in get_netcdf_files).
+    'idx_tvf_timestamp_variable_filepath': (
+        'TimestampVariableFilepath', ('timestamp_id', 'variable_id', 'filepath_id')),
+    'idx_vars_dims_variable_dim': ('VarsDims', ('variable_id', 'dim_id')),
+}
+
+# Methods that return whole tables; scanning them is expected.
+FULL_TABLE_METHODS = ('get_all_dimensions', 'get_all_variables')
+
+# Number of timestamps requested from get_netcdf_files.
+SAMPLE_TIMESTAMPS = 90
+
+
+def get_query_methods(db: SQLiteDatabase, variable: str, timestamps: list) -> dict:
+    """Returns the SQLiteDatabase query methods to check, bound to sample
+    arguments taken from the database itself.
+    """
+
+    return {
+        'get_netcdf_files': lambda: db.get_netcdf_files(timestamps, [variable]),
+        'get_timestamps': lambda: db.get_timestamps(variable),
+        'get_timestamp_range': lambda: db.get_timestamp_range(
+            timestamps[0], timestamps[-1], variable),
+        'get_latest_timestamp': lambda: db.get_latest_timestamp(variable),
+        'get_all_dimensions': db.get_all_dimensions,
+        'get_variable_dims': lambda: db.get_variable_dims(variable),
+        'get_variable_units': lambda: db.get_variable_units(variable),
+        'get_all_variables': db.get_all_variables,
+    }
+
+
+def capture_statements(db: SQLiteDatabase, func) -> list:
+    """Runs func and returns the SELECT statements it executed, with bound
+    parameters expanded.
+    """
+
+    statements = []
+    timestamp_index_cache.clear()
+    db.conn.set_trace_callback(statements.append)
+    try:
+        func()
+    finally:
+        db.conn.set_trace_callback(None)
+
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+
+def get_full_scans(conn: sqlite3.Connection, statement: str) -> list:
+    """Returns the EXPLAIN QUERY PLAN lines of a statement that scan a whole
+    (non-temp) table. Scans of a covering index only read the index and are
+    not reported.
+    """
+
+    scans = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + statement):
+        detail = row[-1]
+        if detail.startswith("SCAN") and "COVERING INDEX" not in detail \
+                and "Requested" not in detail:
+            scans.append(detail)
+
+    return scans
+
+
+def get_missing_indexes(conn: sqlite3.Connection) -> dict:
+    """Returns the entries of EXPECTED_INDEXES not covered by an existing index.
+    """
+
+    missing = {}
+    for name, (table, columns) in EXPECTED_INDEXES.items():
+        existing = []
+        for index in conn.execute("PRAGMA index_list({});".format(table)):
+            existing.append(tuple(
+                col[2] for col in conn.execute("PRAGMA index_info({});".format(index[1]))))
+
+        if not any(cols[:len(columns)] == columns for cols in existing):
+            missing[name] = (table, columns)
+
+    return missing
+
+
+def create_indexes(url: str, indexes: dict) -> None:
+    conn = sqlite3.connect(url)
+    try:
+        for name, (table, columns) in indexes.items():
+            print("Creating %s on %s(%s)" % (name, table, ", ".join(columns)))
+            conn.execute("CREATE INDEX IF NOT EXISTS {} ON {}({});".format(
+                name, table, ", ".join(columns)))
+        conn.execute("ANALYZE;")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def time_methods(url: str, variable: str, timestamps: list, repeat: int) -> dict:
+    """Returns the best time in seconds of the timed query methods. The
+    in-memory timestamp index is cleared before every call so the database
+    queries are what get measured.
+    """
+
+    def timed(func):
+        def run():
+            timestamp_index_cache.clear()
+            func()
+        return min(timeit.repeat(run, number=1, repeat=repeat))
+
+    with SQLiteDatabase(url) as db:
+        methods = get_query_methods(db, variable, timestamps)
+        return {name: timed(methods[name]) for name in
+                ('get_netcdf_files', 'get_timestamps', 'get_timestamp_range')}
+
+
+def report_plans(url: str, variable: str, timestamps: list) -> int:
+    """Prints the full scans of every query method and returns how many
+    were found.
+    """
+
+    found = 0
+    plan_conn = sqlite3.connect('file:{}?mode=ro'.format(url), uri=True)
+
+    with SQLiteDatabase(url) as db:
+        for name, func in get_query_methods(db, variable, timestamps).items():
+            if name in FULL_TABLE_METHODS:
+                continue
+
+            scans = []
+            for statement in capture_statements(db, func):
+                try:
+                    scans += get_full_scans(plan_conn, statement)
+                except sqlite3.OperationalError:
+                    # Statements on the temp tables of the pooled connection.
+                    continue
+
+            found += len(scans)
+            print("%-24s %s" % (name, "ok" if not scans else "FULL SCAN"))
+            for detail in scans:
+                print("    " + detail)
+
+    plan_conn.close()
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report and fix missing indexes in a dataset index database.")
+    parser.add_argument('database', help='Path to the .sqlite3 index')
+    parser.add_argument('--variable',
+                        help='Variable to run the sample queries for (default: first data variable)')
+    parser.add_argument('--apply', action='store_true',
+                        help='Create the missing indexes')
+    parser.add_argument('--repeat', type=int, default=5)
+    opts = parser.parse_args()
+
+    url = os.path.abspath(opts.database)
+
+    with SQLiteDatabase(url) as db:
+        variable = opts.variable or db.get_data_variables()[0].key
+        timestamps = db.get_timestamps(variable)[-SAMPLE_TIMESTAMPS:]
+
+    if not timestamps:
+        parser.error("No timestamps indexed for variable %s" % variable)
+
+    print("Query plans (variable %s, %d timestamps):" % (variable, len(timestamps)))
+    report_plans(url, variable, timestamps)
+
+    conn = sqlite3.connect('file:{}?mode=ro'.format(url), uri=True)
+    missing = get_missing_indexes(conn)
+    conn.close()
+
+    print()
+    if not missing:
+        print("All expected indexes are present.")
+        return
+
+    for name, (table, columns) in missing.items():
+        print("Missing index: %s on %s(%s)" % (name, table, ", ".join(columns)))
+
+    if not opts.apply:
+        print("Re-run with --apply to create them.")
+        return
+
+    before = time_methods(url, variable, timestamps, opts.repeat)
+    create_indexes(url, missing)
+    after = time_methods(url, variable, timestamps, opts.repeat)
+
+    print()
+    print("Query plans after migration:")
+    report_plans(url, variable, timestamps)
+
+    print()
+    print("%-24s %12s %12s" % ("", "before (ms)", "after (ms)"))
+    for name in before:
+        print("%-24s %12.2f %12.2f" % (name, before[name] * 1000, after[name] * 1000))
+
+
+if __name__ == '__main__':
+    main()
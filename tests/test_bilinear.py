@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from data.bilinear import bilinear_weights, get_bilinear_weights
+from data.grid_index import GridIndex, GridIndexCache
+from data.resample_weights import ResampleWeightCache
+
+
+def _curvilinear(ny=60, nx=80):
+    j, i = np.mgrid[0:ny, 0:nx]
+    lat = 40 + 0.05 * j + 0.01 * i
+    lon = -70 + 0.06 * i - 0.01 * j + 0.0002 * i * j
+    return lat, lon
+
+
+class TestBilinear(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = GridIndexCache(self.cache_dir)
+        self.lat, self.lon = _curvilinear()
+        self.index = GridIndex(self.lat, self.lon, cache=self.cache)
+
+        rng = np.random.RandomState(0)
+        self.lat_out = rng.uniform(41, 42.5, (20, 30))
+        self.lon_out = rng.uniform(-68, -66, (20, 30))
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_reproduces_coordinates(self):
+        weights = bilinear_weights(self.index, (0, 60, 0, 80), self.lat_out,
+                                   self.lon_out, 25000)
+
+        lat = weights.apply(self.lat)
+        lon = weights.apply(self.lon)
+
+        self.assertEqual(lat.shape, self.lat_out.shape)
+        self.assertFalse(np.any(lat.mask))
+        np.testing.assert_allclose(lat, self.lat_out, atol=1e-4)
+        np.testing.assert_allclose(lon, self.lon_out, atol=1e-4)
+
+    def test_grid_points(self):
+        weights = bilinear_weights(self.index, (0, 60, 0, 80),
+                                   self.lat[10:12, 20:23],
+                                   self.lon[10:12, 20:23], 25000)
+
+        data = np.arange(self.lat.size, dtype=float).reshape(self.lat.shape)
+        np.testing.assert_allclose(weights.apply(data), data[10:12, 20:23])
+
+    def test_window(self):
+        full = bilinear_weights(self.index, (0, 60, 0, 80), self.lat_out,
+                                self.lon_out, 25000)
+        window = bilinear_weights(self.index, (5, 50, 10, 70), self.lat_out,
+                                  self.lon_out, 25000)
+
+        data = np.ma.masked_array(np.sin(self.lat) * np.cos(self.lon))
+        np.testing.assert_allclose(window.apply(data[5:50, 10:70]),
+                                   full.apply(data))
+
+    def test_regular_grid(self):
+        lat = np.linspace(40, 50, 41)
+        lon = np.linspace(-70, -50, 81)
+        index = GridIndex(lat, lon, cache=self.cache)
+        lon_grid, lat_grid = np.meshgrid(lon, lat)
+
+        weights = bilinear_weights(index, (0, 41, 0, 81), self.lat_out,
+                                   self.lon_out, 25000)
+
+        # Exact for data that is linear in lat and lon
+        np.testing.assert_allclose(
+            weights.apply(2 * lat_grid - lon_grid),
+            2 * self.lat_out - self.lon_out)
+
+    def test_outside(self):
+        # Just off of the corner of the grid, and far away from it
+        weights = bilinear_weights(self.index, (0, 60, 0, 80),
+                                   np.array([39.95, 0]), np.array([-70, 0]),
+                                   25000)
+
+        result = weights.apply(self.lat)
+
+        self.assertAlmostEqual(result[0], self.lat[0, 0])
+        self.assertTrue(result.mask[1])
+
+    def test_masked_corners(self):
+        weights = bilinear_weights(self.index, (0, 60, 0, 80), self.lat_out,
+                                   self.lon_out, 25000)
+        data = np.ma.masked_array(np.full(self.lat.shape, 3.0))
+        data[30:, :] = np.ma.masked
+
+        result = weights.apply(data)
+
+        # The remaining corners are renormalized
+        np.testing.assert_allclose(result.compressed(), 3.0)
+        self.assertTrue(np.any(result.mask))
+
+    def test_cache(self):
+        cache = ResampleWeightCache()
+
+        weights = get_bilinear_weights(self.index, (0, 60, 0, 80),
+                                       self.lat_out, self.lon_out, 25000,
+                                       cache=cache)
+
+        self.assertIs(get_bilinear_weights(self.index, (0, 60, 0, 80),
+                                           self.lat_out.copy(), self.lon_out,
+                                           25000, cache=cache), weights)
+        get_bilinear_weights(self.index, (5, 50, 10, 70), self.lat_out,
+                             self.lon_out, 25000, cache=cache)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 2)
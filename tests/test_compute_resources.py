@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import os
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+from utils.compute_resources import MAX_THREADS, ComputeResources
+
+
+class TestComputeResources(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('os.sched_getaffinity', return_value=set(range(16)))
+    def test_divides_cpus_between_workers(self, _):
+        self.assertEqual(ComputeResources(workers=4).threads, 4)
+        self.assertEqual(ComputeResources(workers=32).threads, 1)
+        self.assertEqual(ComputeResources().workers, 1)
+        self.assertEqual(ComputeResources().threads, MAX_THREADS)
+
+    @patch.dict(os.environ, {'WEB_CONCURRENCY': '8'})
+    @patch('os.sched_getaffinity', return_value=set(range(16)))
+    def test_gunicorn_workers(self, _):
+        self.assertEqual(ComputeResources().workers, 8)
+        self.assertEqual(ComputeResources().threads, 2)
+
+    @patch('os.sched_getaffinity', return_value=set(range(16)))
+    def test_app_config(self, _):
+        self.app.config['COMPUTE_WORKERS'] = 2
+
+        with self.app.app_context():
+            self.assertEqual(ComputeResources().workers, 2)
+            self.assertEqual(ComputeResources().threads, 8)
+
+            self.app.config['COMPUTE_THREADS'] = 3
+            self.assertEqual(ComputeResources().threads, 3)
+            self.assertEqual(ComputeResources(threads=1).threads, 1)
+
+            self.app.config['COMPUTE_THREADS'] = 0
+            self.app.config['COMPUTE_WORKERS'] = 0
+            self.assertEqual(ComputeResources(workers=16).threads, 1)
+
+    def test_openmp_limits(self):
+        with patch('utils.compute_resources.threadpool_limits') as limits:
+            with ComputeResources(threads=2).openmp_limits():
+                pass
+            self.assertEqual(ComputeResources(threads=2).openmp_threads, 2)
+
+        limits.assert_called_once_with(limits=2, user_api='openmp')
+
+        # Without threadpoolctl, nothing is limited
+        with patch('utils.compute_resources.threadpool_limits', None):
+            with ComputeResources(threads=2).openmp_limits():
+                pass
+            self.assertIsNone(ComputeResources(threads=2).openmp_threads)
+
+    def test_stats(self):
+        stats = ComputeResources(threads=2, workers=3).stats
+
+        self.assertEqual(stats['threads'], 2)
+        self.assertEqual(stats['workers'], 3)
+        self.assertGreaterEqual(stats['cpus'], 1)
@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 
+import os
+import shutil
+import sqlite3
+import tempfile
 import unittest
 
-from data import open_dataset
+from data import get_index_signature, open_dataset
 from data.fvcom import Fvcom
 from data.mercator import Mercator
 from data.nemo import Nemo
@@ -22,3 +26,69 @@ class TestOpenDataset(unittest.TestCase):
     def test_open_dataset_returns_fvcom_object(self):
         with open_dataset('tests/testdata/fvcom_test.nc') as ds:
             self.assertTrue(isinstance(ds, Fvcom))
+
+
+class TestGetIndexSignature(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.url = os.path.join(self.tmpdir, "Historical.sqlite3")
+        shutil.copy('tests/testdata/databases/Historical.sqlite3', self.url)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __index(self, filepath, timestamp):
+        with sqlite3.connect(self.url) as conn:
+            conn.execute("INSERT OR IGNORE INTO Timestamps (timestamp) "
+                         "VALUES (?)", (timestamp, ))
+            conn.execute("INSERT INTO Filepaths (filepath) VALUES (?)",
+                         (filepath, ))
+            conn.execute(
+                """
+                INSERT INTO TimestampVariableFilepath
+                SELECT fp.id, v.id, t.id
+                FROM Filepaths fp, Variables v, Timestamps t
+                WHERE filepath = ? AND variable = 'vo' AND timestamp = ?
+                """, (filepath, timestamp))
+
+    def test_resolves_latest(self):
+        timestamp, signature = get_index_signature(self.url, 'vo', -1)
+
+        self.assertEqual(timestamp, 2145484800)
+        self.assertEqual(get_index_signature(self.url, ['vo'], 2145484800),
+                         (timestamp, signature))
+
+        # A new run
+        self.__index('/data/new_run.nc', 2145571200)
+
+        self.assertEqual(get_index_signature(self.url, 'vo', -1)[0],
+                         2145571200)
+
+    def test_changes_with_indexed_files(self):
+        latest = get_index_signature(self.url, 'vo', 2145484800)
+        previous = get_index_signature(self.url, 'vo', 2145398400)
+
+        self.__index('/data/replacement.nc', 2145484800)
+
+        self.assertNotEqual(
+            get_index_signature(self.url, 'vo', 2145484800), latest)
+        self.assertEqual(
+            get_index_signature(self.url, 'vo', 2145398400), previous)
+
+    def test_changes_with_rewritten_files(self):
+        f = os.path.join(self.tmpdir, "run.nc")
+        open(f, 'w').close()
+        os.utime(f, (0, 0))
+        self.__index(f, 2145484800)
+        signature = get_index_signature(self.url, 'vo', 2145484800)
+
+        os.utime(f, (0, 60))
+
+        self.assertNotEqual(
+            get_index_signature(self.url, 'vo', 2145484800), signature)
+
+    def test_unindexed(self):
+        self.assertEqual(
+            get_index_signature('tests/testdata/nemo_test.nc', 'votemper', -1),
+            (-1, None))
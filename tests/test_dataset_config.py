@@ -134,6 +134,39 @@ class TestUtil(unittest.TestCase):
         }
         self.assertEqual(DatasetConfig("dataset2").cache, None)
 
+    @patch.object(DatasetConfig, "_get_dataset_config")
+    def test_open_profile(self, m):
+        m.return_value = {
+            "ds": {
+                "open_profiles": {
+                    "default": {
+                        "parallel": True,
+                    },
+                    "tile": {
+                        "chunks": {"y": 256, "x": 256},
+                        "scheduler": "sync",
+                    },
+                }
+            },
+            "ds2": {
+            }
+        }
+
+        tile = DatasetConfig("ds").open_profile("tile")
+        self.assertEqual(tile["chunks"], {"y": 256, "x": 256})
+        self.assertTrue(tile["parallel"])
+        self.assertEqual(tile["scheduler"], "sync")
+
+        area = DatasetConfig("ds").open_profile("area")
+        self.assertIsNone(area["chunks"])
+        self.assertTrue(area["parallel"])
+
+        self.assertEqual(DatasetConfig("ds2").open_profile("tile"), {
+            "chunks": None, "parallel": False, "scheduler": None})
+
+        with self.assertRaises(ValueError):
+            DatasetConfig("ds").open_profile("not_a_kind")
+
     @patch.object(DatasetConfig, "_get_dataset_config")
     def test_get_variables(self, m):
         m.return_value = {
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from data.dataset_pool import DatasetPool
+
+
+class FakeHandle():
+
+    def __init__(self, url: str, **kwargs):
+        self.url = url
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestDatasetPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+        for name in ['a.nc', 'b.nc', 'c.nc']:
+            path = os.path.join(self.tmpdir, name)
+            open(path, 'w').close()
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_released_handle_is_reused(self):
+        pool = DatasetPool(max_handles=4, max_open_files=100)
+
+        h1 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1])
+        pool.release(h1)
+        h2 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1])
+
+        self.assertIs(h1, h2)
+        self.assertEqual(pool.hits, 1)
+        self.assertEqual(pool.misses, 1)
+
+    def test_different_file_sets_get_different_handles(self):
+        pool = DatasetPool(max_handles=4, max_open_files=100)
+
+        h1 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1])
+        pool.release(h1)
+        h2 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[1:2])
+
+        self.assertIsNot(h1, h2)
+
+    def test_different_open_profiles_get_different_handles(self):
+        pool = DatasetPool(max_handles=4, max_open_files=100)
+
+        h1 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1],
+                        open_profile={"chunks": {"x": 256}})
+        pool.release(h1)
+        h2 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1],
+                        open_profile={"chunks": {"x": 32}})
+
+        self.assertIsNot(h1, h2)
+
+    def test_leased_handle_is_not_shared(self):
+        pool = DatasetPool(max_handles=4, max_open_files=100)
+
+        h1 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1])
+        h2 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1])
+
+        self.assertIsNot(h1, h2)
+
+    def test_lru_eviction_by_handle_count(self):
+        pool = DatasetPool(max_handles=2, max_open_files=100)
+
+        handles = [
+            pool.lease(FakeHandle, "db.sqlite3", nc_files=[f]) for f in self.files
+        ]
+        for h in handles:
+            pool.release(h)
+
+        self.assertTrue(handles[0].closed)
+        self.assertFalse(handles[1].closed)
+        self.assertFalse(handles[2].closed)
+        self.assertEqual(pool.stats['handles'], 2)
+
+    def test_eviction_by_open_file_budget(self):
+        pool = DatasetPool(max_handles=10, max_open_files=3)
+
+        h1 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:2])
+        h2 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[1:])
+        pool.release(h1)
+        pool.release(h2)
+
+        self.assertTrue(h1.closed)
+        self.assertFalse(h2.closed)
+        self.assertEqual(pool.stats['open_files'], 2)
+
+    def test_handle_dropped_when_file_changes(self):
+        pool = DatasetPool(max_handles=4, max_open_files=100)
+
+        h1 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1])
+        pool.release(h1)
+
+        mtime = os.path.getmtime(self.files[0])
+        os.utime(self.files[0], (mtime + 10, mtime + 10))
+
+        h2 = pool.lease(FakeHandle, "db.sqlite3", nc_files=self.files[:1])
+
+        self.assertIsNot(h1, h2)
+        self.assertTrue(h1.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import unittest
+from unittest.mock import patch
+
+import data.dimension_cache as dimension_cache
+
+
+class TestDimensionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.historical_db = 'tests/testdata/databases/Historical.sqlite3'
+        dimension_cache.clear()
+
+    def test_get_dimensions_returns_dims_for_sqlite(self):
+        expected_dims = sorted(
+            ['axis_nbounds', 'depthv', 'time_counter', 'x', 'y'])
+
+        dims = sorted(dimension_cache.get_dimensions(self.historical_db))
+
+        self.assertEqual(expected_dims, dims)
+
+    def test_get_model_type_returns_nemo(self):
+        self.assertEqual(dimension_cache.get_model_type(
+            self.historical_db), "nemo")
+        self.assertEqual(dimension_cache.get_model_type(
+            'tests/testdata/nemo_test.nc'), "nemo")
+
+    def test_get_variable_dimensions_returns_data_variables(self):
+        dims = dimension_cache.get_variable_dimensions(self.historical_db)
+
+        self.assertEqual(sorted(dims.keys()), ['vo', 'zos'])
+        self.assertEqual(sorted(dims['vo']), sorted(
+            ["depthv", "time_counter", "x", "y"]))
+
+    @patch('data.sqlite_database.SQLiteDatabase.get_all_dimensions')
+    def test_dimensions_are_probed_once(self, mock_query_func):
+        mock_query_func.return_value = ['time_counter', 'x', 'y']
+
+        dimension_cache.get_dimensions(self.historical_db)
+        dimension_cache.get_model_type(self.historical_db)
+        dimension_cache.get_dimensions(self.historical_db)
+
+        self.assertEqual(mock_query_func.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
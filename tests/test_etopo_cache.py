@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+from scipy.ndimage import gaussian_filter
+
+from data.etopo_cache import BLURRED, RAW, EtopoCache
+
+
+def _write_etopo(path, z):
+    with Dataset(path, 'w') as dataset:
+        dataset.createDimension('y', z.shape[0])
+        dataset.createDimension('x', z.shape[1])
+        dataset.createVariable('z', 'f4', ('y', 'x'))[:] = z
+
+
+class TestEtopoCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.etopo_file = os.path.join(self.tmpdir.name, "etopo_%s_z%d.nc")
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+
+        # 4x4 tiles of land (100 m) with an ocean (-1000 m) tile at (0, 1),
+        # and an ocean strip along the east of tile (1, 0)
+        rng = np.random.RandomState(0)
+        self.z = np.full((1024, 1024), 100.0) + rng.uniform(0, 50, (1024, 1024))
+        self.z[256:512, 0:256] = -1000
+        self.z[0:256, 500:512] = -1000
+        _write_etopo(self.etopo_file % ('EPSG:3857', 2), self.z)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _cache(self):
+        return EtopoCache(self.cache_dir, self.etopo_file)
+
+    def test_window(self):
+        cache = self._cache()
+
+        window = cache.window('EPSG:3857', 2, 1, 2)
+        np.testing.assert_array_equal(
+            window, self.z[512:768, 256:512].astype(np.float32))
+        self.assertEqual(cache.window('EPSG:3857', 2, 2, 2, n=2).shape,
+                         (512, 512))
+        self.assertFalse(window.flags.writeable)
+
+    def test_blurred(self):
+        window = self._cache().window('EPSG:3857', 2, 1, 0, variant=BLURRED)
+
+        # Smoothed as a tile on its own
+        np.testing.assert_array_equal(
+            window, gaussian_filter(self.z[0:256, 256:512].astype(np.float32),
+                                    0.5))
+
+    def test_land_ocean(self):
+        cache = self._cache()
+
+        self.assertTrue(cache.is_land('EPSG:3857', 2, 3, 3, 0))
+        self.assertFalse(cache.is_land('EPSG:3857', 2, 1, 0, 0))
+        self.assertFalse(cache.is_land('EPSG:3857', 2, 0, 1, 0))
+        self.assertTrue(cache.is_ocean('EPSG:3857', 2, 0, 1, 0))
+        self.assertFalse(cache.is_ocean('EPSG:3857', 2, 1, 0, 0))
+
+        # Deeper than the ocean, everything is land
+        self.assertTrue(cache.is_land('EPSG:3857', 2, 0, 1, 2000))
+        # Of a block of tiles
+        self.assertTrue(cache.is_land('EPSG:3857', 2, 2, 0, 0, n=2))
+        self.assertFalse(cache.is_land('EPSG:3857', 2, 0, 0, 0, n=2))
+
+        self.assertEqual(cache.tile_range('EPSG:3857', 2, 0, 1, variant=RAW),
+                         (-1000, -1000))
+
+    def test_persisted(self):
+        cache = self._cache()
+        cache.raster('EPSG:3857', 2)
+        cache.raster('EPSG:3857', 2)
+        self.assertEqual(cache.stats['conversions'], 1)
+        self.assertEqual(cache.stats['hits'], 1)
+
+        # e.g. another worker process
+        cache = self._cache()
+        np.testing.assert_array_equal(cache.raster('EPSG:3857', 2),
+                                      self.z.astype(np.float32))
+        self.assertEqual(cache.stats['conversions'], 0)
+        self.assertEqual(cache.stats['disk_hits'], 1)
+
+    def test_source_changed(self):
+        cache = self._cache()
+        self.assertFalse(cache.is_land('EPSG:3857', 2, 0, 1, 0))
+
+        self.z[:] = 100
+        path = self.etopo_file % ('EPSG:3857', 2)
+        _write_etopo(path, self.z)
+        os.utime(path, ns=(0, 0))
+
+        self.assertTrue(cache.is_land('EPSG:3857', 2, 0, 1, 0))
+        self.assertEqual(cache.stats['conversions'], 2)
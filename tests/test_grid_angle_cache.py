@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import xarray as xr
+
+import data.grid_angle_cache as grid_angle_cache
+from data.nemo import Nemo
+from data.variable import Variable
+from data.variable_list import VariableList
+
+
+class TestGridAngleCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.angle_file = os.path.join(self.tmpdir, "grid_angle.nc")
+
+        alpha = np.linspace(0, np.pi / 4, 76 * 101).reshape(76, 101)
+        xr.Dataset({
+            'sin_alpha': (('y', 'x'), np.sin(alpha)),
+            'cos_alpha': (('y', 'x'), np.cos(alpha)),
+            'nav_lat': (('y', 'x'), np.zeros((76, 101))),
+        }).to_netcdf(self.angle_file)
+
+        grid_angle_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_angles_are_loaded_once_and_read_only(self):
+        first = grid_angle_cache.get_grid_angles(self.angle_file, ['nav_lat'])
+        second = grid_angle_cache.get_grid_angles(self.angle_file, ['nav_lat'])
+
+        self.assertEqual(sorted(first.keys()), ['cos_alpha', 'sin_alpha'])
+        self.assertIs(first['sin_alpha'].values, second['sin_alpha'].values)
+        self.assertFalse(first['sin_alpha'].values.flags.writeable)
+
+    @patch('data.sqlite_database.SQLiteDatabase.get_data_variables')
+    def test_angles_attached_only_when_used(self, mock_query_func):
+        mock_query_func.return_value = VariableList([
+            Variable('votemper', 'Water temperature at CMC',
+                     'Kelvins', ["time_counter", "deptht", "y", "x"])
+        ])
+        rotated = {
+            'u_east': {'equation': 'votemper * cos_alpha'}
+        }
+
+        with Nemo('tests/testdata/nemo_test.nc', calculated=rotated,
+                  grid_angle_file_url=self.angle_file) as n:
+            n.get_dataset_variable('votemper')
+            self.assertNotIn('cos_alpha', n._dataset.variables)
+
+            n.get_dataset_variable('u_east')
+
+            self.assertIn('cos_alpha', n._dataset.variables)
+            self.assertNotIn('sin_alpha', n._dataset.variables)
+            np.testing.assert_allclose(
+                n._dataset.variables['cos_alpha'][10, 10],
+                np.cos(np.linspace(0, np.pi / 4, 76 * 101)[10 * 101 + 10]))
+
+if __name__ == '__main__':
+    unittest.main()
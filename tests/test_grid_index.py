@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from math import pi
+
+import numpy as np
+from pykdtree.kdtree import KDTree
+
+from data.grid_index import GridIndex, GridIndexCache
+
+
+def _mesh(ny=40, nx=60):
+    lon, lat = np.meshgrid(np.linspace(-70, -40, nx, dtype=np.float32),
+                           np.linspace(40, 60, ny, dtype=np.float32))
+    # Curvilinear, so the rows aren't all the same
+    return lat + 0.01 * lon, lon
+
+
+class TestGridIndexCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = GridIndexCache(cache_dir=self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_reuses_tree(self):
+        lat, lon = _mesh()
+
+        kdt, shape = self.cache.get(lat, lon)
+        self.assertEqual(shape, (40, 60))
+        self.assertIs(self.cache.get(lat.copy(), lon.copy())[0], kdt)
+        self.assertEqual(self.cache.stats['builds'], 1)
+        self.assertEqual(self.cache.stats['hits'], 1)
+
+        self.cache.get(*_mesh(ny=41))
+        self.assertEqual(self.cache.stats['builds'], 2)
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 2)
+
+    def test_triples_loaded_from_disk(self):
+        lat, lon = _mesh()
+        self.cache.get(lat, lon)
+
+        other = GridIndexCache(cache_dir=self.tmpdir.name)
+        kdt, _ = other.get(lat, lon)
+        self.assertEqual(other.stats['builds'], 0)
+        self.assertEqual(other.stats['disk_hits'], 1)
+        self.assertIsInstance(kdt.data_pts, np.ndarray)
+
+    def test_matches_direct_tree(self):
+        lat, lon = _mesh()
+        latvals, lonvals = lat * (pi / 180.0), lon * (pi / 180.0)
+        triples = np.array([
+            np.ravel(np.cos(latvals) * np.cos(lonvals)),
+            np.ravel(np.cos(latvals) * np.sin(lonvals)),
+            np.ravel(np.sin(latvals)),
+        ]).transpose()
+        expected = KDTree(triples)
+
+        q = np.float32([[0.3, -0.5, 0.8], [0.2, -0.6, 0.75]])
+        for cache in (self.cache, GridIndexCache(cache_dir=self.tmpdir.name)):
+            kdt, _ = cache.get(lat, lon)
+            for k in (1, 4):
+                d0, i0 = expected.query(q, k=k)
+                d1, i1 = kdt.query(q, k=k)
+                np.testing.assert_array_equal(i0, i1)
+                np.testing.assert_array_equal(d0, d1)
+
+    def test_regular_grid(self):
+        lat = np.linspace(40, 60, 21)
+        lon = np.linspace(-70, -40, 31)
+
+        kdt, shape = self.cache.get(lat, lon)
+        self.assertEqual(shape, (21, 31))
+        self.assertEqual(kdt.n, 21 * 31)
+
+
+class TestGridIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = GridIndexCache(cache_dir=self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_kinds(self):
+        lat, lon = _mesh()
+        self.assertEqual(GridIndex(lat, lon, cache=self.cache).kind,
+                         GridIndex.CURVILINEAR)
+        self.assertEqual(GridIndex(lat[:, 0], lon[0], cache=self.cache).kind,
+                         GridIndex.REGULAR)
+
+        index = GridIndex(lat.ravel(), lon.ravel(), unstructured=True,
+                          cache=self.cache)
+        self.assertEqual(index.kind, GridIndex.UNSTRUCTURED)
+        self.assertEqual(index.shape, (40 * 60, ))
+
+    def test_squeezes_mesh_variables(self):
+        lat, lon = _mesh()
+        index = GridIndex(lat[np.newaxis, np.newaxis], lon[np.newaxis, np.newaxis],
+                          cache=self.cache)
+        self.assertEqual(index.shape, (40, 60))
+
+    def test_nearest(self):
+        lat, lon = _mesh()
+        index = GridIndex(lat, lon, cache=self.cache)
+
+        _, (iy, ix) = index.nearest(lat[12, 34], lon[12, 34])
+        self.assertEqual((iy[0], ix[0]), (12, 34))
+
+        dist, (iy, ix) = index.nearest([lat[1, 2], lat[3, 4]],
+                                       [lon[1, 2], lon[3, 4]], n=4)
+        self.assertEqual(iy.shape, (2, 4))
+        self.assertEqual((iy[1, 0], ix[1, 0]), (3, 4))
+        self.assertTrue(np.all(np.diff(dist, axis=1) >= 0))
+
+        unstructured = GridIndex(lat.ravel(), lon.ravel(), unstructured=True,
+                                 cache=self.cache)
+        _, (i, ) = unstructured.nearest(lat[12, 34], lon[12, 34])
+        self.assertEqual(i[0], 12 * 60 + 34)
+
+    def test_bounding_box(self):
+        lat, lon = _mesh()
+        index = GridIndex(lat, lon, cache=self.cache)
+
+        limits, dist = index.bounding_box(lat[20, 30], lon[20, 30], 10)
+        self.assertGreater(dist, 0)
+        for (mn, mx), i in zip(limits, (20, 30)):
+            self.assertLess(mn, i)
+            self.assertGreater(mx, i)
+
+        # Clipped to the grid
+        limits, _ = index.bounding_box(lat[0, 0], lon[0, 0], 10, padding=5)
+        self.assertEqual((limits[0][0], limits[1][0]), (0, 0))
+        limits, _ = index.bounding_box(lat[-1, -1], lon[-1, -1], 10, padding=5)
+        self.assertEqual((limits[0][1], limits[1][1]), (40, 60))
+
+    def test_within(self):
+        lat = np.linspace(40, 41, 11)
+        lon = np.zeros(11)
+        index = GridIndex(lat, lon, unstructured=True, cache=self.cache)
+
+        # Points are ~11.1 km apart
+        i, = index.within(40.5, 0, 15000)
+        np.testing.assert_array_equal(i, [4, 5, 6])
+        i, = index.within([40, 41], [0, 0], 5000)
+        np.testing.assert_array_equal(i, [0, 10])
+
+
+class TestRegularGridIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = GridIndexCache(cache_dir=self.tmpdir.name)
+        self.rng = np.random.RandomState(0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def __compare(self, lat, lon, qlat, qlon):
+        axes = GridIndex(lat, lon, cache=self.cache)
+        kdtree = GridIndex(lat, lon, cache=self.cache, use_axes=False)
+        self.assertIsNone(kdtree._axes)
+
+        for n in (1, 4, 10):
+            d0, (y0, x0) = kdtree.nearest(qlat, qlon, n)
+            d1, (y1, x1) = axes.nearest(qlat, qlon, n)
+            np.testing.assert_array_equal(y0, y1)
+            np.testing.assert_array_equal(x0, x1)
+            np.testing.assert_array_equal(d0, d1)
+
+            b0 = kdtree.bounding_box(qlat[:5], qlon[:5], n)[0]
+            b1 = axes.bounding_box(qlat[:5], qlon[:5], n)[0]
+            self.assertEqual(b0, b1)
+
+        return axes
+
+    def test_global(self):
+        lat = np.linspace(-80, 80, 321, dtype=np.float32)
+        lon = np.arange(-180, 180, 0.5, dtype=np.float32)
+        qlat = self.rng.uniform(-78, 78, 2000)
+        qlon = self.rng.uniform(-180, 180, 2000)
+
+        axes = self.__compare(lat, lon, qlat, qlon)
+        self.assertIsNotNone(axes._axes)
+        self.assertEqual(self.cache.stats['builds'], 1)  # Only for comparison
+
+        # 0 to 360 longitudes, queried with -180 to 180
+        self.__compare(lat, np.arange(0, 360, 0.5), qlat, qlon)
+
+    def test_regional(self):
+        # Crosses the antimeridian, with descending latitudes
+        lat = np.linspace(60, 30, 151)
+        lon = np.linspace(150, 210, 241)
+        qlat = self.rng.uniform(30, 60, 2000)
+        qlon = self.rng.uniform(150, 210, 2000)
+        qlon[::2] -= 360
+
+        self.__compare(lat, lon, qlat, qlon)
+
+    def test_no_tree(self):
+        lat = np.linspace(30, 60, 121)
+        lon = np.linspace(-70, -40, 121)
+
+        index = GridIndex(lat, lon, cache=self.cache)
+        _, (iy, ix) = index.nearest([45.1, 45.2], [-55.1, -55.2], 4)
+        self.assertEqual(iy.shape, (2, 4))
+        self.assertEqual(self.cache.stats['builds'], 0)
+
+    def test_duplicate_longitudes_fall_back(self):
+        lat = np.linspace(30, 60, 121)
+        lon = np.concatenate([np.linspace(-70, -40, 60), np.linspace(-70, -40, 61)])
+
+        self.assertIsNone(GridIndex(lat, lon, cache=self.cache)._axes)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import data.metadata_snapshot as metadata_snapshot
+
+
+class TestMetadataSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmpdir, "Historical.sqlite3")
+        shutil.copy('tests/testdata/databases/Historical.sqlite3', self.db)
+
+        self.config = Mock(url=self.db, calculated_variables={})
+        self.content = {
+            'version': metadata_snapshot.SNAPSHOT_VERSION,
+            'dataset': 'historical',
+            'index': metadata_snapshot._get_index_signature(self.db),
+            'calculated': metadata_snapshot._get_calculated_hash(self.config),
+            'time_dim_units': 'seconds since 1950-01-01 00:00:00',
+            'variables': [
+                {'key': 'vo', 'name': 'Sea Water Y Velocity', 'unit': 'm/s',
+                 'dimensions': ['time_counter', 'deptht', 'y', 'x'],
+                 'valid_min': None, 'valid_max': None,
+                 'depth_axis': 0, 'time_axis': 0},
+                {'key': 'zos', 'name': 'Sea Surface Height', 'unit': 'm',
+                 'dimensions': ['time_counter', 'y', 'x'],
+                 'valid_min': None, 'valid_max': None,
+                 'depth_axis': None, 'time_axis': 0},
+            ],
+            'depth_axes': [[0.494, 1.541, 2.646]],
+            'time_axes': [[2144966400, 2145052800]],
+        }
+        self.__write(self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __write(self, content):
+        with open(metadata_snapshot.get_snapshot_path(self.db), 'w') as f:
+            json.dump(content, f)
+
+    def test_snapshot_is_read(self):
+        snapshot = metadata_snapshot.get_snapshot(self.config)
+
+        self.assertEqual([v.key for v in snapshot.variables], ['vo', 'zos'])
+        self.assertTrue(snapshot.variables['vo'].has_depth())
+        self.assertEqual(list(snapshot.depths('vo')), [0.494, 1.541, 2.646])
+        self.assertEqual(list(snapshot.depths('zos')), [0])
+        self.assertEqual(snapshot.timestamps('zos'), [2144966400, 2145052800])
+
+    def test_stale_snapshot_is_ignored(self):
+        st = os.stat(self.db)
+        os.utime(self.db, (st.st_atime, st.st_mtime + 10))
+
+        self.assertIsNone(metadata_snapshot.get_snapshot(self.config))
+
+    def test_snapshot_ignored_when_calculated_variables_change(self):
+        self.config.calculated_variables = {'speed': {'equation': 'vo * 2'}}
+
+        self.assertIsNone(metadata_snapshot.get_snapshot(self.config))
+
+    def test_snapshot_ignored_when_index_is_gone(self):
+        os.remove(self.db)
+
+        self.assertIsNone(metadata_snapshot.get_snapshot(self.config))
+
+    def test_missing_snapshot(self):
+        os.remove(metadata_snapshot.get_snapshot_path(self.db))
+
+        self.assertIsNone(metadata_snapshot.get_snapshot(self.config))
+
+
+if __name__ == '__main__':
+    unittest.main()
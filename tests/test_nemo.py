@@ -4,9 +4,11 @@ import datetime
 import unittest
 from unittest.mock import patch
 
+import dask
 import numpy as np
 import pytz
 
+from data.grid_index import GridIndex
 from data.nemo import Nemo
 from data.variable import Variable
 from data.variable_list import VariableList
@@ -76,6 +78,34 @@ class TestNemo(unittest.TestCase):
                 299.17, places=2
             )
 
+    def test_open_profile_scheduler(self):
+        profile = {'chunks': {'deptht': 10}, 'scheduler': 'sync'}
+        scheduler = dask.config.get('scheduler', None)
+
+        with patch('dask.base.get_scheduler',
+                   wraps=dask.base.get_scheduler) as get_scheduler:
+            with Nemo('tests/testdata/nemo_test.nc',
+                      open_profile=profile) as n:
+                self.assertAlmostEqual(
+                    n.get_point(13.0, -149.0, 0, 2031436800, 'votemper'),
+                    299.17, places=2
+                )
+                # Passed to dask, not set in its process-wide config
+                self.assertEqual(dask.config.get('scheduler', None),
+                                 scheduler)
+
+        self.assertIn('synchronous', [c[1].get('scheduler')
+                                      for c in get_scheduler.call_args_list])
+
+    def test_grid_index_reused(self):
+        with patch('data.netcdf_data.GridIndex',
+                   wraps=GridIndex) as grid_index:
+            with Nemo('tests/testdata/nemo_test.nc') as n:
+                n.get_point(13.0, -149.0, 0, 2031436800, 'votemper')
+                n.get_profile(13.0, -149.0, 2031436800, 'votemper')
+
+        grid_index.assert_called_once()
+
     def test_get_raw_point(self):
         with Nemo('tests/testdata/nemo_test.nc') as n:
             lat, lon, data = n.get_raw_point(
@@ -137,6 +167,28 @@ class TestNemo(unittest.TestCase):
             r = n.get_area(a, 0, 2031436800, 'votemper', "inverse", 25000, 10)
             self.assertAlmostEqual(r[5, 5], 301.2795, places=4)
 
+    def test_get_area_float32(self):
+        with Nemo('tests/testdata/nemo_test.nc') as n:
+            a = np.array(
+                np.meshgrid(
+                    np.linspace(5, 10, 10),
+                    np.linspace(-150, -160, 10)
+                )
+            )
+
+            for interp in ["gaussian", "bilinear", "nearest", "inverse",
+                           "exact_bilinear"]:
+                expected = n.get_area(a, 0, 2031436800, 'votemper', interp,
+                                      25000, 10)
+                r = n.get_area(a, 0, 2031436800, 'votemper', interp, 25000,
+                               10, dtype=np.float32)
+
+                self.assertEqual(r.dtype, np.float32)
+                self.assertEqual(r.shape, expected.shape)
+                # Within float32 rounding of the values
+                np.testing.assert_allclose(r, expected, rtol=1e-6,
+                                           err_msg=interp)
+
     def test_get_path_profile(self):
         with Nemo('tests/testdata/nemo_test.nc') as n:
             p, d, r, dep = n.get_path_profile(
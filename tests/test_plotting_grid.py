@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from plotting.grid import resample
+from utils.compute_resources import compute_resources
+
+
+class TestResample(unittest.TestCase):
+
+    def test_openmp_limits(self):
+        lon, lat = np.meshgrid(np.linspace(-64, -61, 30),
+                               np.linspace(44, 46, 20))
+        data = np.ma.masked_array(lat + lon, mask=False)
+
+        for method in ('inv_square', 'bilinear', 'nn'):
+            with patch.object(compute_resources, 'openmp_limits') as limits:
+                res = resample(lat, lon, np.array([45.0]), np.array([-62.5]),
+                               data, method=method, radius_of_influence=25000)
+
+            limits.assert_called_once_with()
+            limits.return_value.__enter__.assert_called_once_with()
+            limits.return_value.__exit__.assert_called_once()
+            self.assertAlmostEqual(float(res[0]), 45.0 - 62.5, places=1)
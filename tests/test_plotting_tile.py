@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, PropertyMock, patch
+
+import numpy as np
+from flask import Flask
+from netCDF4 import Dataset
+from PIL import Image
+
+from data.etopo_cache import EtopoCache
+from data.nemo import Nemo
+from plotting.tile import (deg2num, get_latlon_coords, get_metatile,
+                           get_metatile_latlon_coords, plot, plot_metatile)
+
+
+class TestMetatile(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['AREA_DTYPE'] = None
+
+    def test_get_metatile(self):
+        self.assertEqual(get_metatile(5, 6, 3, 4), (4, 4, 4))
+        self.assertEqual(get_metatile(4, 4, 3, 4), (4, 4, 4))
+        self.assertEqual(get_metatile(1, 0, 1, 4), (0, 0, 2))
+        self.assertEqual(get_metatile(7, 7, 5, 3), (6, 6, 2))
+        self.assertEqual(get_metatile(3, 5, 3, 1), (3, 5, 1))
+
+    def test_latlon_coords(self):
+        for projection in ('EPSG:3857', 'EPSG:32661'):
+            lat, lon = get_metatile_latlon_coords(projection, 4, 6, 4, 2)
+            self.assertEqual(lat.shape, (512, 512))
+
+            tile_lat, tile_lon = get_latlon_coords(projection, 5, 6, 4)
+            if len(tile_lat.shape) == 1:
+                tile_lat, tile_lon = np.meshgrid(tile_lat, tile_lon)
+            np.testing.assert_array_equal(lat[256:, :256], tile_lat)
+            np.testing.assert_array_equal(lon[256:, :256], tile_lon)
+
+    def test_plot_metatile(self):
+        z = 9
+        x, y = deg2num(10, -152, z)
+        args = {
+            'interp': 'gaussian',
+            'radius': 25000,
+            'neighbours': 10,
+            'dataset': 'nemo',
+            'variable': 'votemper',
+            'time': 2031436800,
+            'depth': 0,
+            'scale': '270,310',
+            'display': 'default',
+        }
+        config = MagicMock()
+        config.variable.__getitem__.return_value.scale_factor = 1.0
+
+        with self.app.app_context(), \
+                patch('plotting.tile.DatasetConfig', return_value=config), \
+                patch.object(Nemo, 'variables', new_callable=PropertyMock,
+                             return_value={'votemper': 'votemper'}), \
+                patch('plotting.tile.open_dataset',
+                      side_effect=lambda *a, **kw: Nemo(
+                          'tests/testdata/nemo_test.nc')):
+            tiles = plot_metatile('EPSG:3857', x, y, z, args, 2)
+
+            x0, y0, _ = get_metatile(x, y, z, 2)
+            self.assertEqual(sorted(tiles), [(x0, y0), (x0, y0 + 1),
+                                             (x0 + 1, y0), (x0 + 1, y0 + 1)])
+
+            # Each tile is the one rendered on its own
+            for (tile_x, tile_y), buf in tiles.items():
+                np.testing.assert_array_equal(
+                    np.asarray(Image.open(buf)),
+                    np.asarray(Image.open(plot('EPSG:3857', tile_x, tile_y,
+                                               z, args))))
+
+    def test_land(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            etopo_file = os.path.join(tmpdir, "etopo_%s_z%d.nc")
+            with Dataset(etopo_file % ('EPSG:3857', 2), 'w') as dataset:
+                dataset.createDimension('y', 1024)
+                dataset.createDimension('x', 1024)
+                dataset.createVariable('z', 'f4', ('y', 'x'))[:] = 100
+            cache = EtopoCache(os.path.join(tmpdir, "cache"), etopo_file)
+
+            with self.app.app_context(), \
+                    patch('plotting.tile.etopo_cache', cache), \
+                    patch('plotting.tile.open_dataset') as open_dataset:
+                tiles = plot_metatile('EPSG:3857', 1, 2, 2, {}, 2)
+
+        # Blank, without reading the dataset
+        open_dataset.assert_not_called()
+        self.assertEqual(sorted(tiles), [(0, 2), (0, 3), (1, 2), (1, 3)])
+        for buf in tiles.values():
+            np.testing.assert_array_equal(np.asarray(Image.open(buf)), 0)
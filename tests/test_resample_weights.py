@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+import pyresample
+
+from data.resample_weights import ResampleWeightCache, compute_weights
+
+
+def _window(ny=20, nx=30):
+    lon, lat = np.meshgrid(np.linspace(-64, -61, nx), np.linspace(44, 46, ny))
+    return lat, lon
+
+
+def _targets():
+    lon, lat = np.meshgrid(np.linspace(-63.5, -61.5, 12),
+                           np.linspace(44.2, 45.8, 10))
+    return lat, lon
+
+
+class TestResampleWeights(unittest.TestCase):
+
+    def setUp(self):
+        self.lat_in, self.lon_in = _window()
+        self.lat_out, self.lon_out = _targets()
+        self.data = np.ma.masked_array(
+            self.lat_in * 2 + self.lon_in, mask=False)
+
+    def __pyresample(self, data, method):
+        input_def = pyresample.geometry.SwathDefinition(
+            lons=self.lon_in, lats=self.lat_in)
+        output_def = pyresample.geometry.SwathDefinition(
+            lons=self.lon_out, lats=self.lat_out)
+
+        if method == "gaussian":
+            return pyresample.kd_tree.resample_gauss(
+                input_def, data, output_def, radius_of_influence=25000.,
+                sigmas=12500., fill_value=None)
+        if method == "nearest":
+            return pyresample.kd_tree.resample_nearest(
+                input_def, data, output_def, radius_of_influence=25000.)
+
+        def weight(r):
+            r = np.clip(r, np.finfo(r.dtype).eps, np.finfo(r.dtype).max)
+            return 1. / r ** (2 if method == "inverse" else 1)
+
+        return pyresample.kd_tree.resample_custom(
+            input_def, data, output_def, radius_of_influence=25000.,
+            neighbours=10, weight_funcs=weight, fill_value=None)
+
+    def test_matches_pyresample(self):
+        for method in ["gaussian", "bilinear", "inverse", "nearest"]:
+            weights = compute_weights(self.lat_in, self.lon_in, self.lat_out,
+                                      self.lon_out, method, 25000, 10)
+
+            result = weights.apply(self.data)
+
+            self.assertEqual(result.shape, self.lat_out.shape)
+            np.testing.assert_allclose(
+                result, self.__pyresample(self.data, method), rtol=1e-10,
+                err_msg=method)
+
+    def test_stack(self):
+        weights = compute_weights(self.lat_in, self.lon_in, self.lat_out,
+                                  self.lon_out, "bilinear", 25000, 10)
+        stack = np.ma.stack([self.data, self.data * 2, -self.data], axis=-1)
+
+        result = weights.apply(stack)
+
+        self.assertEqual(result.shape, self.lat_out.shape + (3, ))
+        single = weights.apply(self.data)
+        np.testing.assert_allclose(result[..., 0], single)
+        np.testing.assert_allclose(result[..., 1], single * 2)
+        np.testing.assert_allclose(result[..., 2], -single)
+
+    def test_stack_masked_per_level(self):
+        weights = compute_weights(self.lat_in, self.lon_in, self.lat_out,
+                                  self.lon_out, "inverse", 25000, 10)
+        levels = []
+        for i in range(4):
+            level = self.data + i
+            level[:, :i * 6] = np.ma.masked
+            levels.append(level)
+
+        result = weights.apply(np.ma.stack(levels, axis=-1))
+
+        for i, level in enumerate(levels):
+            expected = weights.apply(level)
+            np.testing.assert_array_equal(result.mask[..., i], expected.mask)
+            np.testing.assert_allclose(result[..., i].compressed(),
+                                       expected.compressed())
+
+    def test_float32(self):
+        data = np.ma.stack([self.data, self.data * 2], axis=-1)
+        data[:, :5] = np.ma.masked
+
+        for method in ["gaussian", "bilinear", "inverse", "nearest"]:
+            weights = compute_weights(self.lat_in, self.lon_in, self.lat_out,
+                                      self.lon_out, method, 25000, 10)
+
+            result = weights.apply(data.astype(np.float32), np.float32)
+
+            expected = weights.apply(data)
+            self.assertEqual(result.dtype, np.float32)
+            np.testing.assert_array_equal(result.mask, expected.mask)
+            np.testing.assert_allclose(result.compressed(),
+                                       expected.compressed(), rtol=1e-6,
+                                       err_msg=method)
+
+    def test_masked_input(self):
+        weights = compute_weights(self.lat_in, self.lon_in, self.lat_out,
+                                  self.lon_out, "bilinear", 25000, 10)
+        data = np.ma.masked_array(np.full(self.lat_in.shape, 3.0))
+        data[:, :15] = np.ma.masked
+        data[:, 15:18] = np.nan
+
+        result = weights.apply(data)
+
+        # The remaining neighbours are renormalized ...
+        np.testing.assert_allclose(result.compressed(), 3.0)
+        # ... and targets without any are masked.
+        self.assertTrue(np.all(result.mask[:, self.lon_out[0] < -62.6]))
+        self.assertFalse(np.any(result.mask[:, self.lon_out[0] > -62]))
+
+    def test_outside(self):
+        weights = compute_weights(self.lat_in, self.lon_in, np.array([45, 0]),
+                                  np.array([-62.5, 0]), "inverse", 25000, 10)
+
+        result = weights.apply(self.data)
+
+        self.assertFalse(result.mask[0])
+        self.assertTrue(result.mask[1])
+
+
+class TestResampleWeightCache(unittest.TestCase):
+
+    def test_reuses_weights(self):
+        cache = ResampleWeightCache()
+        lat_in, lon_in = _window()
+        lat_out, lon_out = _targets()
+
+        w = cache.get(lat_in, lon_in, lat_out, lon_out, "bilinear", 25000, 10)
+        self.assertIs(cache.get(lat_in.copy(), lon_in.copy(), lat_out,
+                                lon_out, "bilinear", 25000, 10), w)
+        self.assertEqual(cache.stats['hits'], 1)
+
+        cache.get(lat_in, lon_in, lat_out, lon_out, "inverse", 25000, 10)
+        cache.get(lat_in, lon_in, lat_out, lon_out, "bilinear", 30000, 10)
+        cache.get(lat_in[1:], lon_in[1:], lat_out, lon_out, "bilinear", 25000, 10)
+        self.assertEqual(cache.stats['misses'], 4)
+        self.assertEqual(cache.stats['entries'], 4)
+
+    def test_size_limit(self):
+        cache = ResampleWeightCache(max_bytes=1)
+        lat_in, lon_in = _window()
+        lat_out, lon_out = _targets()
+
+        cache.get(lat_in, lon_in, lat_out, lon_out, "bilinear", 25000, 10)
+
+        self.assertEqual(cache.stats['entries'], 0)
+
+    def test_entry_size_limit(self):
+        lat_in, lon_in = _window()
+        lat_out, lon_out = _targets()
+
+        cache = ResampleWeightCache(max_entry_bytes=1)
+        cache.get(lat_in, lon_in, lat_out, lon_out, "bilinear", 25000, 10)
+        self.assertEqual(cache.stats['entries'], 0)
+        self.assertEqual(cache.stats['skipped'], 1)
+
+        cache = ResampleWeightCache()
+        cache.get(lat_in, lon_in, lat_out, lon_out, "bilinear", 25000, 10)
+        self.assertEqual(cache.stats['entries'], 1)
+        self.assertEqual(cache.stats['skipped'], 0)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from data.sqlite_connection_pool import SQLiteConnectionPool
+
+
+class TestSQLiteConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmpdir, "Historical.sqlite3")
+        shutil.copy('tests/testdata/databases/Historical.sqlite3', self.db)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_connection_is_reused(self):
+        pool = SQLiteConnectionPool()
+
+        conn = pool.acquire(self.db)
+        pool.release(self.db, conn)
+
+        self.assertIs(conn, pool.acquire(self.db))
+
+    def test_connections_are_leased_exclusively(self):
+        pool = SQLiteConnectionPool()
+
+        self.assertIsNot(pool.acquire(self.db), pool.acquire(self.db))
+
+    def test_connection_dropped_when_database_replaced(self):
+        pool = SQLiteConnectionPool()
+
+        conn = pool.acquire(self.db)
+        pool.release(self.db, conn)
+
+        replacement = os.path.join(self.tmpdir, "new.sqlite3")
+        shutil.copy(self.db, replacement)
+        os.replace(replacement, self.db)
+
+        self.assertIsNot(conn, pool.acquire(self.db))
+
+    def test_connection_is_read_only(self):
+        pool = SQLiteConnectionPool()
+
+        conn = pool.acquire(self.db)
+
+        with self.assertRaises(Exception):
+            conn.execute("DELETE FROM Variables;")
+
+    def test_release_ends_open_transaction(self):
+        pool = SQLiteConnectionPool()
+
+        conn = pool.acquire(self.db)
+        conn.execute("CREATE TEMP TABLE t (value);")
+        conn.execute("INSERT INTO temp.t VALUES (1);")
+        pool.release(self.db, conn)
+
+        self.assertFalse(conn.in_transaction)
+
+
+if __name__ == '__main__':
+    unittest.main()
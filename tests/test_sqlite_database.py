@@ -116,6 +116,19 @@ class TestSqliteDatabase(TestCase):
 
             self.assertTrue(expected_nc_files == nc_files)
 
+    def test_get_netcdf_files_handles_long_timestamp_lists(self):
+        expected_nc_files = [
+            "/home/nabil/test-mapper/ORCA025-CMC-TRIAL_1d_grid_V_2017122700.nc"]
+
+        # Long enough to go through the temp table path
+        timestamps = self.historical_timestamps * 100
+
+        with SQLiteDatabase(self.historical_db) as db:
+
+            nc_files = db.get_netcdf_files(timestamps, ["vo"])
+
+            self.assertEqual(expected_nc_files, nc_files)
+
     def test_erroneous_args_return_empty_lists(self):
 
         with SQLiteDatabase(self.historical_db) as db:
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from data.grid_index import GridIndex, GridIndexCache
+from data.tile_slice_index import TileSliceIndex
+
+TILE = ('EPSG:3857', 5, 10, 11)
+
+
+class TestTileSliceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "slices.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_put_get(self):
+        index = TileSliceIndex(self.path)
+        self.assertIsNone(index.get('grid', 10, TILE))
+
+        index.put('grid', 10, TILE, [(np.int64(3), np.int64(40)), (5, 50)],
+                  np.float32(0.25))
+        self.assertEqual(index.get('grid', 10, TILE), ([(3, 40), (5, 50)], 0.25))
+        self.assertIsNone(index.get('grid', 8, TILE))
+        self.assertIsNone(index.get('other', 10, TILE))
+        self.assertEqual(index.stats['hits'], 1)
+        self.assertEqual(index.stats['misses'], 3)
+
+    def test_persisted(self):
+        TileSliceIndex(self.path).put('grid', 10, TILE, [(3, 40)], 0.5)
+
+        index = TileSliceIndex(self.path)
+        self.assertEqual(index.get('grid', 10, TILE), ([(3, 40)], 0.5))
+
+    def test_metatiles(self):
+        index = TileSliceIndex(self.path)
+        index.put('grid', 10, TILE + (2, ), [(3, 80)], 0.5)
+
+        self.assertIsNone(index.get('grid', 10, TILE))
+        index.put('grid', 10, TILE, [(3, 40)], 0.25)
+        self.assertEqual(index.get('grid', 10, TILE + (1, )), ([(3, 40)], 0.25))
+        self.assertEqual(TileSliceIndex(self.path).get('grid', 10, TILE + (2, )),
+                         ([(3, 80)], 0.5))
+
+    def test_unwritable(self):
+        index = TileSliceIndex("/proc/tile_slices/slices.sqlite3")
+        index.put('grid', 10, TILE, [(3, 40)], 0.5)
+        self.assertEqual(index.get('grid', 10, TILE), ([(3, 40)], 0.5))
+
+
+class TestGridIndexTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.slices = TileSliceIndex(os.path.join(self.tmpdir.name, "slices.sqlite3"))
+        self.cache = GridIndexCache(cache_dir=self.tmpdir.name)
+
+        lon, lat = np.meshgrid(np.linspace(-70, -40, 60, dtype=np.float32),
+                               np.linspace(40, 60, 40, dtype=np.float32))
+        self.lat, self.lon = lat + 0.01 * lon, lon
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_window_reused(self):
+        qlon, qlat = np.meshgrid(np.linspace(-60, -55, 16), np.linspace(45, 48, 16))
+
+        with patch('data.grid_index.tile_slice_index', self.slices):
+            index = GridIndex(self.lat, self.lon, cache=self.cache)
+            expected = index.bounding_box(qlat, qlon, 10)
+            self.assertEqual(index.bounding_box(qlat, qlon, 10, tile=TILE), expected)
+
+            # Served from the index: no tree, no search
+            index = GridIndex(self.lat, self.lon, cache=GridIndexCache(
+                cache_dir=os.path.join(self.tmpdir.name, "empty")))
+            with patch.object(GridIndex, 'nearest', side_effect=AssertionError):
+                limits, dist = index.bounding_box(qlat, qlon, 10, tile=TILE)
+                self.assertEqual(limits, expected[0])
+                self.assertAlmostEqual(dist, expected[1])
+
+                # Padding is applied on lookup
+                limits, _ = index.bounding_box(qlat, qlon, 10, padding=1, tile=TILE)
+                self.assertNotEqual(limits, expected[0])
+
+        self.assertEqual(self.slices.stats['hits'], 2)
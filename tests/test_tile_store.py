@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+from utils.tile_store import TileStore, data_tile_key, data_tile_max_age
+
+
+class TestTileStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _store(self, **kwargs):
+        kwargs.setdefault('max_bytes', 1000)
+        kwargs.setdefault('quotas', {})
+        return TileStore(self.root, **kwargs)
+
+    def test_put_get(self):
+        store = self._store()
+        self.assertIsNone(store.get('data', 'a/1.png'))
+
+        path = store.put('data', 'a/1.png', b'tile')
+        self.assertEqual(path, os.path.join(self.root, 'data', 'a', '1.png'))
+        self.assertEqual(store.get('data', 'a/1.png'), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'tile')
+
+        self.assertIsNone(store.get('topo', 'a/1.png'))
+        stats = store.stats
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['writes'], 1)
+        self.assertEqual(stats['bytes'], 4)
+        self.assertEqual(stats['layers'], {'data': {'bytes': 4, 'entries': 1}})
+
+    def test_replace(self):
+        store = self._store()
+        store.put('data', '1.png', b'old tile')
+        path = store.put('data', '1.png', b'new')
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+        self.assertEqual(store.stats['bytes'], 3)
+        self.assertEqual(store.stats['entries'], 1)
+        # No temporary files are left behind
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['1.png'])
+
+    def test_failed_write(self):
+        store = self._store()
+        store.put('data', '1.png', b'old')
+
+        with patch('utils.tile_store.os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                store.put('data', '1.png', b'new')
+
+        path = store.get('data', '1.png')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'old')
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['1.png'])
+
+    def test_max_age(self):
+        store = self._store()
+        path = store.put('data', '1.png', b'tile')
+        os.utime(path, (0, 0))
+
+        self.assertEqual(store.get('data', '1.png'), path)
+        self.assertIsNone(store.get('data', '1.png', max_age=3600))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(store.stats['entries'], 0)
+
+    def test_lru_eviction(self):
+        store = self._store()
+        with patch('utils.tile_store.time.time') as now:
+            for i in range(4):
+                now.return_value = 1000 + 100 * i
+                store.put('data', '%d.png' % i, b'x' * 200)
+
+            # Tile 0 is accessed, so tile 1 is now the least recent
+            now.return_value = 2000
+            store.get('data', '0.png')
+
+            now.return_value = 2100
+            store.put('topo', '4.png', b'x' * 300)
+
+        self.assertIsNone(store.get('data', '1.png'))
+        for key in ('0.png', '2.png', '3.png'):
+            self.assertIsNotNone(store.get('data', key))
+        self.assertIsNotNone(store.get('topo', '4.png'))
+        self.assertFalse(os.path.exists(store.path('data', '1.png')))
+        self.assertEqual(store.stats['bytes'], 900)
+        self.assertEqual(store.stats['evictions'], 1)
+
+    def test_layer_quota(self):
+        store = self._store(quotas={'data': 500})
+        with patch('utils.tile_store.time.time') as now:
+            now.return_value = 1000
+            store.put('topo', 'a.png', b'x' * 300)
+            for i in range(3):
+                now.return_value = 1100 + 100 * i
+                store.put('data', '%d.png' % i, b'x' * 200)
+
+        # Only the layer over its quota loses tiles, even if older ones are
+        # in other layers
+        self.assertIsNotNone(store.get('topo', 'a.png'))
+        self.assertIsNone(store.get('data', '0.png'))
+        self.assertEqual(store.stats['layers']['data'],
+                         {'bytes': 400, 'entries': 2})
+        self.assertEqual(store.stats['evictions'], 1)
+
+    def test_shared_database(self):
+        self._store().put('data', '1.png', b'tile')
+
+        # e.g. another worker process
+        store = self._store()
+        self.assertIsNotNone(store.get('data', '1.png'))
+        self.assertEqual(store.stats['entries'], 1)
+
+    def test_data_tile_key(self):
+        key = data_tile_key('EPSG:3857', 'gaussian', 25, 10, 'giops_day',
+                            'votemper', 2031436800, None, '0', '-5,30', 0,
+                            'colour,default', 5, 10, 11)
+
+        self.assertEqual(key, 'gaussian/25/10/EPSG:3857/giops_day/votemper/'
+                              '2031436800/unindexed/0/-5,30/0/colour,default/'
+                              '5/10/11.png')
+
+    def test_data_tile_max_age(self):
+        self.assertIsNone(data_tile_max_age(None, 2031436800, None))
+        self.assertIsNone(data_tile_max_age(None, 2031436800, 'abc'))
+        self.assertEqual(data_tile_max_age(2, 2031436800, 'abc'), 7200)
+
+        # The latest timestamp of a dataset without an index
+        self.assertEqual(data_tile_max_age(None, -1, None), 3600)
+        self.assertEqual(data_tile_max_age(24, -1, None), 3600)
+
+        app = Flask(__name__)
+        app.config['TILE_UNINDEXED_MAX_AGE'] = 600
+        with app.app_context():
+            self.assertEqual(data_tile_max_age(None, -1, None), 600)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+from data.sqlite_database import SQLiteDatabase
+from data.timestamp_index import (TimeCoordinateIndex, TimestampIndex,
+                                  timestamp_index_cache)
+
+
+class TestTimestampIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TimestampIndex(np.array([30, 10, 20, 20, 40]))
+
+    def test_timestamps_are_sorted_and_unique(self):
+        self.assertEqual(self.index.tolist(), [10, 20, 30, 40])
+
+    def test_find_le(self):
+        self.assertEqual(self.index.find_le(25), 20)
+        self.assertEqual(self.index.find_le(30), 30)
+        self.assertEqual(self.index.find_le(5), 10)
+        self.assertEqual(self.index.find_le(100), 40)
+
+    def test_range_is_inclusive(self):
+        self.assertEqual(self.index.range(20, 40), [20, 30, 40])
+        self.assertEqual(self.index.range(21, 29), [])
+
+    def test_negative_indexing(self):
+        self.assertEqual(self.index[-1], 40)
+        self.assertEqual(self.index.latest(), 40)
+        self.assertEqual(self.index.earliest(), 10)
+
+    def test_empty_index(self):
+        index = TimestampIndex(np.array([]))
+
+        self.assertIsNone(index.latest())
+        self.assertEqual(index.range(0, 10), [])
+
+
+class TestTimeCoordinateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.values = np.array([2031436800, 2031523200, 2031350400, 2031609600])
+        self.index = TimeCoordinateIndex(self.values)
+
+    def test_exact_matches_isin(self):
+        for timestamp in (2031436800, [2031609600, 2031350400], [0, 2031523200]):
+            np.testing.assert_array_equal(
+                self.index.exact(timestamp),
+                np.nonzero(np.isin(self.values, timestamp))[0])
+
+    def test_exact_with_tolerance(self):
+        index = TimeCoordinateIndex(np.array([57209.0, 57209.04305556, 57209.08]))
+
+        np.testing.assert_array_equal(index.exact(57209.043, rtol=1.e-7), [1])
+        self.assertEqual(index.exact(57209.043).size, 0)
+
+    def test_nearest(self):
+        np.testing.assert_array_equal(
+            self.index.nearest([2031436900, 0, 2031609500]), [0, 2, 3])
+
+    def test_range(self):
+        np.testing.assert_array_equal(
+            self.index.range(2031436800, 2031523200), [0, 1])
+
+
+class TestTimestampIndexCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmpdir, "Historical.sqlite3")
+        shutil.copy('tests/testdata/databases/Historical.sqlite3', self.db)
+        timestamp_index_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_index_is_reused(self):
+        with SQLiteDatabase(self.db) as db:
+            first = db.get_timestamp_index("vo")
+        with SQLiteDatabase(self.db) as db:
+            second = db.get_timestamp_index("vo")
+
+        self.assertIs(first, second)
+
+    def test_index_refreshed_after_database_changes(self):
+        with SQLiteDatabase(self.db) as db:
+            latest = db.get_latest_timestamp("vo")
+
+        conn = sqlite3.connect(self.db)
+        conn.execute(
+            "INSERT INTO Timestamps (timestamp) VALUES (?);", (latest + 3600, ))
+        conn.execute(
+            """
+            INSERT INTO TimestampVariableFilepath
+            SELECT
+                1, v.id, t.id
+            FROM
+                Variables v, Timestamps t
+            WHERE
+                v.variable = 'vo' AND t.timestamp = ?;
+            """, (latest + 3600, ))
+        conn.commit()
+        conn.close()
+
+        with SQLiteDatabase(self.db) as db:
+            self.assertEqual(db.get_latest_timestamp("vo"), latest + 3600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from data.grid_index import GridIndexCache
+from data.triangle_index import TriangleIndexCache
+
+
+def _mesh(ny=30, nx=40):
+    """Splits each cell of a lat/lon grid into two triangles.
+
+    Returns the node lat/lon and the one-based connectivity, (3, elements),
+    as stored in FVCOM files.
+    """
+
+    lon, lat = np.meshgrid(np.linspace(-66, -60, nx), np.linspace(43, 47, ny))
+    node = np.arange(ny * nx).reshape(ny, nx)
+
+    a, b = node[:-1, :-1].ravel(), node[:-1, 1:].ravel()
+    c, d = node[1:, :-1].ravel(), node[1:, 1:].ravel()
+    triangles = np.concatenate([np.stack([a, b, d], axis=1),
+                                np.stack([a, d, c], axis=1)])
+
+    return lat.ravel(), lon.ravel(), triangles.transpose() + 1
+
+
+class TestTriangleIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = TriangleIndexCache(GridIndexCache(cache_dir=self.tmpdir.name))
+        self.lat, self.lon, self.nv = _mesh()
+        self.index = self.cache.get(self.lat, self.lon, lambda: self.nv)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_locate(self):
+        rng = np.random.RandomState(0)
+        lat = rng.uniform(43.1, 46.9, 500)
+        lon = rng.uniform(-65.9, -60.1, 500)
+
+        elements, weights = self.index.locate(lat, lon)
+
+        self.assertTrue(np.all(elements >= 0))
+        np.testing.assert_allclose(weights.sum(axis=1), 1)
+        self.assertTrue(np.all(weights >= 0))
+
+        # The weights reproduce the target from the nodes of its triangle
+        nodes = self.index.triangles[elements]
+        np.testing.assert_allclose(
+            np.sum(weights * self.lat[nodes], axis=1), lat, atol=1e-3)
+        np.testing.assert_allclose(
+            np.sum(weights * self.lon[nodes], axis=1), lon, atol=1e-3)
+
+    def test_outside(self):
+        elements, _ = self.index.locate([45, 10, 50], [-63, -63, -63])
+
+        self.assertEqual(elements[1], -1)
+        self.assertEqual(elements[2], -1)
+        self.assertGreaterEqual(elements[0], 0)
+
+    def test_interpolate_reads_triangle_nodes(self):
+        values = self.lat + 2 * self.lon
+        read = []
+
+        def reader(nodes):
+            read.append(nodes)
+            return np.stack([values[nodes], -values[nodes]])
+
+        lat, lon = np.array([44.5, 45.5, 0]), np.array([-62.5, -61.5, 0])
+        elements, weights = self.index.locate(lat, lon)
+        result = self.index.interpolate(reader, elements, weights)
+
+        self.assertEqual(result.shape, (2, 3))
+        np.testing.assert_allclose(result[0, :2], lat[:2] + 2 * lon[:2], atol=1e-2)
+        np.testing.assert_allclose(result[1, :2], -result[0, :2])
+        self.assertTrue(np.all(result.mask[:, 2]))
+
+        self.assertEqual(len(read), 1)
+        self.assertLessEqual(read[0].size, 6)
+        self.assertTrue(np.all(np.diff(read[0]) > 0))
+
+    def test_interpolate_masked_nodes(self):
+        elements, weights = self.index.locate([45.01], [-63.01])
+        masked = self.index.triangles[elements[0], 0]
+        values = np.ma.masked_array(np.ones(self.lat.shape) * 5)
+        values[masked] = np.ma.masked
+
+        result = self.index.interpolate(lambda i: values[i], elements, weights)
+
+        self.assertAlmostEqual(result[0], 5)
+
+    def test_interpolate_elements(self):
+        values = np.arange(self.nv.shape[1], dtype=np.float64)
+
+        elements, weights = self.index.locate([45, 10], [-63, -63])
+        result = self.index.interpolate(lambda i: values[i], elements,
+                                        weights, nodes=False)
+
+        self.assertEqual(result[0], elements[0])
+        self.assertIs(result[1], np.ma.masked)
+
+    def test_connectivity_cached_on_disk(self):
+        files = [f for f in os.listdir(self.tmpdir.name) if f.endswith('.tri.npy')]
+        self.assertEqual(len(files), 1)
+
+        other = TriangleIndexCache(GridIndexCache(cache_dir=self.tmpdir.name))
+
+        def fail():
+            raise AssertionError("connectivity should come from the cache")
+
+        index = other.get(self.lat, self.lon, fail)
+        np.testing.assert_array_equal(index.triangles, self.nv.transpose() - 1)
+        self.assertIs(self.cache.get(self.lat, self.lon, fail), self.index)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+import contextlib
+import os
+
+from utils.config import get_app_config
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # OpenMP code (e.g. KD-tree queries) then uses every CPU
+    threadpool_limits = None
+
+# Upper bound on the threads per request worked out from the CPU count.
+# Neighbour searches over a bounding box don't get faster past this.
+MAX_THREADS = 8
+
+
+class ComputeResources:
+    """
+    CPU budget of a request handled by this worker process.
+
+    The neighbour searches behind every resampling (pyresample's nprocs)
+    run on several threads. Each worker process of the server (uwsgi or
+    gunicorn) can be in one of those at any time, so the CPUs of the node
+    are divided between the workers. Otherwise every request would assume
+    it has the whole node to itself.
+
+    Both numbers can be set in oceannavigator.cfg:
+        * COMPUTE_THREADS -- threads per request (0: CPUs / workers)
+        * COMPUTE_WORKERS -- worker processes sharing the node (0: the
+                             uwsgi worker count, or WEB_CONCURRENCY for
+                             gunicorn, or 1)
+    """
+
+    def __init__(self, threads: int = None, workers: int = None):
+        self._threads: int = threads
+        self._workers: int = workers
+
+    @property
+    def cpus(self) -> int:
+        try:
+            # CPUs this process may run on, e.g. within a container
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+
+    @property
+    def workers(self) -> int:
+        if self._workers:
+            return self._workers
+
+        workers = get_app_config('COMPUTE_WORKERS')
+        if workers:
+            return int(workers)
+
+        try:
+            import uwsgi
+            return int(uwsgi.numproc)
+        except (ImportError, AttributeError):
+            pass
+
+        return int(os.environ.get('WEB_CONCURRENCY', 0)) or 1
+
+    @property
+    def threads(self) -> int:
+        """Threads a request may use, e.g. as pyresample's nprocs."""
+
+        if self._threads:
+            return self._threads
+
+        threads = get_app_config('COMPUTE_THREADS')
+        if threads:
+            return int(threads)
+
+        return int(max(1, min(self.cpus // self.workers, MAX_THREADS)))
+
+    @property
+    def openmp_threads(self) -> int:
+        """Threads OpenMP code run in openmp_limits may use (None if they
+        can't be limited).
+        """
+
+        return self.threads if threadpool_limits is not None else None
+
+    def openmp_limits(self):
+        """Context manager limiting OpenMP parallel regions started by the
+        calling thread (e.g. pykdtree's queries, see data.grid_index) to the
+        request's threads. pykdtree has no nprocs of its own and would
+        otherwise use every CPU of the node.
+        """
+
+        if threadpool_limits is None:
+            return contextlib.ExitStack()
+        return threadpool_limits(limits=self.threads, user_api='openmp')
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'cpus': self.cpus,
+            'workers': self.workers,
+            'threads': self.threads,
+            'openmp_threads': self.openmp_threads,
+        }
+
+
+# The budget of the requests handled by this worker process.
+compute_resources = ComputeResources()
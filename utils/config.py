@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+from flask import current_app, has_app_context
+
+
+def get_app_config(key: str, default=None):
+    """Reads a setting of the current Flask app (e.g. from
+    oceannavigator.cfg).
+
+    Arguments:
+        * key {str} -- Name of the setting.
+        * default -- Returned if it isn't set, or outside of an app context
+          (e.g. from scripts or unit tests).
+    """
+
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
@@ -15,6 +15,7 @@ from shapely.geometry.multipolygon import MultiPolygon
 from shapely.geometry.polygon import LinearRing
 
 from data import open_dataset
+from data.metadata_snapshot import get_snapshot
 from oceannavigator import DatasetConfig
 
 
@@ -520,8 +521,10 @@ def get_point_data(dataset, variable, time, depth, location):
     names = []
     units = []
     dsc = DatasetConfig(dataset)
+    snapshot = get_snapshot(dsc)
     with open_dataset(dsc) as ds:
-        timestamp = ds.timestamps[time]
+        dataset_variables = snapshot.variables if snapshot is not None \
+            else ds.variables
         for v in variables:
             d = ds.get_point(
                 location[0],
@@ -530,8 +533,8 @@ def get_point_data(dataset, variable, time, depth, location):
                 time,
                 v
             )
-            variable_name = dsc.variable[ds.variables[v]].name
-            variable_unit = dsc.variable[ds.variables[v]].unit
+            variable_name = dsc.variable[dataset_variables[v]].name
+            variable_unit = dsc.variable[dataset_variables[v]].unit
 
             data.append(d)
             names.append(variable_name)
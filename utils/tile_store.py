@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from cachetools import LRUCache
+
+from utils.config import get_app_config
+
+# Used when the store is accessed outside of a Flask app context (e.g. from
+# scripts or unit tests). Can be overridden in oceannavigator.cfg.
+DEFAULT_ROOT = "/tmp/oceannavigator/tiles"
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+DEFAULT_UNINDEXED_MAX_AGE = 3600
+
+# Eviction frees space down to this fraction of the budget (or quota), so
+# that it doesn't run again on the very next put.
+EVICT_TO = 0.9
+
+# Accesses within this many seconds of the recorded one aren't written back
+# (like relatime), so serving a popular tile doesn't take the database's
+# write lock every time.
+ATIME_RESOLUTION = 60
+
+DATABASE = "tile_store.sqlite3"
+
+
+class TileStore:
+    """
+    Bounded on-disk store of rendered tiles, shared by every worker process.
+
+    Tiles are files under <root>/<layer>/<key>, so they can be sent as they
+    are. They're written to a temporary file in the same directory and
+    renamed into place: readers in other workers see either the old tile or
+    the new one, never part of one.
+
+    A sqlite database in the root records the layer, size and last access of
+    every tile. When a put takes its layer over that layer's quota, or the
+    store over its budget, the least recently accessed tiles (of the layer,
+    or of the store) are deleted.
+
+    Settings (oceannavigator.cfg):
+        * TILE_CACHE_DIR -- root of the store
+        * TILE_CACHE_MAX_BYTES -- budget of the whole store
+        * TILE_CACHE_QUOTAS -- {layer: bytes}, e.g. {"data": 2 * 1024 ** 3}.
+                               Layers without a quota share the budget.
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = None,
+                 quotas: Dict[str, int] = None):
+        self._root: str = root
+        self._max_bytes: int = max_bytes
+        self._quotas: Dict[str, int] = quotas
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Last access written to the database, per tile
+        self._atimes: LRUCache = LRUCache(maxsize=65536)
+        self.hits: int = 0
+        self.misses: int = 0
+        self.writes: int = 0
+        self.evictions: int = 0
+
+    @property
+    def root(self) -> str:
+        if self._root is not None:
+            return self._root
+        return get_app_config('TILE_CACHE_DIR', DEFAULT_ROOT)
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return int(get_app_config('TILE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+    @property
+    def quotas(self) -> Dict[str, int]:
+        if self._quotas is not None:
+            return self._quotas
+        return get_app_config('TILE_CACHE_QUOTAS', None) or {}
+
+    def path(self, layer: str, key: str) -> str:
+        return os.path.join(self.root, layer, key)
+
+    def get(self, layer: str, key: str, max_age: float = None) -> str:
+        """Looks up a tile.
+
+        Arguments:
+            * layer {str} -- e.g. "data", "topo", "bath" or "mbt".
+            * key {str} -- Relative path of the tile within its layer.
+            * max_age {float} -- Seconds after which a tile is stale. Stale
+                tiles are removed.
+
+        Returns:
+            str -- Path of the tile, or None if it isn't stored.
+        """
+
+        path = self.path(layer, key)
+        now = time.time()
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+
+        if mtime is not None and max_age is not None and now - mtime > max_age:
+            self.remove(layer, key)
+            mtime = None
+
+        with self._lock:
+            if mtime is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            touch = now - self._atimes.get(path, 0) > ATIME_RESOLUTION
+            if touch:
+                self._atimes[path] = now
+
+        if touch:
+            try:
+                conn = self.__connection()
+                with conn:
+                    conn.execute("UPDATE tiles SET atime = ? WHERE path = ?;",
+                                 (now, path))
+            except sqlite3.Error:
+                pass
+
+        return path
+
+    def put(self, layer: str, key: str, data: bytes) -> str:
+        """Stores a tile, evicting others if needed.
+
+        Returns:
+            str -- Path of the tile.
+        """
+
+        path = self.path(layer, key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+        now = time.time()
+        with self._lock:
+            self.writes += 1
+            self._atimes[path] = now
+
+        try:
+            victims = self.__record(layer, path, len(data), now)
+        except sqlite3.Error:
+            # Locked for too long; the tile is kept but not accounted for.
+            victims = []
+
+        for victim in victims:
+            if victim != path:
+                _remove_file(victim)
+
+        with self._lock:
+            self.evictions += len(victims)
+
+        return path
+
+    def remove(self, layer: str, key: str) -> None:
+        path = self.path(layer, key)
+
+        try:
+            conn = self.__connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE;")
+                self.__delete(conn, [path])
+        except sqlite3.Error:
+            pass
+
+        _remove_file(path)
+
+    @property
+    def stats(self) -> dict:
+        layers = {}
+        try:
+            for layer, size, count in self.__connection().execute(
+                    "SELECT layer, bytes, entries FROM layers;"):
+                layers[layer] = {'bytes': size, 'entries': count}
+        except sqlite3.Error:
+            pass
+
+        with self._lock:
+            return {
+                'bytes': sum(l['bytes'] for l in layers.values()),
+                'entries': sum(l['entries'] for l in layers.values()),
+                'max_bytes': self.max_bytes,
+                'layers': layers,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions,
+            }
+
+    def __record(self, layer: str, path: str, size: int,
+                 atime: float) -> List[str]:
+        # Accounts for a new tile and picks the tiles to evict, in one
+        # transaction so concurrent workers don't evict the same space twice.
+        conn = self.__connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE;")
+            self.__delete(conn, [path])
+            conn.execute("INSERT INTO tiles VALUES (?, ?, ?, ?);",
+                         (path, layer, size, atime))
+            self.__account(conn, layer, size, 1)
+
+            victims = []
+            quota = self.quotas.get(layer)
+            if quota is not None:
+                victims += self.__victims(conn, quota, layer)
+                self.__delete(conn, victims)
+            budget = self.__victims(conn, self.max_bytes)
+            self.__delete(conn, budget)
+
+        return victims + budget
+
+    def __victims(self, conn: sqlite3.Connection, limit: int,
+                  layer: str = None) -> List[str]:
+        if layer is None:
+            total = conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM layers;").fetchone()[0]
+            rows = conn.execute("SELECT path, size FROM tiles ORDER BY atime;")
+        else:
+            row = conn.execute("SELECT bytes FROM layers WHERE layer = ?;",
+                               (layer, )).fetchone()
+            total = row[0] if row else 0
+            rows = conn.execute("SELECT path, size FROM tiles WHERE layer = ? "
+                                "ORDER BY atime;", (layer, ))
+
+        if total <= limit:
+            return []
+
+        victims = []
+        for path, size in rows:
+            if total <= limit * EVICT_TO:
+                break
+            victims.append(path)
+            total -= size
+        rows.close()
+
+        return victims
+
+    def __delete(self, conn: sqlite3.Connection, paths: List[str]) -> None:
+        for path in paths:
+            row = conn.execute("SELECT layer, size FROM tiles WHERE path = ?;",
+                               (path, )).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM tiles WHERE path = ?;", (path, ))
+                self.__account(conn, row[0], -row[1], -1)
+
+    @staticmethod
+    def __account(conn: sqlite3.Connection, layer: str, size: int,
+                  count: int) -> None:
+        conn.execute("INSERT OR IGNORE INTO layers VALUES (?, 0, 0);",
+                     (layer, ))
+        conn.execute("UPDATE layers SET bytes = bytes + ?, "
+                     "entries = entries + ? WHERE layer = ?;",
+                     (size, count, layer))
+
+    def __connection(self) -> sqlite3.Connection:
+        path = os.path.join(self.root, DATABASE)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.path == path:
+            return conn
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Transactions are begun explicitly (BEGIN IMMEDIATE)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tiles ("
+            "path TEXT PRIMARY KEY, layer TEXT, size INTEGER, atime REAL"
+            ");")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS tiles_atime ON tiles (atime);")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS tiles_layer_atime ON tiles "
+            "(layer, atime);")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS layers ("
+            "layer TEXT PRIMARY KEY, bytes INTEGER, entries INTEGER"
+            ");")
+
+        self._local.conn = conn
+        self._local.path = path
+
+        return conn
+
+
+def data_tile_key(projection: str, interp: str, radius: int, neighbours: int,
+                  dataset: str, variable: str, timestamp: int, signature: str,
+                  depth: str, scale: str, masked: int, display: str, zoom: int,
+                  x: int, y: int) -> str:
+    """Key of a data tile in the "data" layer, from the parameters of its
+    /api/v1.0/tiles URL.
+
+    It includes the resolved timestamp and the signature of the files the
+    tile was rendered from (see data.get_index_signature), so tiles of
+    re-indexed data are rendered again.
+    """
+
+    return os.path.join(
+        interp, str(radius), str(neighbours), projection, dataset, variable,
+        str(timestamp), signature or 'unindexed', str(depth), scale,
+        str(masked), display, str(zoom), str(x), '%d.png' % y)
+
+
+def data_tile_max_age(cache_hours: int, timestamp: int,
+                      signature: str) -> int:
+    """Age (in seconds) past which a stored data tile is rendered again,
+    or None if it's kept until evicted.
+
+    Arguments:
+        * cache_hours {int} -- The dataset's "cache" setting, if any.
+        * timestamp {int} -- As resolved by data.get_index_signature.
+        * signature {str} -- Ditto.
+
+    A negative timestamp (e.g. -1, the latest) of a dataset without an index
+    isn't resolved, so which one its tiles show changes as new data arrives
+    without their key changing. Those tiles are kept for at most
+    TILE_UNINDEXED_MAX_AGE seconds.
+    """
+
+    max_age = None if cache_hours is None else cache_hours * 3600
+
+    if signature is None and timestamp < 0:
+        unindexed = get_app_config('TILE_UNINDEXED_MAX_AGE',
+                                   DEFAULT_UNINDEXED_MAX_AGE)
+        max_age = unindexed if max_age is None else min(max_age, unindexed)
+
+    return max_age
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# The store shared by all requests handled by this worker process.
+tile_store = TileStore()